@@ -1,11 +1,92 @@
 from sqlmodel import SQLModel, Field, create_engine, Session
+from sqlalchemy import Index, event, inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
 from typing import Optional
 from datetime import datetime
 import os
+import random
+import time
+from .services.metrics import instrument_engine
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ciencia.db")
-engine = create_engine(DATABASE_URL, echo=True)
+# Async driver URL; derived from DATABASE_URL when not set
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() in ("1", "true", "yes")
+
+# Connection pool (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# SQLite tuning: WAL lets readers proceed while a writer commits, and the
+# busy timeout makes writers wait for the lock instead of failing at once
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _engine_options(url: str) -> dict:
+    if _is_sqlite(url):
+        # Sessions are used from the threadpool and background tasks
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+engine = create_engine(DATABASE_URL, echo=DATABASE_ECHO, **_engine_options(DATABASE_URL))
+if _is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+instrument_engine(engine)
+
+# Async driver used for each database, whatever driver DATABASE_URL names
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def _async_url(url: str) -> str:
+    if ASYNC_DATABASE_URL:
+        return ASYNC_DATABASE_URL
+    # e.g. postgresql+psycopg2://... -> postgresql+asyncpg://...
+    scheme, _, rest = url.partition(":")
+    backend = scheme.split("+", 1)[0]
+    if backend == "postgres":
+        backend = "postgresql"
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        return url
+    return f"{backend}+{driver}:{rest}"
+
+_async_engine = None
+
+def get_async_engine():
+    """
+    Async engine for `async def` routes, created on first use.
+
+    Needs the async driver for the configured database (aiosqlite for
+    SQLite, asyncpg for PostgreSQL).
+    """
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        url = _async_url(DATABASE_URL)
+        _async_engine = create_async_engine(url, echo=DATABASE_ECHO, **_engine_options(url))
+        if _is_sqlite(url):
+            event.listen(_async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        instrument_engine(_async_engine.sync_engine)
+    return _async_engine
 
 class Project(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -15,6 +96,9 @@ class Project(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Pipeline(SQLModel, table=True):
+    # Backs keyset pagination of a project's pipelines by last update
+    __table_args__ = (Index("ix_pipeline_project_updated", "project_id", "updated_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     project_id: int = Field(foreign_key="project.id")
     name: str
@@ -23,18 +107,167 @@ class Pipeline(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Statuses after which a run never changes again
+RUN_FINISHED_STATUSES = ("completed", "failed", "cancelled", "timed_out")
+
 class PipelineRun(SQLModel, table=True):
+    __table_args__ = (
+        # Backs run listings filtered by pipeline, status and start date
+        Index("ix_pipelinerun_pipeline_status_started", "pipeline_id", "status", "started_at"),
+        # At most one running run per pipeline (they share a workspace). The
+        # scheduler's conditional claim alone does not guarantee it under
+        # PostgreSQL's READ COMMITTED: two claims can both see no running run
+        Index(
+            "ux_pipelinerun_running_pipeline", "pipeline_id", unique=True,
+            sqlite_where=text("status = 'running'"),
+            postgresql_where=text("status = 'running'"),
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     pipeline_id: int = Field(foreign_key="pipeline.id")
-    status: str = Field(default="pending")  # pending, running, completed, failed
+    status: str = Field(default="pending", index=True)  # pending, running, completed, failed, cancelled, timed_out
     logs: Optional[str] = None
     output_dir: Optional[str] = None
+    params: Optional[str] = None  # JSON-encoded run parameters
+    cpus: int = Field(default=1)  # CPU slots reserved by the scheduler
+    memory_gb: int = Field(default=2)  # Memory slots (GB) reserved by the scheduler
+    exit_code: Optional[int] = None
+    timeout_seconds: Optional[int] = None  # Wall-clock limit (runner default if None)
+    cancel_requested_at: Optional[datetime] = None
+    worker_id: Optional[str] = None  # Scheduler/worker that claimed the run
+    lease_expires_at: Optional[datetime] = None  # Re-queued if not renewed by then
+    heartbeat_at: Optional[datetime] = None
+    script_hash: Optional[str] = None  # SHA-256 of the script that was run
+    session_id: Optional[str] = None  # Nextflow session ID, used by later -resume runs
+    resumed_from_run_id: Optional[int] = None  # Run whose session this one resumed
+    cached_tasks: int = Field(default=0)  # Tasks reused from Nextflow's cache
+    cached_seconds: float = Field(default=0.0)  # Task runtime saved by the cache
+    outputs_indexed_at: Optional[datetime] = None  # Last time RunOutputFile rows were built
+    work_evicted_at: Optional[datetime] = None  # When the janitor removed the run's work files
+    queued_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+class PipelineRunProgress(SQLModel, table=True):
+    """Task counters of a run, updated incrementally from the Nextflow trace."""
+    run_id: int = Field(foreign_key="pipelinerun.id", primary_key=True)
+    tasks_submitted: int = Field(default=0)
+    tasks_running: int = Field(default=0)
+    tasks_completed: int = Field(default=0)
+    tasks_failed: int = Field(default=0)
+    tasks_cached: int = Field(default=0)
+    cpu_seconds: float = Field(default=0.0)
+    cached_seconds: float = Field(default=0.0)  # Runtime of cached tasks (not re-run)
+    peak_rss_bytes: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class RunOutputFile(SQLModel, table=True):
+    """A file published by a run, indexed so results can be listed without walking the disk."""
+    __table_args__ = (Index("ix_runoutputfile_run_path", "run_id", "path", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    run_id: int = Field(foreign_key="pipelinerun.id")
+    path: str  # Relative to the run's results directory
+    size_bytes: int
+    sha256: str
+    media_type: str
+    modified_at: datetime
+
+class ChatSession(SQLModel, table=True):
+    """A conversation with the assistant, kept server-side so clients only send new messages."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    title: Optional[str] = None
+    summary: Optional[str] = None  # Condensed form of the turns folded out of the context
+    summarized_through_id: int = Field(default=0)  # Last ChatSessionMessage folded into the summary
+    message_count: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ChatSessionMessage(SQLModel, table=True):
+    __table_args__ = (Index("ix_chatsessionmessage_session_id", "session_id", "id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="chatsession.id")
+    role: str  # 'user' or 'assistant'
+    content: str
+    tokens: int = Field(default=0)  # Local estimate, see services/chat_sessions
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Dataset(SQLModel, table=True):
+    """An input file of a project. Its content lives in the shared blob store under `sha256`."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project_id: int = Field(foreign_key="project.id", index=True)
+    filename: str
+    size_bytes: int
+    chunk_size: int  # Every chunk but the last has exactly this size
+    status: str = Field(default="uploading")  # 'uploading', 'completing' or 'ready'
+    sha256: Optional[str] = Field(default=None, index=True)  # Set once the upload is complete
+    expected_sha256: Optional[str] = None  # Announced by the client, checked on completion
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    completed_at: Optional[datetime] = None
+
+class DatasetChunk(SQLModel, table=True):
+    """A chunk of an upload in progress, recorded once its checksum matched."""
+    dataset_id: int = Field(foreign_key="dataset.id", primary_key=True)
+    index: int = Field(primary_key=True)
+    size_bytes: int
+    sha256: str
+
+def _migrate_schema():
+    """
+    Add columns and indexes introduced after a table was first created.
+
+    `create_all` only creates missing tables, so existing databases would
+    otherwise keep the old schema. New columns must be nullable or have a
+    server-side default for this to work.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"
+                default = getattr(column.default, "arg", None)
+                if isinstance(default, bool):
+                    ddl += f" DEFAULT {str(default).upper()}"
+                elif isinstance(default, (int, float)):
+                    ddl += f" DEFAULT {default}"
+                elif isinstance(default, str):
+                    ddl += f" DEFAULT '{default}'"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+def create_db_and_tables(attempts: int = 3):
+    # Several uvicorn workers or run workers can start at once on a fresh
+    # database. The ones that lose the race to create a table or add a
+    # column retry, and then find the schema in place
+    for attempt in range(attempts):
+        try:
+            SQLModel.metadata.create_all(engine)
+            _migrate_schema()
+            return
+        except (OperationalError, ProgrammingError, IntegrityError):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0.1, 0.5))
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+async def get_async_session():
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+async def dispose_engines():
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    engine.dispose()
@@ -1,15 +1,24 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 class AlphaFoldPredictionRequest(BaseModel):
     uniprot_id: str
+    include_pdb: bool = True  # False: leave pdb_data out and download it from pdb_url
+
+class AlphaFoldBatchRequest(BaseModel):
+    uniprot_ids: List[str]
+    max_concurrency: Optional[int] = None
+    include_pdb: bool = True
 
 class AlphaFoldSearchRequest(BaseModel):
     gene_name: str
+    organism: Optional[str] = None  # NCBI taxon ID, scientific or common name
+    limit: int = 5
 
 class AlphaFoldPredictionResponse(BaseModel):
     success: bool
     pdb_data: Optional[str] = None
+    pdb_url: Optional[str] = None  # Compressed PDB file (GET)
     metadata: Optional[dict] = None
     uniprot_id: Optional[str] = None
     error: Optional[str] = None
@@ -23,4 +32,50 @@ class ProteinSearchResult(BaseModel):
 class AlphaFoldSearchResponse(BaseModel):
     success: bool
     results: Optional[List[ProteinSearchResult]] = None
+    source: Optional[str] = None  # 'index' (local UniProt index) or 'uniprot'
+    error: Optional[str] = None
+
+class ProteinSuggestion(BaseModel):
+    text: str
+    match: str  # 'gene', 'synonym', 'accession' or 'protein_name'
+    uniprot_id: str
+    gene_name: Optional[str] = None
+    protein_name: Optional[str] = None
+    organism: Optional[str] = None
+
+class ProteinAutocompleteResponse(BaseModel):
+    success: bool
+    suggestions: List[ProteinSuggestion] = []
     error: Optional[str] = None
+
+class UniProtIndexStats(BaseModel):
+    loaded: bool
+    entries: int
+    organisms: int = 0
+    last_modified: Optional[str] = None
+    loaded_at: Optional[str] = None
+    source: Optional[str] = None
+
+class StructureChain(BaseModel):
+    chain_id: str
+    residue_count: int
+    first_residue: Optional[int] = None
+    last_residue: Optional[int] = None
+    sequence: str
+    mean_plddt: Optional[float] = None
+
+class StructureSummary(BaseModel):
+    uniprot_id: str
+    model_version: str
+    atom_count: int
+    residue_count: int
+    mean_plddt: Optional[float] = None
+    plddt_bands: Dict[str, float]  # Share of residues per AlphaFold confidence band
+    chains: List[StructureChain]
+
+class PlddtTrack(BaseModel):
+    uniprot_id: str
+    model_version: str
+    chain_id: Optional[str] = None
+    residue_numbers: List[int]
+    plddt: List[float]
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime
 
 class ChatMessage(BaseModel):
     role: str  # 'user' or 'assistant'
@@ -8,10 +9,31 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     context: Optional[List[ChatMessage]] = []
+    session_id: Optional[int] = None  # Server-side session; `context` is ignored when set
 
 class ChatResponse(BaseModel):
     response: str
     success: bool
+    session_id: Optional[int] = None
+    context_tokens: Optional[int] = None  # Estimated tokens of history sent with the next turn
+
+class ChatSessionCreate(BaseModel):
+    title: Optional[str] = None
+
+class ChatSessionMessageResponse(BaseModel):
+    id: int
+    role: str
+    content: str
+    created_at: datetime
+
+class ChatSessionResponse(BaseModel):
+    id: int
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    message_count: int
+    created_at: datetime
+    updated_at: datetime
+    messages: List[ChatSessionMessageResponse] = []
 
 class PipelineGenerationRequest(BaseModel):
     description: str
@@ -25,8 +47,23 @@ class PipelineGenerationResponse(BaseModel):
 
 class ScriptValidationRequest(BaseModel):
     script: str
+    llm_review: bool = False  # Ask Gemini for suggestions after the local checks
+
+class ScriptIssue(BaseModel):
+    severity: str  # 'error' or 'warning'
+    code: str
+    message: str
+    line: Optional[int] = None
 
 class ScriptValidationResponse(BaseModel):
     is_valid: bool
     issues: List[str] = []
     suggestions: List[str] = []
+    diagnostics: List[ScriptIssue] = []
+
+class LLMCacheStats(BaseModel):
+    entries: int
+    hits: int
+    misses: int
+    hit_ratio: float
+    counters: dict = {}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 class ProjectCreate(BaseModel):
@@ -31,9 +31,22 @@ class PipelineResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+class PipelineListItem(BaseModel):
+    """Pipeline in a listing; `script` is omitted when not requested."""
+    id: int
+    project_id: int
+    name: str
+    script: Optional[str] = None
+    status: str
+    created_at: datetime
+    updated_at: datetime
+
 class PipelineExecuteRequest(BaseModel):
     pipeline_id: int
-    params: Optional[dict] = {}
+    params: Optional[dict] = {}  # "dataset:<id>" values are replaced by the dataset's path
+    cpus: Optional[int] = None  # CPU slots to reserve (scheduler default if omitted)
+    memory_gb: Optional[int] = None  # Memory slots in GB to reserve
+    timeout_seconds: Optional[int] = None  # Wall-clock limit (runner default if omitted)
 
 class PipelineExecuteResponse(BaseModel):
     run_id: int
@@ -46,5 +59,80 @@ class PipelineRunStatus(BaseModel):
     status: str
     logs: Optional[str]
     output_dir: Optional[str]
+    exit_code: Optional[int] = None
+    timeout_seconds: Optional[int] = None
+    cancel_requested_at: Optional[datetime] = None
+    worker_id: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+    script_hash: Optional[str] = None
+    session_id: Optional[str] = None
+    resumed_from_run_id: Optional[int] = None
+    cached_tasks: int = 0
+    cached_seconds: float = 0.0
+    outputs_indexed_at: Optional[datetime] = None
+    work_evicted_at: Optional[datetime] = None
+    queued_at: Optional[datetime] = None
     started_at: Optional[datetime]
     completed_at: Optional[datetime]
+
+class PipelineRunLogs(BaseModel):
+    run_id: int
+    offset: int
+    next_offset: int
+    lines: List[str]
+    complete: bool
+
+class PipelineRunProgressResponse(BaseModel):
+    run_id: int
+    status: str
+    tasks_submitted: int = 0
+    tasks_running: int = 0
+    tasks_completed: int = 0
+    tasks_failed: int = 0
+    tasks_cached: int = 0
+    cpu_seconds: float = 0.0
+    cached_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    updated_at: Optional[datetime] = None
+
+class RunOutputFileResponse(BaseModel):
+    path: str
+    size_bytes: int
+    sha256: str
+    media_type: str
+    modified_at: datetime
+
+class ProjectDiskUsage(BaseModel):
+    project_id: int
+    used_bytes: Optional[int] = None  # None until the janitor has scanned the disk
+    quota_bytes: Optional[int] = None  # None when quotas are disabled
+    over_quota: bool = False
+    measured_at: Optional[datetime] = None
+
+class DatasetCreate(BaseModel):
+    filename: str
+    size_bytes: int
+    sha256: Optional[str] = None  # Whole-file checksum, verified when the upload completes
+    chunk_size: Optional[int] = None  # Bytes per chunk (server default if omitted)
+
+class DatasetResponse(BaseModel):
+    id: int
+    project_id: int
+    filename: str
+    size_bytes: int
+    status: str  # 'uploading' or 'ready'
+    sha256: Optional[str] = None
+    chunk_size: int
+    chunk_count: int
+    received_chunks: List[int] = []  # While uploading: indexes already stored
+    deduplicated: bool = False  # Content was already in the store
+    reference: str  # Value to pass in PipelineExecuteRequest.params
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+class DatasetChunkResponse(BaseModel):
+    index: int
+    size_bytes: int
+    sha256: str
+    received_count: int
+    chunk_count: int
@@ -1,36 +1,229 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from ..models.alphafold import (
+    AlphaFoldBatchRequest,
     AlphaFoldPredictionRequest,
     AlphaFoldPredictionResponse,
     AlphaFoldSearchRequest,
-    AlphaFoldSearchResponse
+    AlphaFoldSearchResponse,
+    PlddtTrack,
+    ProteinAutocompleteResponse,
+    StructureSummary,
+    UniProtIndexStats
 )
 from ..services.alphafold_service import (
+    BATCH_MAX_IDS,
     get_alphafold_prediction,
+    get_alphafold_predictions_batch,
+    autocomplete_proteins,
     search_alphafold_by_gene
 )
+from ..services.compression import choose_encoding
+from ..services.structure_service import get_structure, get_structure_file
+from ..services.uniprot_index import uniprot_index
 
 router = APIRouter(
     prefix="/alphafold",
     tags=["AlphaFold"]
 )
 
+SEARCH_MAX_RESULTS = 50
+
+def _without_pdb(result: dict, include_pdb: bool) -> dict:
+    """Replace the inline PDB text by the URL of the compressed file."""
+    if include_pdb or not result.get("success"):
+        return result
+    result = dict(result, pdb_data=None)
+    result["pdb_url"] = f"{router.prefix}/structures/{result['uniprot_id']}/file"
+    return result
+
 @router.post("/prediction", response_model=AlphaFoldPredictionResponse)
 async def get_prediction(request: AlphaFoldPredictionRequest):
     """
     Get AlphaFold structure prediction for a given UniProt ID.
     
+    With `include_pdb=false` the PDB text is left out and `pdb_url`
+    points to the compressed file instead.
+    
     Example: Q5VSL9 (human MAP3K7)
     """
     result = await get_alphafold_prediction(request.uniprot_id)
-    return AlphaFoldPredictionResponse(**result)
+    return AlphaFoldPredictionResponse(**_without_pdb(result, request.include_pdb))
+
+@router.post("/predictions:batch")
+async def get_predictions_batch(request: AlphaFoldBatchRequest):
+    """
+    Get AlphaFold predictions for a list of UniProt IDs.
+    
+    Lookups run concurrently and results are streamed back as NDJSON, one
+    AlphaFoldPredictionResponse per line, in completion order. Errors are
+    reported per ID.
+    """
+    if len(request.uniprot_ids) > BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many IDs ({len(request.uniprot_ids)}); maximum is {BATCH_MAX_IDS}"
+        )
+    
+    async def ndjson_lines():
+        async for result in get_alphafold_predictions_batch(request.uniprot_ids, request.max_concurrency):
+            yield json.dumps(_without_pdb(result, request.include_pdb), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 @router.post("/search", response_model=AlphaFoldSearchResponse)
 async def search_by_gene(request: AlphaFoldSearchRequest):
     """
     Search for proteins by gene name.
     
+    Names are looked up in the local UniProt index, with the UniProt API
+    as fallback; `source` tells which one answered. `organism` takes an
+    NCBI taxon ID or a scientific or common name.
+    
     Example: TP53, BRCA1, EGFR
     """
-    result = await search_alphafold_by_gene(request.gene_name)
+    if not 1 <= request.limit <= SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_MAX_RESULTS}")
+    result = await search_alphafold_by_gene(request.gene_name, request.organism, request.limit)
     return AlphaFoldSearchResponse(**result)
+
+@router.get("/autocomplete", response_model=ProteinAutocompleteResponse)
+async def autocomplete(
+    q: str = Query(..., min_length=1, max_length=100),
+    organism: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=SEARCH_MAX_RESULTS),
+):
+    """
+    Suggest genes and proteins for a partially typed name.
+    
+    Gene names, synonyms and accessions starting with `q` come first, then
+    protein names with words starting with the words of `q`. Served from
+    the local UniProt index only.
+    """
+    result = await autocomplete_proteins(q, organism, limit)
+    return ProteinAutocompleteResponse(**result)
+
+@router.get("/index/stats", response_model=UniProtIndexStats)
+async def index_stats():
+    """
+    Size and freshness of the local UniProt index.
+    """
+    return UniProtIndexStats(**await asyncio.to_thread(uniprot_index.stats))
+
+async def _load_structure(uniprot_id: str) -> dict:
+    result = await get_structure(uniprot_id)
+    if not result["success"]:
+        raise HTTPException(status_code=404 if result.get("not_found") else 502, detail=result["error"])
+    return result
+
+def _select_residues(structure, chain: Optional[str], start: Optional[int], end: Optional[int]):
+    try:
+        return structure.residue_range(chain, start, end)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/structures/{uniprot_id}/summary", response_model=StructureSummary)
+async def get_structure_summary(uniprot_id: str):
+    """
+    Residue and atom counts, chains with their sequences and pLDDT
+    statistics of a predicted structure, without the coordinates.
+    """
+    result = await _load_structure(uniprot_id)
+    return StructureSummary(
+        uniprot_id=result["uniprot_id"],
+        model_version=result["model_version"],
+        **result["structure"].summary()
+    )
+
+@router.get("/structures/{uniprot_id}/plddt", response_model=PlddtTrack)
+async def get_structure_plddt(
+    uniprot_id: str,
+    chain: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None
+):
+    """
+    Per-residue pLDDT confidence, optionally for one chain and an inclusive
+    residue number range.
+    """
+    result = await _load_structure(uniprot_id)
+    structure = result["structure"]
+    first, last = _select_residues(structure, chain, start, end)
+    return PlddtTrack(
+        uniprot_id=result["uniprot_id"],
+        model_version=result["model_version"],
+        chain_id=chain,
+        **structure.plddt_track(first, last)
+    )
+
+@router.get("/structures/{uniprot_id}/pdb", response_class=PlainTextResponse)
+async def get_structure_pdb(
+    uniprot_id: str,
+    chain: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None
+):
+    """
+    PDB ATOM records of a chain and an inclusive residue number range
+    (the whole first model without filters).
+    """
+    result = await _load_structure(uniprot_id)
+    structure = result["structure"]
+    first, last = _select_residues(structure, chain, start, end)
+    return PlainTextResponse(structure.to_pdb(first, last), media_type="chemical/x-pdb")
+
+@router.get("/structures/{uniprot_id}/coordinates")
+async def get_structure_coordinates(
+    uniprot_id: str,
+    chain: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    atoms: str = Query("all", pattern="^(all|ca)$")
+):
+    """
+    Atom coordinates as raw little-endian float32 x, y, z triplets, in the
+    same atom order as the `/pdb` endpoint. `atoms=ca` returns only the
+    C-alpha trace. The atom count is in the X-Atom-Count header.
+    """
+    result = await _load_structure(uniprot_id)
+    structure = result["structure"]
+    first, last = _select_residues(structure, chain, start, end)
+    data, count = structure.coordinates(first, last, ca_only=atoms == "ca")
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={
+            "X-Atom-Count": str(count),
+            "X-Coordinate-Format": "float32-le-xyz",
+            "X-Model-Version": result["model_version"],
+        }
+    )
+
+@router.get("/structures/{uniprot_id}/file")
+async def get_structure_pdb_file(uniprot_id: str, request: Request):
+    """
+    The full PDB file as `application/octet-stream`, compressed with brotli
+    or gzip when the client accepts it. Files are compressed once and
+    served from the structure cache afterwards.
+    """
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    result = await get_structure_file(uniprot_id, encoding)
+    if not result["success"]:
+        raise HTTPException(status_code=404 if result.get("not_found") else 502, detail=result["error"])
+    etag = result["pdb_hash"] if encoding is None else f"{result['pdb_hash']}-{encoding}"
+    headers = {
+        "ETag": f'"{etag}"',
+        "Vary": "Accept-Encoding",
+        "X-Model-Version": result["model_version"],
+        "Content-Disposition": (
+            f'attachment; filename="AF-{result["uniprot_id"]}-F1-model_v{result["model_version"]}.pdb"'
+        ),
+    }
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=result["data"], media_type="application/octet-stream", headers=headers)
@@ -1,47 +1,189 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from ..models.chat import (
     ChatRequest, ChatResponse,
+    ChatSessionCreate, ChatSessionMessageResponse, ChatSessionResponse,
     PipelineGenerationRequest, PipelineGenerationResponse,
-    ScriptValidationRequest, ScriptValidationResponse
+    ScriptValidationRequest, ScriptValidationResponse, ScriptIssue,
+    LLMCacheStats
 )
 from ..services.llm_service import (
     chat_with_ai,
     generate_pipeline_from_description,
-    validate_nextflow_script
+    stream_chat_with_ai,
+    stream_pipeline_from_description,
+    validate_nextflow_script,
+    parse_validation_response
 )
+from ..services.chat_sessions import (
+    create_session,
+    get_session,
+    delete_session,
+    send_session_message,
+    stream_session_message
+)
+from ..services.nextflow_validator import analyze_nextflow_script
+from ..services.llm_cache import llm_cache
+from ..services.streaming import sse_event, SSE_HEADERS
 
 router = APIRouter(
     prefix="/chat",
     tags=["AI Chat"]
 )
 
+# How often a pending LLM call checks whether the client is still there
+DISCONNECT_POLL_SECONDS = 0.5
+
+async def _cancel_on_disconnect(raw_request: Request, coro):
+    """
+    Await an LLM call, cancelling it if the client disconnects first.
+    
+    Raises HTTPException(499) when the client went away.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await raw_request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _to_gemini_history(context) -> list:
+    """Convert context to Gemini format (assistant -> model)."""
+    context_history = []
+    for msg in context or []:
+        role = "model" if msg.role == "assistant" else msg.role
+        context_history.append({
+            "role": role,
+            "parts": [msg.content]
+        })
+    return context_history
+
+def _sse_token_stream(chunks, done_payload: dict) -> StreamingResponse:
+    """
+    Forward LLM text chunks as `token` events, then a `done` event.
+    
+    Failures are reported as an `error` event since the status code has
+    already been sent. When the client disconnects Starlette cancels the
+    generator, which closes the upstream Gemini stream.
+    """
+    async def events():
+        try:
+            async for text in chunks:
+                yield sse_event({"text": text}, event="token")
+            yield sse_event(done_payload, event="done")
+        except asyncio.TimeoutError:
+            yield sse_event({"success": False, "error": "Timeout"}, event="error")
+        except Exception as e:
+            yield sse_event({"success": False, "error": f"{type(e).__name__}: {str(e)}"}, event="error")
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.post("/message", response_model=ChatResponse)
-async def send_message(request: ChatRequest):
+async def send_message(request: ChatRequest, raw_request: Request):
     """
     Send a message to the AI assistant and get a response.
+    
+    With `session_id` the conversation history is kept on the server (see
+    POST /chat/sessions) and `context` is not needed.
     """
     try:
-        # Convert context to Gemini format (assistant -> model)
-        context_history = []
-        for msg in request.context:
-            role = "model" if msg.role == "assistant" else msg.role
-            context_history.append({
-                "role": role,
-                "parts": [msg.content]
-            })
+        if request.session_id is not None:
+            result = await _cancel_on_disconnect(
+                raw_request, send_session_message(request.session_id, request.message)
+            )
+            if not result["success"]:
+                if result.get("not_found"):
+                    raise HTTPException(status_code=404, detail=result["error"])
+                if result.get("conflict"):
+                    raise HTTPException(status_code=409, detail=result["error"])
+                raise HTTPException(status_code=502, detail=result["error"])
+            return ChatResponse(**result)
         
-        response = await chat_with_ai(request.message, context_history)
+        context_history = _to_gemini_history(request.context)
+        response = await _cancel_on_disconnect(
+            raw_request, chat_with_ai(request.message, context_history)
+        )
         return ChatResponse(response=response, success=True)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/message/stream")
+async def send_message_stream(request: ChatRequest):
+    """
+    Send a message to the AI assistant and stream the reply as server-sent events.
+    
+    Emits `token` events with `{"text": ...}` while Gemini generates, then a
+    final `done` (or `error`) event. With `session_id` the turn is added
+    to the session once the reply is complete.
+    """
+    if request.session_id is not None:
+        chunks = stream_session_message(request.session_id, request.message)
+        return _sse_token_stream(chunks, {"success": True, "session_id": request.session_id})
+    chunks = stream_chat_with_ai(request.message, _to_gemini_history(request.context))
+    return _sse_token_stream(chunks, {"success": True})
+
+def _session_response(chat, messages) -> ChatSessionResponse:
+    return ChatSessionResponse(
+        id=chat.id,
+        title=chat.title,
+        summary=chat.summary,
+        message_count=chat.message_count,
+        created_at=chat.created_at,
+        updated_at=chat.updated_at,
+        messages=[
+            ChatSessionMessageResponse(id=m.id, role=m.role, content=m.content, created_at=m.created_at)
+            for m in messages
+        ]
+    )
+
+@router.post("/sessions", response_model=ChatSessionResponse)
+async def create_chat_session(request: ChatSessionCreate):
+    """
+    Start a server-side chat session.
+    
+    Send messages with its `id` as `session_id`; older turns are summarized
+    so each request carries a bounded amount of history.
+    """
+    chat = await create_session(request.title)
+    return _session_response(chat, [])
+
+@router.get("/sessions/{session_id}", response_model=ChatSessionResponse)
+async def read_chat_session(session_id: int, limit: int = Query(50, ge=0, le=500)):
+    """
+    Get a chat session with its `limit` most recent messages, oldest first.
+    """
+    found = await get_session(session_id, limit)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return _session_response(*found)
+
+@router.delete("/sessions/{session_id}", status_code=204)
+async def delete_chat_session(session_id: int):
+    """
+    Delete a chat session and its messages.
+    """
+    if not await delete_session(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return Response(status_code=204)
+
 @router.post("/generate-pipeline", response_model=PipelineGenerationResponse)
-async def generate_pipeline(request: PipelineGenerationRequest):
+async def generate_pipeline(request: PipelineGenerationRequest, raw_request: Request):
     """
     Generate a Nextflow pipeline script from a natural language description.
     """
     try:
-        result = await generate_pipeline_from_description(request.description)
+        result = await _cancel_on_disconnect(
+            raw_request, generate_pipeline_from_description(request.description)
+        )
         
         if not result["success"]:
             raise HTTPException(status_code=500, detail=result["explanation"])
@@ -51,27 +193,66 @@ async def generate_pipeline(request: PipelineGenerationRequest):
             explanation=result["explanation"],
             success=result["success"]
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/generate-pipeline/stream")
+async def generate_pipeline_stream(request: PipelineGenerationRequest):
+    """
+    Generate a Nextflow pipeline script, streaming it as server-sent events.
+    
+    Emits `token` events with script chunks, then a final `done` (or
+    `error`) event.
+    """
+    chunks = stream_pipeline_from_description(request.description)
+    return _sse_token_stream(
+        chunks,
+        {"success": True, "explanation": "✅ Pipeline Nextflow gerado com sucesso!"}
+    )
+
 @router.post("/validate-script", response_model=ScriptValidationResponse)
-async def validate_script(request: ScriptValidationRequest):
+async def validate_script(request: ScriptValidationRequest, raw_request: Request):
     """
     Validate a Nextflow script for syntax and best practices.
+    
+    The script is checked by the local static analyzer; with
+    `llm_review=true` a structurally valid script is also reviewed by the
+    AI assistant for suggestions.
     """
     try:
-        result = await validate_nextflow_script(request.script)
+        analysis = analyze_nextflow_script(request.script)
+        diagnostics = [ScriptIssue(**issue) for issue in analysis["issues"]]
+        issues = [
+            f"line {d.line}: {d.message}" if d.line else d.message
+            for d in diagnostics
+        ]
+        suggestions = []
         
-        # Parse the validation response
-        # This is a simple parser - can be improved
-        validation_text = result["validation"]
-        
-        is_valid = "VALID: yes" in validation_text.lower()
+        if request.llm_review and analysis["is_valid"]:
+            result = await _cancel_on_disconnect(
+                raw_request, validate_nextflow_script(request.script)
+            )
+            if result["success"]:
+                review = parse_validation_response(result["validation"])
+                issues.extend(review["issues"])
+                suggestions = review["suggestions"]
         
         return ScriptValidationResponse(
-            is_valid=is_valid,
-            issues=[],
-            suggestions=[]
+            is_valid=analysis["is_valid"],
+            issues=issues,
+            suggestions=suggestions,
+            diagnostics=diagnostics
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache/stats", response_model=LLMCacheStats)
+async def cache_stats():
+    """
+    Hit/miss counters of the LLM response cache.
+    """
+    return LLMCacheStats(**await asyncio.to_thread(llm_cache.stats))
@@ -0,0 +1,118 @@
+from fastapi import APIRouter, HTTPException, Header, Request, Response
+from typing import List, Optional
+from ..database import Dataset
+from ..models.project import DatasetCreate, DatasetResponse, DatasetChunkResponse
+from ..services.datasets import (
+    create_dataset,
+    get_dataset,
+    list_datasets,
+    delete_dataset,
+    complete_dataset,
+    receive_chunk,
+    chunk_count
+)
+
+router = APIRouter(
+    prefix="/projects",
+    tags=["Datasets"]
+)
+
+def _dataset_response(dataset: Dataset, received_chunks: List[int] = (), deduplicated: bool = False) -> DatasetResponse:
+    return DatasetResponse(
+        id=dataset.id,
+        project_id=dataset.project_id,
+        filename=dataset.filename,
+        size_bytes=dataset.size_bytes,
+        status=dataset.status,
+        sha256=dataset.sha256,
+        chunk_size=dataset.chunk_size,
+        chunk_count=chunk_count(dataset),
+        received_chunks=list(received_chunks),
+        deduplicated=deduplicated,
+        reference=f"dataset:{dataset.id}",
+        created_at=dataset.created_at,
+        completed_at=dataset.completed_at
+    )
+
+def _raise_for(result: dict):
+    if result.get("not_found"):
+        raise HTTPException(status_code=404, detail=result["error"])
+    if result.get("conflict"):
+        raise HTTPException(status_code=409, detail=result["error"])
+    raise HTTPException(status_code=400, detail=result["error"])
+
+@router.post("/{project_id}/datasets", response_model=DatasetResponse)
+async def create_project_dataset(project_id: int, request: DatasetCreate):
+    """
+    Start a resumable upload of a dataset.
+
+    Send the file in `chunk_count` chunks of `chunk_size` bytes with
+    PUT .../chunks/{index}, in any order, then POST .../complete. When
+    `sha256` is given, the upload only completes if the file matches it.
+    """
+    result = await create_dataset(
+        project_id, request.filename, request.size_bytes, request.sha256, request.chunk_size
+    )
+    if not result["success"]:
+        _raise_for(result)
+    return _dataset_response(result["dataset"])
+
+@router.get("/{project_id}/datasets", response_model=List[DatasetResponse])
+async def read_project_datasets(project_id: int):
+    """List the datasets of a project."""
+    datasets = await list_datasets(project_id)
+    if datasets is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return [_dataset_response(dataset) for dataset in datasets]
+
+@router.get("/{project_id}/datasets/{dataset_id}", response_model=DatasetResponse)
+async def read_project_dataset(project_id: int, dataset_id: int):
+    """
+    Get a dataset. While it is uploading, `received_chunks` lists the
+    chunks already stored, so an interrupted upload resumes with the rest.
+    """
+    result = await get_dataset(project_id, dataset_id)
+    if not result["success"]:
+        _raise_for(result)
+    return _dataset_response(result["dataset"], result["received_chunks"])
+
+@router.put("/{project_id}/datasets/{dataset_id}/chunks/{index}", response_model=DatasetChunkResponse)
+async def upload_dataset_chunk(
+    project_id: int,
+    dataset_id: int,
+    index: int,
+    request: Request,
+    x_chunk_sha256: Optional[str] = Header(None)
+):
+    """
+    Upload chunk `index` as the raw request body.
+
+    The chunk is rejected unless its size matches and, when the
+    X-Chunk-SHA256 header is sent, its checksum too.
+    """
+    result = await receive_chunk(project_id, dataset_id, index, request.stream(), x_chunk_sha256)
+    if not result["success"]:
+        _raise_for(result)
+    return DatasetChunkResponse(**{key: value for key, value in result.items() if key != "success"})
+
+@router.post("/{project_id}/datasets/{dataset_id}/complete", response_model=DatasetResponse)
+async def complete_dataset_upload(project_id: int, dataset_id: int):
+    """
+    Finish an upload: check that every chunk arrived and the file's SHA-256,
+    then add it to the content-addressed store. Content that is already
+    stored is kept once.
+    """
+    result = await complete_dataset(project_id, dataset_id)
+    if not result["success"]:
+        _raise_for(result)
+    return _dataset_response(result["dataset"], deduplicated=result["deduplicated"])
+
+@router.delete("/{project_id}/datasets/{dataset_id}", status_code=204)
+async def delete_project_dataset(project_id: int, dataset_id: int):
+    """
+    Delete a dataset. Its content is removed from the store once no other
+    dataset refers to it.
+    """
+    if not await delete_dataset(project_id, dataset_id):
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return Response(status_code=204)
@@ -1,21 +1,70 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
-from ..database import get_session, Project, Pipeline, PipelineRun
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select, update, and_, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
+from ..database import (
+    engine, get_async_engine, get_session, get_async_session,
+    Project, Pipeline, PipelineRun, PipelineRunProgress, RunOutputFile,
+    RUN_FINISHED_STATUSES
+)
 from ..models.project import (
     ProjectCreate, ProjectResponse,
-    PipelineCreate, PipelineUpdate, PipelineResponse,
+    PipelineCreate, PipelineUpdate, PipelineResponse, PipelineListItem,
     PipelineExecuteRequest, PipelineExecuteResponse,
-    PipelineRunStatus
+    PipelineRunStatus, PipelineRunLogs, PipelineRunProgressResponse,
+    RunOutputFileResponse, ProjectDiskUsage
 )
-from ..services.runner import execute_nextflow_async
+from ..services.pagination import encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from ..services.nextflow_validator import analyze_nextflow_script
+from ..services.scheduler import scheduler, EXECUTION_BACKEND, DEFAULT_RUN_CPUS, DEFAULT_RUN_MEMORY_GB
+from ..services.run_logs import read_log_lines, follow_log, log_size, log_hub
+from ..services.streaming import sse_event, SSE_HEADERS, parse_byte_range, iter_file
+from ..services.workspace import workspace_janitor, output_file_path
+from ..services.supervisor import supervisor
+from ..services.progress import progress_tracker
+from ..services.admission import check_project_run
+from ..services.datasets import check_dataset_params
+from ..services.read_cache import read_cache, cached_response, version_from_timestamp
 from datetime import datetime
+import json
+import os
 
 router = APIRouter(
     prefix="/projects",
     tags=["Projects"]
 )
 
+# Columns returned by pipeline listings when the script is not requested
+PIPELINE_SUMMARY_COLUMNS = (
+    Pipeline.id, Pipeline.project_id, Pipeline.name, Pipeline.status,
+    Pipeline.created_at, Pipeline.updated_at
+)
+
+def _decode_cursor_or_400(cursor: str, size: int) -> list:
+    try:
+        values = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(values) != size:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    return values
+
+def _page_limit(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """
+    Rows to return: all of them when neither `limit` nor `cursor` is given
+    (listings predating pagination), otherwise `limit` or the default page
+    size.
+    """
+    if limit is None and cursor is None:
+        return None
+    return limit or DEFAULT_PAGE_SIZE
+
+def _set_next_cursor(response: Response, rows: list, limit: Optional[int], key):
+    """Expose the cursor of the next page in the X-Next-Cursor header."""
+    if limit is not None and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(key(rows[-1]))
+
 # ============= PROJECTS =============
 
 @router.post("/", response_model=ProjectResponse)
@@ -28,19 +77,34 @@ def create_project(project: ProjectCreate, session: Session = Depends(get_sessio
     return db_project
 
 @router.get("/", response_model=List[ProjectResponse])
-def list_projects(session: Session = Depends(get_session)):
-    """List all projects."""
-    projects = session.exec(select(Project)).all()
+def list_projects(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    session: Session = Depends(get_session)
+):
+    """
+    List projects, oldest first.
+    
+    Results are paginated by keyset when `limit` or `cursor` is given:
+    pass the `X-Next-Cursor` response header as `cursor` to get the next
+    page. Without either, every matching row is returned.
+    """
+    limit = _page_limit(limit, cursor)
+    statement = select(Project).order_by(Project.id).limit(limit)
+    if cursor:
+        (last_id,) = _decode_cursor_or_400(cursor, 1)
+        statement = statement.where(Project.id > last_id)
+    if created_after:
+        statement = statement.where(Project.created_at >= created_after)
+    if created_before:
+        statement = statement.where(Project.created_at < created_before)
+    projects = session.exec(statement).all()
+    _set_next_cursor(response, projects, limit, lambda p: [p.id])
     return projects
 
-@router.get("/{project_id}", response_model=ProjectResponse)
-def get_project(project_id: int, session: Session = Depends(get_session)):
-    """Get a specific project."""
-    project = session.get(Project, project_id)
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    return project
-
 # ============= PIPELINES =============
 
 @router.post("/pipelines", response_model=PipelineResponse)
@@ -55,24 +119,86 @@ def create_pipeline(pipeline: PipelineCreate, session: Session = Depends(get_ses
     session.add(db_pipeline)
     session.commit()
     session.refresh(db_pipeline)
+    read_cache.invalidate("pipeline", db_pipeline.id)
     return db_pipeline
 
-@router.get("/pipelines", response_model=List[PipelineResponse])
-def list_pipelines(project_id: int = None, session: Session = Depends(get_session)):
-    """List all pipelines, optionally filtered by project."""
-    statement = select(Pipeline)
+@router.get(
+    "/pipelines",
+    response_model=List[PipelineListItem],
+    response_model_exclude_unset=True
+)
+def list_pipelines(
+    response: Response,
+    project_id: int = None,
+    status: Optional[str] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    include_script: bool = True,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session)
+):
+    """
+    List pipelines, most recently updated first, optionally filtered by
+    project, status and update date.
+    
+    Use `include_script=false` to leave the script bodies out of the
+    listing. Results are paginated by keyset when `limit` or `cursor` is
+    given: pass the `X-Next-Cursor` response header as `cursor` to get the
+    next page. Without either, every matching row is returned.
+    """
+    limit = _page_limit(limit, cursor)
+    columns = (Pipeline,) if include_script else PIPELINE_SUMMARY_COLUMNS
+    statement = (
+        select(*columns)
+        .order_by(Pipeline.updated_at.desc(), Pipeline.id.desc())
+        .limit(limit)
+    )
     if project_id:
         statement = statement.where(Pipeline.project_id == project_id)
-    pipelines = session.exec(statement).all()
-    return pipelines
+    if status:
+        statement = statement.where(Pipeline.status == status)
+    if updated_after:
+        statement = statement.where(Pipeline.updated_at >= updated_after)
+    if updated_before:
+        statement = statement.where(Pipeline.updated_at < updated_before)
+    if cursor:
+        last_updated, last_id = _decode_cursor_or_400(cursor, 2)
+        statement = statement.where(or_(
+            Pipeline.updated_at < last_updated,
+            and_(Pipeline.updated_at == last_updated, Pipeline.id < last_id)
+        ))
+    
+    rows = session.exec(statement).all()
+    if not include_script:
+        rows = [dict(row._mapping) for row in rows]
+    _set_next_cursor(
+        response, rows, limit,
+        lambda p: [p["updated_at"], p["id"]] if isinstance(p, dict) else [p.updated_at, p.id]
+    )
+    return rows
+
+def _load_pipeline(pipeline_id: int):
+    with Session(engine) as session:
+        pipeline = session.get(Pipeline, pipeline_id)
+        if not pipeline:
+            return None
+        return (
+            PipelineResponse.model_validate(pipeline, from_attributes=True),
+            version_from_timestamp(pipeline.updated_at),
+            pipeline.updated_at
+        )
 
 @router.get("/pipelines/{pipeline_id}", response_model=PipelineResponse)
-def get_pipeline(pipeline_id: int, session: Session = Depends(get_session)):
-    """Get a specific pipeline."""
-    pipeline = session.get(Pipeline, pipeline_id)
-    if not pipeline:
+async def get_pipeline(pipeline_id: int, request: Request):
+    """
+    Get a specific pipeline. Supports If-None-Match / If-Modified-Since
+    (304 when unchanged).
+    """
+    resource = await read_cache.fetch("pipeline", pipeline_id, lambda: _load_pipeline(pipeline_id))
+    if resource is None:
         raise HTTPException(status_code=404, detail="Pipeline not found")
-    return pipeline
+    return cached_response(request.headers, resource)
 
 @router.put("/pipelines/{pipeline_id}", response_model=PipelineResponse)
 def update_pipeline(
@@ -93,48 +219,344 @@ def update_pipeline(
     session.add(pipeline)
     session.commit()
     session.refresh(pipeline)
+    read_cache.invalidate("pipeline", pipeline_id)
     return pipeline
 
 @router.post("/pipelines/{pipeline_id}/execute", response_model=PipelineExecuteResponse)
 async def execute_pipeline(
     pipeline_id: int,
     request: PipelineExecuteRequest,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    """Execute a pipeline."""
-    pipeline = session.get(Pipeline, pipeline_id)
+    """Queue a pipeline for execution."""
+    pipeline = await session.get(Pipeline, pipeline_id)
     if not pipeline:
         raise HTTPException(status_code=404, detail="Pipeline not found")
     
-    # Create a run record
+    # Never spawn a JVM for a script that cannot parse
+    analysis = analyze_nextflow_script(pipeline.script)
+    if not analysis["is_valid"]:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "message": "Pipeline script failed validation",
+                "issues": [issue for issue in analysis["issues"] if issue["severity"] == "error"]
+            }
+        )
+    
+    dataset_error = await check_dataset_params(request.params, pipeline.project_id)
+    if dataset_error:
+        raise HTTPException(status_code=422, detail=dataset_error)
+    
+    retry_after = check_project_run(pipeline.project_id)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many runs launched for this project",
+            headers={"Retry-After": retry_after}
+        )
+    
+    if workspace_janitor.over_quota(pipeline.project_id):
+        raise HTTPException(
+            status_code=507,
+            detail="Project disk quota exceeded by published run outputs"
+        )
+    
+    cpus = request.cpus or DEFAULT_RUN_CPUS
+    memory_gb = request.memory_gb or DEFAULT_RUN_MEMORY_GB
+    if EXECUTION_BACKEND == "worker":
+        # Runs execute on worker hosts, whose capacity this process does not know
+        fits = cpus > 0 and memory_gb > 0
+    else:
+        fits = scheduler.fits(cpus, memory_gb)
+    if not fits:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Requested resources ({cpus} CPUs, {memory_gb} GB) exceed runner capacity"
+        )
+    
+    # Create a run record; the scheduler picks it up from the queue
     run = PipelineRun(
         pipeline_id=pipeline_id,
         status="pending",
-        started_at=datetime.utcnow()
+        params=json.dumps(request.params or {}),
+        cpus=cpus,
+        memory_gb=memory_gb,
+        timeout_seconds=request.timeout_seconds,
+        queued_at=datetime.utcnow()
     )
     session.add(run)
-    session.commit()
-    session.refresh(run)
+    await session.commit()
+    await session.refresh(run)
+    read_cache.invalidate("run", run.id)
     
-    # Execute asynchronously
-    try:
-        result = await execute_nextflow_async(pipeline.script, run.id, request.params)
-        return PipelineExecuteResponse(
-            run_id=run.id,
-            status="running",
-            message=f"Pipeline execution started. Run ID: {run.id}"
-        )
-    except Exception as e:
-        run.status = "failed"
-        run.logs = str(e)
-        session.add(run)
-        session.commit()
-        raise HTTPException(status_code=500, detail=str(e))
+    scheduler.submit()
+    return PipelineExecuteResponse(
+        run_id=run.id,
+        status=run.status,
+        message=f"Pipeline execution queued. Run ID: {run.id}"
+    )
+
+@router.get("/runs", response_model=List[PipelineRunStatus])
+def list_runs(
+    response: Response,
+    pipeline_id: Optional[int] = None,
+    status: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session)
+):
+    """
+    List pipeline runs, newest first, optionally filtered by pipeline,
+    status and start date.
+    
+    Results are paginated by keyset when `limit` or `cursor` is given:
+    pass the `X-Next-Cursor` response header as `cursor` to get the next
+    page. Without either, every matching row is returned.
+    """
+    limit = _page_limit(limit, cursor)
+    statement = select(PipelineRun).order_by(PipelineRun.id.desc()).limit(limit)
+    if pipeline_id:
+        statement = statement.where(PipelineRun.pipeline_id == pipeline_id)
+    if status:
+        statement = statement.where(PipelineRun.status == status)
+    if started_after:
+        statement = statement.where(PipelineRun.started_at >= started_after)
+    if started_before:
+        statement = statement.where(PipelineRun.started_at < started_before)
+    if cursor:
+        (last_id,) = _decode_cursor_or_400(cursor, 1)
+        statement = statement.where(PipelineRun.id < last_id)
+    runs = session.exec(statement).all()
+    _set_next_cursor(response, runs, limit, lambda r: [r.id])
+    return runs
+
+def _load_run(run_id: int):
+    with Session(engine) as session:
+        run = session.get(PipelineRun, run_id)
+        if not run:
+            return None
+        # Runs have no version column: the ETag hashes the serialized run.
+        # No Last-Modified: a run can change several times within a second,
+        # and requeues reset its timestamps, so no whole-second date of it
+        # is a reliable validator
+        return PipelineRunStatus.model_validate(run, from_attributes=True), None, None
 
 @router.get("/runs/{run_id}", response_model=PipelineRunStatus)
-def get_run_status(run_id: int, session: Session = Depends(get_session)):
-    """Get the status of a pipeline run."""
-    run = session.get(PipelineRun, run_id)
+async def get_run_status(run_id: int, request: Request):
+    """
+    Get the status of a pipeline run. Supports If-None-Match (304 when
+    unchanged).
+    """
+    resource = await read_cache.fetch("run", run_id, lambda: _load_run(run_id))
+    if resource is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return cached_response(request.headers, resource)
+
+async def _run_is_finished(run_id: int) -> bool:
+    async with AsyncSession(get_async_engine()) as session:
+        run = await session.get(PipelineRun, run_id)
+        return run is None or run.status in RUN_FINISHED_STATUSES
+
+@router.post("/runs/{run_id}/cancel", response_model=PipelineRunStatus)
+async def cancel_run(run_id: int, session: AsyncSession = Depends(get_async_session)):
+    """
+    Cancel a pipeline run.
+
+    A queued run is cancelled at once. A running run has its Nextflow
+    process group terminated (SIGTERM, then SIGKILL after the grace
+    period); the returned status is `running` until it has exited. Runs
+    executing in a worker process are stopped at its next heartbeat.
+    """
+    now = datetime.utcnow()
+    # Conditional update so a run claimed by the scheduler meanwhile is not
+    # marked cancelled while it starts
+    result = await session.execute(
+        update(PipelineRun)
+        .where(PipelineRun.id == run_id, PipelineRun.status == "pending")
+        .values(status="cancelled", cancel_requested_at=now, completed_at=now)
+    )
+    await session.commit()
+    run = await session.get(PipelineRun, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
+    if result.rowcount:
+        read_cache.invalidate("run", run_id)
+        await session.refresh(run)
+        return run
+    if run.status in RUN_FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Run already finished with status '{run.status}'")
+    
+    run.cancel_requested_at = now
+    session.add(run)
+    await session.commit()
+    read_cache.invalidate("run", run_id)
+    await session.refresh(run)
+    # Do not keep the request open for the whole grace period
+    if supervisor.is_running(run_id):
+        supervisor.cancel_soon(run_id)
     return run
+
+@router.get("/runs/{run_id}/logs", response_model=PipelineRunLogs)
+async def stream_run_logs(
+    run_id: int,
+    offset: int = 0,
+    follow: bool = True,
+    last_event_id: Optional[str] = Header(default=None),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Stream the log of a pipeline run.
+
+    With `follow=true` (default) lines are sent as server-sent events while
+    the run produces them; each event id is the byte offset to resume from,
+    so reconnecting clients continue where they stopped (`Last-Event-ID`
+    or `offset`). With `follow=false` a single chunk is returned as JSON.
+    """
+    run = await session.get(PipelineRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+    offset = max(offset, 0)
+    
+    if not follow:
+        finished = run.status in RUN_FINISHED_STATUSES and not log_hub.is_open(run_id)
+        lines, next_offset = read_log_lines(run_id, offset, include_partial=finished)
+        return PipelineRunLogs(
+            run_id=run_id,
+            offset=offset,
+            next_offset=next_offset,
+            lines=[line for _, line in lines],
+            complete=finished and next_offset >= log_size(run_id)
+        )
+    
+    async def event_stream():
+        # Starlette cancels this generator when the client disconnects
+        async for next_offset, line in follow_log(run_id, offset, lambda: _run_is_finished(run_id)):
+            yield sse_event(line, event_id=str(next_offset))
+        yield sse_event({"run_id": run_id}, event="end")
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/runs/{run_id}/progress", response_model=PipelineRunProgressResponse)
+async def get_run_progress(run_id: int, session: AsyncSession = Depends(get_async_session)):
+    """
+    Get task progress of a pipeline run (submitted, running, completed,
+    failed and cached tasks, CPU time and peak memory).
+    """
+    run = await session.get(PipelineRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    progress = await session.get(PipelineRunProgress, run_id)
+    if not progress:
+        return PipelineRunProgressResponse(run_id=run_id, status=run.status)
+    return PipelineRunProgressResponse(status=run.status, **progress.dict())
+
+@router.get("/runs/{run_id}/outputs", response_model=List[RunOutputFileResponse])
+def list_run_outputs(run_id: int, session: Session = Depends(get_session)):
+    """
+    List the files a run published, from the output index.
+
+    The index is built when the run finishes; it is empty while the run is
+    still queued or running.
+    """
+    if not session.get(PipelineRun, run_id):
+        raise HTTPException(status_code=404, detail="Run not found")
+    return session.exec(
+        select(RunOutputFile).where(RunOutputFile.run_id == run_id).order_by(RunOutputFile.path)
+    ).all()
+
+@router.get("/runs/{run_id}/outputs/{path:path}")
+def download_run_output(
+    run_id: int,
+    path: str,
+    range_header: Optional[str] = Header(default=None, alias="Range"),
+    session: Session = Depends(get_session)
+):
+    """
+    Download a published output file. Supports single `Range: bytes=`
+    requests (206 Partial Content) for resumable and partial downloads.
+    """
+    run = session.get(PipelineRun, run_id)
+    output = session.exec(
+        select(RunOutputFile).where(RunOutputFile.run_id == run_id, RunOutputFile.path == path)
+    ).first() if run else None
+    if not output:
+        raise HTTPException(status_code=404, detail="Output file not found")
+    
+    file_path = output_file_path(run, output)
+    if file_path is None or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Output file no longer exists")
+    size = os.path.getsize(file_path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{output.sha256}"',
+        "Content-Disposition": f'attachment; filename="{os.path.basename(output.path)}"',
+    }
+    try:
+        byte_range = parse_byte_range(range_header, size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(file_path, start, end),
+        status_code=status_code,
+        media_type=output.media_type,
+        headers=headers
+    )
+
+@router.post("/runs/{run_id}/weblog", include_in_schema=False)
+async def receive_weblog_event(run_id: int, payload: dict):
+    """Receiver for Nextflow `-with-weblog` task events."""
+    progress_tracker.record_weblog_event(run_id, payload)
+    return {"received": True}
+
+# Declared last so that /projects/pipelines and /projects/runs are not
+# captured by the /{project_id} path parameter
+def _load_project(project_id: int):
+    with Session(engine) as session:
+        project = session.get(Project, project_id)
+        if not project:
+            return None
+        return (
+            ProjectResponse.model_validate(project, from_attributes=True),
+            version_from_timestamp(project.updated_at),
+            project.updated_at
+        )
+
+@router.get("/{project_id}", response_model=ProjectResponse)
+async def get_project(project_id: int, request: Request):
+    """
+    Get a specific project. Supports If-None-Match / If-Modified-Since
+    (304 when unchanged).
+    """
+    resource = await read_cache.fetch("project", project_id, lambda: _load_project(project_id))
+    if resource is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return cached_response(request.headers, resource)
+
+@router.get("/{project_id}/usage", response_model=ProjectDiskUsage)
+def get_project_usage(project_id: int, session: Session = Depends(get_session)):
+    """Get the disk usage of a project as measured by the last janitor pass."""
+    if not session.get(Project, project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    quota = workspace_janitor.quota_bytes
+    return ProjectDiskUsage(
+        project_id=project_id,
+        used_bytes=workspace_janitor.usage.get(project_id, 0) if workspace_janitor.last_run_at else None,
+        quota_bytes=quota if quota > 0 else None,
+        over_quota=workspace_janitor.over_quota(project_id),
+        measured_at=workspace_janitor.last_run_at
+    )
@@ -0,0 +1,309 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Deque, Dict, List, Optional, Tuple
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from .metrics import ADMISSION_QUEUE_WAIT, ADMISSION_REJECTIONS, Gauge, registry
+from .rate_limit import TokenBucket
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+# Longest time a request waits in a pool's queue before it is turned away
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+# Clients tracked by the per-client buckets; the least recently seen are
+# forgotten (and start again with a full bucket) beyond this
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+# Identify clients by the first X-Forwarded-For address (only behind a
+# proxy that sets it) instead of the peer address
+ADMISSION_TRUST_FORWARDED_FOR = os.getenv("ADMISSION_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+# Run launches allowed per project; 0 disables the limit
+PROJECT_RUN_RATE_PER_MINUTE = float(os.getenv("ADMISSION_PROJECT_RUNS_PER_MINUTE", "10"))
+PROJECT_RUN_BURST = int(os.getenv("ADMISSION_PROJECT_RUN_BURST", "5"))
+
+
+def _pool_settings(name: str, concurrency: int, queue: int) -> Tuple[int, int]:
+    prefix = f"ADMISSION_{name.upper()}"
+    return (
+        int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+        int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+    )
+
+
+# Pool name -> (requests served at once, requests allowed to wait)
+POOL_SETTINGS = {
+    "llm": _pool_settings("llm", 16, 16),
+    "upstream": _pool_settings("upstream", 64, 128),
+    "runs": _pool_settings("runs", 4, 8),
+    # Dataset chunk uploads hold their slot while the body streams in
+    "uploads": _pool_settings("uploads", 8, 16),
+    "crud": _pool_settings("crud", 64, 256),
+}
+
+
+@dataclass
+class RoutePolicy:
+    """Pool and per-client request rate of the routes matching `method` and `route`."""
+    method: str
+    route: str  # Path template, fnmatch wildcards allowed
+    pool: Optional[str] = None
+    rate_per_minute: float = 0  # Per client; 0 disables the bucket
+    burst: int = 0
+
+
+# First match wins. ADMISSION_ROUTES (a JSON list of RoutePolicy fields)
+# is checked before these.
+DEFAULT_POLICIES = (
+    RoutePolicy("POST", "/chat/generate-pipeline*", "llm", rate_per_minute=10, burst=5),
+    RoutePolicy("POST", "/chat/message*", "llm", rate_per_minute=60, burst=20),
+    RoutePolicy("POST", "/chat/validate-script", "llm", rate_per_minute=60, burst=20),
+    RoutePolicy("*", "/chat/*", "crud"),
+    RoutePolicy("POST", "/projects/pipelines/*/execute", "runs", rate_per_minute=20, burst=5),
+    RoutePolicy("POST", "/pipelines/run", "runs", rate_per_minute=20, burst=5),
+    RoutePolicy("*", "/alphafold/autocomplete", "crud"),
+    RoutePolicy("*", "/alphafold/index/*", "crud"),
+    RoutePolicy("*", "/alphafold/*", "upstream", rate_per_minute=600, burst=100),
+    RoutePolicy("PUT", "/projects/*/datasets/*/chunks/*", "uploads"),
+    # Not admitted: log streams and downloads would hold a CRUD slot for
+    # as long as the client reads, and Nextflow's weblog events must not
+    # be dropped with a 429
+    RoutePolicy("GET", "/projects/runs/*/logs", None),
+    RoutePolicy("GET", "/projects/runs/*/outputs/*", None),
+    RoutePolicy("POST", "/projects/runs/*/weblog", None),
+    RoutePolicy("*", "/projects*", "crud"),
+)
+
+
+def _load_policies() -> List[RoutePolicy]:
+    configured = os.getenv("ADMISSION_ROUTES")
+    policies = [RoutePolicy(**entry) for entry in json.loads(configured)] if configured else []
+    for policy in policies:
+        if policy.pool is not None and policy.pool not in POOL_SETTINGS:
+            raise ValueError(f"ADMISSION_ROUTES: unknown pool '{policy.pool}' (available: {', '.join(POOL_SETTINGS)})")
+    return policies + list(DEFAULT_POLICIES)
+
+
+class ConcurrencyPool:
+    """
+    Bounded number of requests in progress, with a bounded FIFO queue.
+
+    `acquire` fails at once when the queue is full and after `timeout`
+    seconds of waiting; slots freed by `release` go to the oldest waiter.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.in_use = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float) -> Optional[str]:
+        """None once a slot is held, otherwise why the request is rejected."""
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return None
+        if len(self._waiters) >= self.queue_size or timeout <= 0:
+            return "pool_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as the wait timed out
+                return None
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as the client went away
+                self.release()
+            raise
+        finally:
+            ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - start, pool=self.name)
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, held_seconds: Optional[float] = None):
+        if held_seconds is not None:
+            self._hold_seconds += 0.2 * (held_seconds - self._hold_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter; in_use is unchanged
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+    def retry_after(self) -> float:
+        """Rough time until a new request would be admitted."""
+        return self._hold_seconds * (self.waiting + 1) / max(1, self.limit)
+
+
+class _Buckets:
+    """Token buckets by key, forgetting the least recently used beyond `max_keys`."""
+
+    def __init__(self, max_keys: int = ADMISSION_MAX_CLIENTS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+
+    def try_acquire(self, key: tuple, rate_per_minute: float, burst: int) -> Optional[float]:
+        """None when admitted, otherwise the seconds until a token is available."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate_per_minute / 60, max(1, burst))
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        if bucket.try_acquire():
+            return None
+        return bucket.retry_after()
+
+
+pools: Dict[str, ConcurrencyPool] = {
+    name: ConcurrencyPool(name, limit, queue) for name, (limit, queue) in POOL_SETTINGS.items()
+}
+_client_buckets = _Buckets()
+_project_buckets = _Buckets()
+
+registry.register(Gauge(
+    "admission_pool_in_use", "Requests holding a slot of each admission pool", ("pool",),
+    function=lambda: {(name,): pool.in_use for name, pool in pools.items()}
+))
+registry.register(Gauge(
+    "admission_pool_waiting", "Requests queued for a slot of each admission pool", ("pool",),
+    function=lambda: {(name,): pool.waiting for name, pool in pools.items()}
+))
+registry.register(Gauge(
+    "admission_pool_saturation", "Share of each admission pool's slots in use", ("pool",),
+    function=lambda: {(name,): pool.in_use / pool.limit for name, pool in pools.items() if pool.limit}
+))
+
+
+# Longest Retry-After sent (a bucket that never refills reports infinity)
+MAX_RETRY_AFTER_SECONDS = 3600
+
+
+def _retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(min(seconds, MAX_RETRY_AFTER_SECONDS))))
+
+
+def check_project_run(project_id: int) -> Optional[str]:
+    """
+    Take a run launch from the project's bucket.
+
+    Returns None when allowed, otherwise the Retry-After value (seconds).
+    """
+    if not ADMISSION_CONTROL or PROJECT_RUN_RATE_PER_MINUTE <= 0:
+        return None
+    wait = _project_buckets.try_acquire(("runs", project_id), PROJECT_RUN_RATE_PER_MINUTE, PROJECT_RUN_BURST)
+    if wait is None:
+        return None
+    ADMISSION_REJECTIONS.inc(pool="runs", reason="project_rate_limit")
+    return _retry_after_header(wait)
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware admitting requests by route before they reach the app.
+
+    Each route is mapped to a RoutePolicy by its path template. A policy
+    can limit the request rate of each client with a token bucket and
+    make the request hold a slot of a concurrency pool (LLM, upstream,
+    run launches, dataset uploads or CRUD) until its response is
+    complete, so a flood of expensive calls cannot take the capacity
+    cheap reads rely on.
+
+    Requests over a limit get 429 with Retry-After at once, or after at
+    most ADMISSION_QUEUE_TIMEOUT_SECONDS in a pool's queue.
+    """
+
+    def __init__(self, app, policies: Optional[List[RoutePolicy]] = None, enabled: bool = ADMISSION_CONTROL):
+        self.app = app
+        self.policies = policies if policies is not None else _load_policies()
+        self.enabled = enabled
+        self._route_policies: Dict[Tuple[str, str], Optional[Tuple[int, RoutePolicy]]] = {}
+
+    def _policy(self, scope) -> Optional[Tuple[int, RoutePolicy]]:
+        app = scope.get("app")
+        router = getattr(app, "router", None)
+        for route in getattr(router, "routes", ()):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                # Lets the metrics middleware label rejected requests by route
+                scope["route"] = child_scope.get("route", route)
+                key = (scope["method"], route.path)
+                if key not in self._route_policies:
+                    self._route_policies[key] = next(
+                        (
+                            (i, policy) for i, policy in enumerate(self.policies)
+                            if policy.method in ("*", scope["method"]) and fnmatchcase(route.path, policy.route)
+                        ),
+                        None
+                    )
+                return self._route_policies[key]
+        return None
+
+    def _client(self, scope) -> str:
+        if ADMISSION_TRUST_FORWARDED_FOR:
+            forwarded = Headers(scope=scope).get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        matched = self._policy(scope)
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+        index, policy = matched
+
+        if policy.rate_per_minute > 0:
+            wait = _client_buckets.try_acquire((index, self._client(scope)), policy.rate_per_minute, policy.burst)
+            if wait is not None:
+                ADMISSION_REJECTIONS.inc(pool=policy.pool or "none", reason="rate_limit")
+                await self._reject(scope, receive, send, "Too many requests", wait)
+                return
+
+        pool = pools.get(policy.pool) if policy.pool else None
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+        reason = await pool.acquire(ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        if reason is not None:
+            ADMISSION_REJECTIONS.inc(pool=pool.name, reason=reason)
+            await self._reject(scope, receive, send, f"Server busy ({pool.name})", pool.retry_after())
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(time.perf_counter() - start)
+
+    async def _reject(self, scope, receive, send, detail: str, retry_after: float):
+        response = JSONResponse(
+            {"detail": detail}, status_code=429, headers={"Retry-After": _retry_after_header(retry_after)}
+        )
+        await response(scope, receive, send)
@@ -1,50 +1,145 @@
+import asyncio
+import json
+import os
+import sqlite3
 import httpx
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from .http_client import get_http_client
+from .rate_limit import host_rate_limiter
+from .structure_cache import structure_cache
+from .uniprot_index import uniprot_index
+from .metrics import track_upstream, CACHE_REQUESTS
 
-ALPHAFOLD_DB_URL = "https://alphafold.ebi.ac.uk/api"
+# Upstream APIs (overridable, e.g. to point at local stand-ins in benchmarks)
+ALPHAFOLD_DB_URL = os.getenv("ALPHAFOLD_DB_URL", "https://alphafold.ebi.ac.uk/api")
+UNIPROT_REST_URL = os.getenv("UNIPROT_REST_URL", "https://rest.uniprot.org")
+
+# Batch lookups: default / maximum number of IDs fetched at the same time
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("ALPHAFOLD_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("ALPHAFOLD_BATCH_MAX_CONCURRENCY", "32"))
+BATCH_MAX_IDS = int(os.getenv("ALPHAFOLD_BATCH_MAX_IDS", "500"))
+
+# Ask the UniProt API when the local index has no match (it is always asked
+# while no index has been loaded)
+UNIPROT_REMOTE_FALLBACK = os.getenv("UNIPROT_REMOTE_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+# Lookups currently hitting upstream, keyed by UniProt ID (single-flight)
+_inflight: Dict[str, asyncio.Task] = {}
+
+async def _single_flight(key: str, factory: Callable[[], Awaitable[dict]]) -> dict:
+    """Run `factory` once per key; concurrent callers await the same task."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key) is t else None)
+    # Shield so one caller going away does not cancel the fetch for the others
+    return await asyncio.shield(task)
+
+def _prediction_entry(metadata):
+    """AlphaFold DB answers with a list of entries; the first is the model served."""
+    return metadata[0] if isinstance(metadata, list) else metadata
+
+def _cached_result(uniprot_id: str, cached: dict) -> dict:
+    return {
+        "success": True,
+        "pdb_data": cached["pdb_data"].decode("utf-8"),
+        "metadata": _prediction_entry(json.loads(cached["metadata"])),
+        "uniprot_id": uniprot_id
+    }
+
+async def _fetch_prediction(uniprot_id: str) -> dict:
+    cached = await asyncio.to_thread(structure_cache.get, uniprot_id)
+    if cached and cached["fresh"]:
+        CACHE_REQUESTS.inc(cache="alphafold", result="hit")
+        return _cached_result(uniprot_id, cached)
+    
+    # Revalidate stale entries with a conditional request
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+    
+    client = get_http_client()
+    prediction_url = f"{ALPHAFOLD_DB_URL}/prediction/{uniprot_id}"
+    await host_rate_limiter.acquire(prediction_url)
+    with track_upstream("alphafold") as call:
+        response = await client.get(
+            prediction_url,
+            headers=headers,
+            timeout=10.0
+        )
+        call.status(response.status_code)
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    
+    if response.status_code == 304 and cached:
+        CACHE_REQUESTS.inc(cache="alphafold", result="revalidated")
+        await asyncio.to_thread(
+            structure_cache.mark_validated, uniprot_id, cached["model_version"], etag, last_modified
+        )
+        return _cached_result(uniprot_id, cached)
+    
+    if response.status_code == 404:
+        return {
+            "success": False,
+            "error": f"Nenhuma predição encontrada para {uniprot_id}",
+            "not_found": True
+        }
+    
+    response.raise_for_status()
+    metadata = response.json()
+    entry = _prediction_entry(metadata)
+    model_version = str(entry.get("latestVersion", "unknown"))
+    metadata_bytes = json.dumps(metadata, sort_keys=True).encode("utf-8")
+    
+    # Same model and metadata as the cached copy: the PDB file has not changed
+    if cached and cached["model_version"] == model_version and cached["metadata"] == metadata_bytes:
+        CACHE_REQUESTS.inc(cache="alphafold", result="revalidated")
+        await asyncio.to_thread(
+            structure_cache.mark_validated, uniprot_id, model_version, etag, last_modified
+        )
+        return _cached_result(uniprot_id, cached)
+    
+    # Get PDB file
+    CACHE_REQUESTS.inc(cache="alphafold", result="miss")
+    await host_rate_limiter.acquire(entry['pdbUrl'])
+    with track_upstream("alphafold") as call:
+        pdb_response = await client.get(entry['pdbUrl'], timeout=10.0)
+        call.status(pdb_response.status_code)
+    pdb_response.raise_for_status()
+    pdb_data = pdb_response.text
+    
+    await asyncio.to_thread(
+        structure_cache.put,
+        uniprot_id, model_version, metadata_bytes, pdb_data.encode("utf-8"), etag, last_modified
+    )
+    
+    return {
+        "success": True,
+        "pdb_data": pdb_data,
+        "metadata": entry,
+        "uniprot_id": uniprot_id
+    }
 
 async def get_alphafold_prediction(uniprot_id: str) -> dict:
     """
     Fetch AlphaFold structure prediction from AlphaFold DB.
     
+    Results are served from the on-disk structure cache when fresh, and
+    concurrent requests for the same ID share a single upstream fetch.
+    
     Args:
         uniprot_id: UniProt accession ID (e.g., Q5VSL9, P12345)
         
     Returns:
         dict with PDB data and metadata
     """
+    uniprot_id = uniprot_id.strip().upper()
     try:
-        # Get structure metadata
-        async with httpx.AsyncClient() as client:
-            # Check if prediction exists
-            response = await client.get(
-                f"{ALPHAFOLD_DB_URL}/prediction/{uniprot_id}",
-                timeout=10.0
-            )
-            
-            if response.status_code == 404:
-                return {
-                    "success": False,
-                    "error": f"Nenhuma predição encontrada para {uniprot_id}"
-                }
-            
-            response.raise_for_status()
-            metadata = response.json()
-            
-            # Get PDB file
-            pdb_url = metadata[0]['pdbUrl'] if isinstance(metadata, list) else metadata['pdbUrl']
-            
-            pdb_response = await client.get(pdb_url, timeout=10.0)
-            pdb_response.raise_for_status()
-            pdb_data = pdb_response.text
-            
-            return {
-                "success": True,
-                "pdb_data": pdb_data,
-                "metadata": metadata,
-                "uniprot_id": uniprot_id
-            }
-            
+        return await _single_flight(uniprot_id, lambda: _fetch_prediction(uniprot_id))
     except httpx.TimeoutException:
         return {
             "success": False,
@@ -61,52 +156,128 @@ async def get_alphafold_prediction(uniprot_id: str) -> dict:
             "error": f"Erro: {type(e).__name__} - {str(e)}"
         }
 
-async def search_alphafold_by_gene(gene_name: str) -> dict:
+async def get_alphafold_predictions_batch(
+    uniprot_ids: List[str],
+    max_concurrency: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """
+    Fetch AlphaFold predictions for many UniProt IDs concurrently.
+    
+    Results are yielded as soon as each lookup finishes (not in input
+    order). A failing ID yields its own error result and does not stop
+    the rest of the batch.
+    
+    Args:
+        uniprot_ids: UniProt accession IDs; duplicates are fetched once
+        max_concurrency: Parallel lookups (capped by BATCH_MAX_CONCURRENCY)
+        
+    Yields:
+        dict in the same format as get_alphafold_prediction
+    """
+    limit = min(max_concurrency or BATCH_DEFAULT_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(limit, 1))
+    
+    async def fetch(uniprot_id: str) -> dict:
+        async with semaphore:
+            result = await get_alphafold_prediction(uniprot_id)
+        result.setdefault("uniprot_id", uniprot_id)
+        return result
+    
+    unique_ids = list(dict.fromkeys(uid.strip().upper() for uid in uniprot_ids if uid.strip()))
+    tasks = [asyncio.ensure_future(fetch(uid)) for uid in unique_ids]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away: stop the lookups that have not finished yet
+        for task in tasks:
+            task.cancel()
+
+async def search_alphafold_by_gene(gene_name: str, organism: Optional[str] = None, limit: int = 5) -> dict:
     """
     Search AlphaFold predictions by gene name.
     
+    Looks the name up in the local UniProt index and falls back to the
+    UniProt API when no index is loaded or it has no match.
+    
     Args:
-        gene_name: Gene name (e.g., TP53, BRCA1)
+        gene_name: Gene name (e.g., TP53, BRCA1), synonym or accession
+        organism: NCBI taxon ID, scientific or common name (optional)
+        limit: Maximum number of results
         
     Returns:
-        dict with search results
+        dict with search results and their `source` ("index" or "uniprot")
     """
+    gene_name = gene_name.strip()
     try:
-        async with httpx.AsyncClient() as client:
-            # Use UniProt API to search by gene name
-            uniprot_search_url = f"https://rest.uniprot.org/uniprotkb/search?query=gene:{gene_name}+AND+reviewed:true&format=json&size=5"
-            
-            response = await client.get(uniprot_search_url, timeout=10.0)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if not data.get('results'):
-                return {
-                    "success": False,
-                    "error": f"Gene {gene_name} não encontrado no UniProt"
-                }
-            
-            results = []
-            for entry in data['results'][:5]:  # Limit to 5 results
-                uniprot_id = entry['primaryAccession']
-                protein_name = entry.get('proteinDescription', {}).get('recommendedName', {}).get('fullName', {}).get('value', 'Unknown')
-                organism = entry.get('organism', {}).get('scientificName', 'Unknown')
-                
-                results.append({
-                    "uniprot_id": uniprot_id,
-                    "protein_name": protein_name,
-                    "gene_name": gene_name,
-                    "organism": organism
-                })
-            
+        results = await asyncio.to_thread(uniprot_index.search, gene_name, organism, limit)
+    except sqlite3.Error as e:
+        print(f"[UNIPROT INDEX ERROR] {type(e).__name__}: {str(e)}")
+        results = None
+    if results:
+        return {"success": True, "results": results, "source": "index"}
+    if results is not None and not UNIPROT_REMOTE_FALLBACK:
+        return {
+            "success": False,
+            "error": f"Gene {gene_name} não encontrado no índice UniProt"
+        }
+    
+    try:
+        client = get_http_client()
+        # Use UniProt API to search by gene name
+        query = f"gene:{gene_name} AND reviewed:true"
+        if organism:
+            organism = organism.strip()
+            query += f" AND organism_id:{organism}" if organism.isdigit() else f' AND organism_name:"{organism}"'
+        uniprot_search_url = f"{UNIPROT_REST_URL}/uniprotkb/search"
+        
+        await host_rate_limiter.acquire(uniprot_search_url)
+        with track_upstream("uniprot") as call:
+            response = await client.get(
+                uniprot_search_url, params={"query": query, "format": "json", "size": limit}, timeout=10.0
+            )
+            call.status(response.status_code)
+        response.raise_for_status()
+        
+        data = response.json()
+        
+        if not data.get('results'):
             return {
-                "success": True,
-                "results": results
+                "success": False,
+                "error": f"Gene {gene_name} não encontrado no UniProt"
             }
+        
+        results = []
+        for entry in data['results'][:limit]:
+            uniprot_id = entry['primaryAccession']
+            protein_name = entry.get('proteinDescription', {}).get('recommendedName', {}).get('fullName', {}).get('value', 'Unknown')
+            organism = entry.get('organism', {}).get('scientificName', 'Unknown')
             
+            results.append({
+                "uniprot_id": uniprot_id,
+                "protein_name": protein_name,
+                "gene_name": gene_name,
+                "organism": organism
+            })
+        
+        return {
+            "success": True,
+            "results": results,
+            "source": "uniprot"
+        }
+        
     except Exception as e:
         return {
             "success": False,
             "error": f"Erro na busca: {type(e).__name__} - {str(e)}"
         }
+
+async def autocomplete_proteins(prefix: str, organism: Optional[str] = None, limit: int = 10) -> dict:
+    """
+    Suggestions for a partially typed gene name, accession or protein name,
+    answered from the local UniProt index only.
+    """
+    suggestions = await asyncio.to_thread(uniprot_index.suggest, prefix, organism, limit)
+    if suggestions is None:
+        return {"success": False, "error": "Índice UniProt local não carregado"}
+    return {"success": True, "suggestions": suggestions}
@@ -0,0 +1,414 @@
+import asyncio
+import math
+import os
+import re
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+from ..database import engine, ChatSession, ChatSessionMessage
+from .llm_service import send_chat_turn, stream_chat_with_ai, summarize_conversation
+from .metrics import CACHE_REQUESTS
+
+# Estimated tokens of conversation sent with each turn (summary + recent
+# messages + the new message)
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+# Once over the budget, old turns are folded until the context is back
+# under this share of it, so the summary is not rewritten on every turn
+CHAT_CONTEXT_TARGET_RATIO = float(os.getenv("CHAT_CONTEXT_TARGET_RATIO", "0.6"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "800"))
+# Most recent messages that are always sent verbatim
+CHAT_KEEP_RECENT_MESSAGES = int(os.getenv("CHAT_KEEP_RECENT_MESSAGES", "4"))
+# "llm": Gemini rewrites the summary; "trim": local extract of the old turns
+CHAT_SUMMARY_MODE = os.getenv("CHAT_SUMMARY_MODE", "llm")
+# Sessions whose recent turns are kept in memory by this process
+CHAT_SESSION_CACHE_ENTRIES = int(os.getenv("CHAT_SESSION_CACHE_ENTRIES", "256"))
+
+# Role and separator tokens added to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Characters of each message kept by the local summary
+TRIM_SNIPPET_CHARS = 300
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+SUMMARY_PREAMBLE = "Summary of our conversation so far:\n{summary}"
+SUMMARY_ACK = "Understood, I will take this into account."
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: about one token per four
+    characters of each word, and one per punctuation mark.
+    """
+    tokens = 0
+    for match in _TOKEN_PATTERN.finditer(text or ""):
+        tokens += max(1, math.ceil(len(match.group()) / 4))
+    return tokens
+
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class _Turn:
+    id: int
+    role: str
+    content: str
+    tokens: int
+
+
+@dataclass
+class _SessionState:
+    """Summary and unsummarized messages of a session, as sent to Gemini."""
+    session_id: int
+    summary: Optional[str]
+    summarized_through_id: int
+    message_count: int
+    messages: List[_Turn] = field(default_factory=list)
+
+    @property
+    def summary_tokens(self) -> int:
+        if not self.summary:
+            return 0
+        return message_tokens(SUMMARY_PREAMBLE.format(summary=self.summary)) + message_tokens(SUMMARY_ACK)
+
+    @property
+    def context_tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.messages)
+
+
+# Session state by id, least recently used first
+_states: "OrderedDict[int, _SessionState]" = OrderedDict()
+# One turn at a time per session; entries go away with their last user
+_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _lock(session_id: int) -> asyncio.Lock:
+    lock = _locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[session_id] = lock
+    return lock
+
+
+def _remember(state: _SessionState):
+    _states[state.session_id] = state
+    _states.move_to_end(state.session_id)
+    while len(_states) > CHAT_SESSION_CACHE_ENTRIES:
+        _states.popitem(last=False)
+
+
+# Blocking database helpers; called through asyncio.to_thread
+
+def _create_session(title: Optional[str]) -> ChatSession:
+    with Session(engine) as session:
+        chat = ChatSession(title=title)
+        session.add(chat)
+        session.commit()
+        session.refresh(chat)
+        return chat
+
+
+def _get_session(session_id: int, limit: int) -> Optional[Tuple[ChatSession, List[ChatSessionMessage]]]:
+    with Session(engine) as session:
+        chat = session.get(ChatSession, session_id)
+        if chat is None:
+            return None
+        messages = session.exec(
+            select(ChatSessionMessage)
+            .where(ChatSessionMessage.session_id == session_id)
+            .order_by(ChatSessionMessage.id.desc())
+            .limit(limit)
+        ).all()
+        return chat, list(reversed(messages))
+
+
+def _delete_session(session_id: int) -> bool:
+    with Session(engine) as session:
+        chat = session.get(ChatSession, session_id)
+        if chat is None:
+            return False
+        session.exec(delete(ChatSessionMessage).where(ChatSessionMessage.session_id == session_id))
+        session.delete(chat)
+        session.commit()
+        return True
+
+
+def _message_count(session_id: int) -> Optional[int]:
+    with Session(engine) as session:
+        return session.exec(
+            select(ChatSession.message_count).where(ChatSession.id == session_id)
+        ).first()
+
+
+def _load_state(session_id: int) -> Optional[_SessionState]:
+    with Session(engine) as session:
+        chat = session.get(ChatSession, session_id)
+        if chat is None:
+            return None
+        messages = session.exec(
+            select(ChatSessionMessage)
+            .where(ChatSessionMessage.session_id == session_id)
+            .where(ChatSessionMessage.id > chat.summarized_through_id)
+            .order_by(ChatSessionMessage.id)
+        ).all()
+        return _SessionState(
+            session_id=session_id,
+            summary=chat.summary,
+            summarized_through_id=chat.summarized_through_id,
+            message_count=chat.message_count,
+            messages=[_Turn(m.id, m.role, m.content, m.tokens) for m in messages],
+        )
+
+
+def _save_turn(
+    session_id: int, expected_count: int, turns: List[Tuple[str, str, int]],
+    summary: Optional[str], summarized_through_id: int
+) -> Optional[List[int]]:
+    """
+    Append the messages of a turn and the new summary.
+
+    The session row is only updated if its message count is still
+    `expected_count`; otherwise another process added a turn meanwhile,
+    nothing is written and None is returned.
+    """
+    with Session(engine) as session:
+        values = {
+            "message_count": expected_count + len(turns),
+            "summary": summary,
+            "summarized_through_id": summarized_through_id,
+            "updated_at": datetime.utcnow(),
+        }
+        result = session.exec(
+            update(ChatSession)
+            .where(ChatSession.id == session_id)
+            .where(ChatSession.message_count == expected_count)
+            .values(**values)
+        )
+        if result.rowcount != 1:
+            session.rollback()
+            return None
+        rows = [
+            ChatSessionMessage(session_id=session_id, role=role, content=content, tokens=tokens)
+            for role, content, tokens in turns
+        ]
+        session.add_all(rows)
+        chat = session.get(ChatSession, session_id)
+        if not chat.title:
+            chat.title = turns[0][1][:80]
+            session.add(chat)
+        session.commit()
+        return [row.id for row in rows]
+
+
+async def _current_state(session_id: int) -> Optional[_SessionState]:
+    """
+    Cached state of a session, reloaded when another process added turns
+    (its message count no longer matches the database).
+    """
+    state = _states.get(session_id)
+    if state is not None:
+        count = await asyncio.to_thread(_message_count, session_id)
+        if count == state.message_count:
+            _states.move_to_end(session_id)
+            CACHE_REQUESTS.inc(cache="chat_session", result="hit")
+            return state
+        _states.pop(session_id, None)
+        if count is None:
+            return None
+    CACHE_REQUESTS.inc(cache="chat_session", result="miss")
+    state = await asyncio.to_thread(_load_state, session_id)
+    if state is not None:
+        _remember(state)
+    return state
+
+
+def _split_for_budget(state: _SessionState, new_tokens: int) -> Tuple[List[_Turn], List[_Turn]]:
+    """
+    Oldest messages to fold into the summary and the ones to keep.
+
+    Nothing is folded while the context fits CHAT_CONTEXT_TOKEN_BUDGET. The
+    kept messages always start with a user message, so the history Gemini
+    receives keeps alternating after the summary exchange.
+    """
+    if state.context_tokens + new_tokens <= CHAT_CONTEXT_TOKEN_BUDGET:
+        return [], list(state.messages)
+    target = CHAT_CONTEXT_TOKEN_BUDGET * CHAT_CONTEXT_TARGET_RATIO
+    kept = list(state.messages)
+    kept_tokens = sum(turn.tokens for turn in kept)
+    # Room for the rewritten summary, which may grow up to CHAT_SUMMARY_MAX_TOKENS
+    summary_tokens = max(state.summary_tokens, CHAT_SUMMARY_MAX_TOKENS + 2 * MESSAGE_OVERHEAD_TOKENS)
+    folded = []
+    while len(kept) > CHAT_KEEP_RECENT_MESSAGES and summary_tokens + kept_tokens + new_tokens > target:
+        turn = kept.pop(0)
+        folded.append(turn)
+        kept_tokens -= turn.tokens
+    while kept and kept[0].role != "user":
+        folded.append(kept.pop(0))
+    return folded, kept
+
+
+def _trim_summary(previous: Optional[str], folded: List[_Turn]) -> str:
+    """Local summary: the start of each folded message, oldest lines dropped past CHAT_SUMMARY_MAX_TOKENS."""
+    lines = previous.splitlines() if previous else []
+    for turn in folded:
+        content = " ".join(turn.content.split())
+        if len(content) > TRIM_SNIPPET_CHARS:
+            content = content[:TRIM_SNIPPET_CHARS].rstrip() + "…"
+        lines.append(f"{turn.role}: {content}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > CHAT_SUMMARY_MAX_TOKENS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+async def _fold(previous: Optional[str], folded: List[_Turn]) -> str:
+    if CHAT_SUMMARY_MODE == "llm":
+        try:
+            # About three words per four tokens
+            max_words = max(50, CHAT_SUMMARY_MAX_TOKENS * 3 // 4)
+            summary = await summarize_conversation(
+                previous, [(turn.role, turn.content) for turn in folded], max_words
+            )
+            if estimate_tokens(summary) <= CHAT_SUMMARY_MAX_TOKENS * 1.5:
+                return summary
+            print(f"[CHAT] Summary over budget ({estimate_tokens(summary)} tokens), trimming locally")
+        except Exception as e:
+            print(f"[CHAT ERROR] Summary failed, trimming locally: {type(e).__name__}: {str(e)}")
+    return _trim_summary(previous, folded)
+
+
+def _gemini_history(summary: Optional[str], turns: List[_Turn]) -> list:
+    history = []
+    if summary:
+        history.append({"role": "user", "parts": [SUMMARY_PREAMBLE.format(summary=summary)]})
+        history.append({"role": "model", "parts": [SUMMARY_ACK]})
+    for turn in turns:
+        history.append({"role": "model" if turn.role == "assistant" else "user", "parts": [turn.content]})
+    return history
+
+
+@dataclass
+class _PreparedTurn:
+    state: _SessionState
+    message: str
+    message_tokens: int
+    summary: Optional[str]
+    summarized_through_id: int
+    kept: List[_Turn]
+    history: list
+
+
+async def _prepare_turn(session_id: int, message: str) -> Optional[_PreparedTurn]:
+    state = await _current_state(session_id)
+    if state is None:
+        return None
+    tokens = message_tokens(message)
+    folded, kept = _split_for_budget(state, tokens)
+    summary, through = state.summary, state.summarized_through_id
+    if folded:
+        summary = await _fold(state.summary, folded)
+        through = folded[-1].id
+        print(f"[CHAT] Session {session_id}: folded {len(folded)} messages into the summary")
+    return _PreparedTurn(state, message, tokens, summary, through, kept, _gemini_history(summary, kept))
+
+
+async def _finish_turn(turn: _PreparedTurn, reply: str) -> Optional[int]:
+    """Persist a completed turn and update the cached state; returns the context size in tokens."""
+    state = turn.state
+    reply_tokens = message_tokens(reply)
+    ids = await asyncio.to_thread(
+        _save_turn, state.session_id, state.message_count,
+        [("user", turn.message, turn.message_tokens), ("assistant", reply, reply_tokens)],
+        turn.summary, turn.summarized_through_id
+    )
+    if ids is None:
+        _states.pop(state.session_id, None)
+        return None
+    state.summary = turn.summary
+    state.summarized_through_id = turn.summarized_through_id
+    state.message_count += 2
+    state.messages = turn.kept + [
+        _Turn(ids[0], "user", turn.message, turn.message_tokens),
+        _Turn(ids[1], "assistant", reply, reply_tokens),
+    ]
+    return state.context_tokens
+
+
+def _not_found(session_id: int) -> dict:
+    return {"success": False, "not_found": True, "error": f"Sessão de chat {session_id} não encontrada"}
+
+
+def _conflict(session_id: int) -> dict:
+    return {
+        "success": False, "conflict": True,
+        "error": f"Sessão de chat {session_id} alterada por outra requisição. Tente novamente."
+    }
+
+
+async def create_session(title: Optional[str] = None) -> ChatSession:
+    return await asyncio.to_thread(_create_session, title)
+
+
+async def get_session(session_id: int, limit: int = 50) -> Optional[Tuple[ChatSession, List[ChatSessionMessage]]]:
+    """A session and its `limit` most recent messages, oldest first."""
+    return await asyncio.to_thread(_get_session, session_id, limit)
+
+
+async def delete_session(session_id: int) -> bool:
+    async with _lock(session_id):
+        _states.pop(session_id, None)
+        return await asyncio.to_thread(_delete_session, session_id)
+
+
+async def send_session_message(session_id: int, message: str) -> dict:
+    """
+    Send a message within a server-side chat session.
+
+    Gemini receives the session summary, the messages not yet summarized
+    and the new message. When that exceeds CHAT_CONTEXT_TOKEN_BUDGET the
+    oldest messages are folded into the summary first. The turn is stored
+    only when Gemini answers.
+
+    Returns:
+        dict with `response` and `context_tokens`, or `success` False and
+        `error` (with `not_found` or `conflict`)
+    """
+    async with _lock(session_id):
+        turn = await _prepare_turn(session_id, message)
+        if turn is None:
+            return _not_found(session_id)
+        try:
+            reply = await send_chat_turn(message, turn.history)
+        except asyncio.TimeoutError:
+            return {"success": False, "error": "Tempo limite excedido. Tente novamente."}
+        except Exception as e:
+            print(f"[CHAT ERROR] {type(e).__name__}: {str(e)}")
+            return {"success": False, "error": f"Erro: {type(e).__name__} - {str(e)}"}
+        context_tokens = await _finish_turn(turn, reply)
+        if context_tokens is None:
+            return _conflict(session_id)
+        return {"success": True, "response": reply, "session_id": session_id, "context_tokens": context_tokens}
+
+
+async def stream_session_message(session_id: int, message: str) -> AsyncIterator[str]:
+    """
+    Stream the reply to a message within a chat session.
+
+    Same context handling as `send_session_message`; the turn is stored
+    once the stream completes, and not at all if it fails or the client
+    disconnects. Raises LookupError for an unknown session.
+    """
+    async with _lock(session_id):
+        turn = await _prepare_turn(session_id, message)
+        if turn is None:
+            raise LookupError(_not_found(session_id)["error"])
+        parts = []
+        async for text in stream_chat_with_ai(message, turn.history):
+            parts.append(text)
+            yield text
+        if await _finish_turn(turn, "".join(parts)) is None:
+            raise RuntimeError(_conflict(session_id)["error"])
@@ -0,0 +1,586 @@
+import asyncio
+import fcntl
+import hashlib
+import math
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from stat import S_ISREG
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+from sqlalchemy import delete, func, update
+from sqlmodel import Session, select
+from ..database import engine, Dataset, DatasetChunk, Pipeline, PipelineRun, Project
+from .runner import PROJECT_ROOT, pipeline_workspace
+
+# Blob store (content-addressed, shared by every project) and partial uploads
+DATASETS_DIR = os.getenv("DATASETS_DIR", os.path.join(PROJECT_ROOT, "datasets"))
+BLOBS_DIR = os.path.join(DATASETS_DIR, "blobs")
+UPLOADS_DIR = os.path.join(DATASETS_DIR, "uploads")
+
+DATASET_CHUNK_BYTES = int(float(os.getenv("DATASET_CHUNK_MB", "8")) * 1024 * 1024)
+DATASET_MIN_CHUNK_BYTES = 256 * 1024
+DATASET_MAX_CHUNK_BYTES = int(float(os.getenv("DATASET_MAX_CHUNK_MB", "64")) * 1024 * 1024)
+DATASET_MAX_BYTES = int(float(os.getenv("DATASET_MAX_GB", "200")) * 1024 ** 3)
+# Uploads without a new chunk for longer than this are discarded by the janitor
+DATASET_UPLOAD_TTL_HOURS = float(os.getenv("DATASET_UPLOAD_TTL_HOURS", "72"))
+
+# Directory of a pipeline workspace where datasets are staged for its runs
+STAGED_INPUTS_DIRNAME = "inputs"
+
+# A run parameter whose value is exactly "dataset:<id>"
+DATASET_REFERENCE = re.compile(r"^dataset:(\d+)$")
+_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Request bodies are written to disk in pieces of at most this size
+_WRITE_BUFFER_BYTES = 1024 * 1024
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOBS_DIR, sha256[:2], sha256)
+
+
+def _upload_path(dataset_id: int) -> str:
+    return os.path.join(UPLOADS_DIR, f"{dataset_id}.part")
+
+
+def _chunk_tmp_path(dataset_id: int, index: int) -> str:
+    return os.path.join(UPLOADS_DIR, f"{dataset_id}.{index}.{uuid.uuid4().hex[:8]}.chunk")
+
+
+def chunk_count(dataset: Dataset) -> int:
+    return math.ceil(dataset.size_bytes / dataset.chunk_size)
+
+
+def chunk_length(dataset: Dataset, index: int) -> Optional[int]:
+    """Expected size of chunk `index`, or None when the dataset has no such chunk."""
+    if index < 0 or index >= chunk_count(dataset):
+        return None
+    return min(dataset.chunk_size, dataset.size_bytes - index * dataset.chunk_size)
+
+
+def _clean_filename(filename: str) -> Optional[str]:
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        return None
+    return name
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_WRITE_BUFFER_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _received_chunks(session: Session, dataset_id: int) -> List[int]:
+    return list(session.exec(
+        select(DatasetChunk.index).where(DatasetChunk.dataset_id == dataset_id).order_by(DatasetChunk.index)
+    ).all())
+
+
+def _result(dataset: Dataset, received: List[int], deduplicated: bool = False) -> dict:
+    return {"success": True, "dataset": dataset, "received_chunks": received, "deduplicated": deduplicated}
+
+
+def _get_dataset(session: Session, project_id: int, dataset_id: int) -> Optional[Dataset]:
+    dataset = session.get(Dataset, dataset_id)
+    if dataset is None or dataset.project_id != project_id:
+        return None
+    return dataset
+
+
+def _create_dataset(project_id: int, filename: str, size_bytes: int,
+                    sha256: Optional[str], chunk_size: Optional[int]) -> dict:
+    name = _clean_filename(filename)
+    if name is None:
+        return {"success": False, "error": "Nome de arquivo inválido"}
+    if size_bytes < 0 or size_bytes > DATASET_MAX_BYTES:
+        return {"success": False, "error": f"Tamanho deve estar entre 0 e {DATASET_MAX_BYTES} bytes"}
+    chunk_size = chunk_size or DATASET_CHUNK_BYTES
+    if not DATASET_MIN_CHUNK_BYTES <= chunk_size <= DATASET_MAX_CHUNK_BYTES:
+        return {
+            "success": False,
+            "error": f"chunk_size deve estar entre {DATASET_MIN_CHUNK_BYTES} e {DATASET_MAX_CHUNK_BYTES} bytes"
+        }
+    if sha256 is not None:
+        sha256 = sha256.lower()
+        if not _SHA256_PATTERN.match(sha256):
+            return {"success": False, "error": "sha256 deve ter 64 dígitos hexadecimais"}
+
+    with Session(engine) as session:
+        if session.get(Project, project_id) is None:
+            return {"success": False, "error": "Projeto não encontrado", "not_found": True}
+        # Always uploaded, even when `sha256` is already in the store:
+        # knowing a checksum must not give access to another project's file.
+        # Identical content is stored once when the upload completes
+        dataset = Dataset(
+            project_id=project_id, filename=name, size_bytes=size_bytes,
+            chunk_size=chunk_size, expected_sha256=sha256
+        )
+        session.add(dataset)
+        session.commit()
+        session.refresh(dataset)
+
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    # Sparse until written: chunks land at their offset in any order
+    with open(_upload_path(dataset.id), "wb") as f:
+        f.truncate(size_bytes)
+    return _result(dataset, [])
+
+
+def _load_dataset(project_id: int, dataset_id: int) -> dict:
+    with Session(engine) as session:
+        dataset = _get_dataset(session, project_id, dataset_id)
+        if dataset is None:
+            return {"success": False, "error": "Dataset não encontrado", "not_found": True}
+        return _result(dataset, _received_chunks(session, dataset_id) if dataset.status == "uploading" else [])
+
+
+def _list_datasets(project_id: int) -> Optional[List[Dataset]]:
+    with Session(engine) as session:
+        if session.get(Project, project_id) is None:
+            return None
+        return list(session.exec(
+            select(Dataset).where(Dataset.project_id == project_id).order_by(Dataset.id)
+        ).all())
+
+
+def _append(f, data: bytes, digest) -> None:
+    digest.update(data)
+    f.write(data)
+
+
+def _write_at(fd: int, offset: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _record_chunk(dataset_id: int, index: int, size_bytes: int, sha256: str) -> Optional[int]:
+    """Store a verified chunk; returns how many chunks have been received."""
+    with Session(engine) as session:
+        dataset = session.get(Dataset, dataset_id)
+        if dataset is None or dataset.status != "uploading":
+            return None
+        chunk = session.get(DatasetChunk, (dataset_id, index))
+        if chunk is None:
+            session.add(DatasetChunk(dataset_id=dataset_id, index=index, size_bytes=size_bytes, sha256=sha256))
+        else:
+            chunk.size_bytes = size_bytes
+            chunk.sha256 = sha256
+            session.add(chunk)
+        session.commit()
+        return session.exec(
+            select(func.count()).select_from(DatasetChunk).where(DatasetChunk.dataset_id == dataset_id)
+        ).one()
+
+
+def _splice_chunk(dataset: Dataset, index: int, chunk_path: str, size_bytes: int, sha256: str) -> Optional[int]:
+    """
+    Copy a verified chunk into the partial upload and record it; returns
+    how many chunks have been received, or None once the upload is being
+    completed.
+
+    Writers hold a shared lock on the partial file, which completion takes
+    exclusively after switching the status, so a chunk is either fully
+    written before the file is hashed or not written at all.
+    """
+    try:
+        fd = os.open(_upload_path(dataset.id), os.O_WRONLY)
+    except OSError:
+        return None  # Already moved into the store or deleted
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        with Session(engine) as session:
+            current = session.get(Dataset, dataset.id)
+            if current is None or current.status != "uploading":
+                return None
+        offset = index * dataset.chunk_size
+        with open(chunk_path, "rb") as chunk:
+            for data in iter(lambda: chunk.read(_WRITE_BUFFER_BYTES), b""):
+                _write_at(fd, offset, data)
+                offset += len(data)
+        return _record_chunk(dataset.id, index, size_bytes, sha256)
+    finally:
+        os.close(fd)  # Releases the lock
+
+
+def _store_upload(session: Session, dataset: Dataset) -> dict:
+    """Check and move a partial upload into the store; the dataset is `completing`."""
+    partial = _upload_path(dataset.id)
+    try:
+        fd = os.open(partial, os.O_RDONLY)
+    except FileNotFoundError:
+        return {"success": False, "error": "Arquivo parcial do upload não encontrado", "conflict": True}
+    try:
+        # Wait for chunk writers that saw the upload before it was claimed
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        received = set(_received_chunks(session, dataset.id))
+        missing = [index for index in range(chunk_count(dataset)) if index not in received]
+        if missing:
+            shown = ", ".join(str(index) for index in missing[:20])
+            return {
+                "success": False,
+                "error": f"Faltam {len(missing)} partes: {shown}{'...' if len(missing) > 20 else ''}",
+                "conflict": True,
+            }
+
+        sha256 = _sha256(partial)
+        if dataset.expected_sha256 and sha256 != dataset.expected_sha256:
+            # Every chunk matched its own checksum, so the client announced
+            # the wrong file or sent chunks of another one: start over
+            session.exec(delete(DatasetChunk).where(DatasetChunk.dataset_id == dataset.id))
+            session.commit()
+            return {
+                "success": False,
+                "error": f"SHA-256 do arquivo ({sha256}) difere do informado ({dataset.expected_sha256})"
+            }
+
+        target = blob_path(sha256)
+        deduplicated = os.path.exists(target)
+        if deduplicated:
+            os.remove(partial)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Read-only: staged hard links share the inode with every run
+            os.chmod(partial, 0o444)
+            os.replace(partial, target)
+    finally:
+        os.close(fd)
+
+    dataset.sha256 = sha256
+    dataset.status = "ready"
+    dataset.completed_at = datetime.utcnow()
+    session.add(dataset)
+    session.exec(delete(DatasetChunk).where(DatasetChunk.dataset_id == dataset.id))
+    session.commit()
+    session.refresh(dataset)
+    return _result(dataset, [], deduplicated)
+
+
+def _complete_dataset(project_id: int, dataset_id: int) -> dict:
+    with Session(engine) as session:
+        dataset = _get_dataset(session, project_id, dataset_id)
+        if dataset is None:
+            return {"success": False, "error": "Dataset não encontrado", "not_found": True}
+        # Claim the completion: concurrent completes and chunk writers see
+        # "completing" and back off
+        claimed = session.execute(
+            update(Dataset)
+            .where(Dataset.id == dataset_id, Dataset.status == "uploading")
+            .values(status="completing")
+        ).rowcount == 1
+        session.commit()
+        session.refresh(dataset)
+        if not claimed:
+            if dataset.status == "ready":
+                return _result(dataset, [])
+            return {"success": False, "error": "Upload já está sendo concluído", "conflict": True}
+
+        result = None
+        try:
+            result = _store_upload(session, dataset)
+            return result
+        finally:
+            if result is None or not result["success"]:
+                session.rollback()
+                session.execute(
+                    update(Dataset)
+                    .where(Dataset.id == dataset_id, Dataset.status == "completing")
+                    .values(status="uploading")
+                )
+                session.commit()
+
+
+def _remove_blob_if_unused(session: Session, sha256: Optional[str]):
+    if not sha256:
+        return
+    in_use = session.exec(
+        select(func.count()).select_from(Dataset).where(Dataset.sha256 == sha256)
+    ).one()
+    if not in_use:
+        try:
+            os.remove(blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+def _delete_dataset(project_id: int, dataset_id: int) -> bool:
+    with Session(engine) as session:
+        dataset = _get_dataset(session, project_id, dataset_id)
+        if dataset is None:
+            return False
+        sha256 = dataset.sha256
+        session.exec(delete(DatasetChunk).where(DatasetChunk.dataset_id == dataset_id))
+        session.delete(dataset)
+        session.commit()
+        try:
+            os.remove(_upload_path(dataset_id))
+        except FileNotFoundError:
+            pass
+        _remove_blob_if_unused(session, sha256)
+        # Workspaces with a queued or running run keep their link until the
+        # janitor prunes it, so a run never loses an input it was given
+        pipeline_ids = set(session.exec(select(Pipeline.id).where(Pipeline.project_id == project_id)).all())
+        busy = set(session.exec(
+            select(PipelineRun.pipeline_id).where(
+                PipelineRun.pipeline_id.in_(pipeline_ids), PipelineRun.status.in_(("pending", "running"))
+            )
+        ).all()) if pipeline_ids else set()
+    for pipeline_id in pipeline_ids - busy:
+        remove_staged_inputs(pipeline_workspace(pipeline_id), [dataset_id])
+    return True
+
+
+async def create_dataset(project_id: int, filename: str, size_bytes: int,
+                         sha256: Optional[str] = None, chunk_size: Optional[int] = None) -> dict:
+    """
+    Start the upload of a dataset.
+
+    When `sha256` is given, the uploaded file must match it to complete.
+    """
+    return await asyncio.to_thread(_create_dataset, project_id, filename, size_bytes, sha256, chunk_size)
+
+
+async def get_dataset(project_id: int, dataset_id: int) -> dict:
+    """A dataset and, while uploading, the indexes of the chunks received so far."""
+    return await asyncio.to_thread(_load_dataset, project_id, dataset_id)
+
+
+async def list_datasets(project_id: int) -> Optional[List[Dataset]]:
+    """Datasets of a project, or None when the project does not exist."""
+    return await asyncio.to_thread(_list_datasets, project_id)
+
+
+async def delete_dataset(project_id: int, dataset_id: int) -> bool:
+    return await asyncio.to_thread(_delete_dataset, project_id, dataset_id)
+
+
+async def complete_dataset(project_id: int, dataset_id: int) -> dict:
+    """Check that every chunk arrived and the file's SHA-256, then move it into the store."""
+    return await asyncio.to_thread(_complete_dataset, project_id, dataset_id)
+
+
+async def receive_chunk(project_id: int, dataset_id: int, index: int,
+                        body: AsyncIterator[bytes], sha256: Optional[str] = None) -> dict:
+    """
+    Write chunk `index` of an upload from a request body stream.
+
+    The body is written to a temporary file as it arrives, so memory use
+    does not depend on the chunk size. Only when its size and, if given,
+    its SHA-256 match is it copied to the chunk's offset and counted as
+    received; sending it again replaces it.
+    """
+    result = await get_dataset(project_id, dataset_id)
+    if not result["success"]:
+        return result
+    dataset = result["dataset"]
+    if dataset.status != "uploading":
+        return {"success": False, "error": "Upload já concluído", "conflict": True}
+    expected = chunk_length(dataset, index)
+    if expected is None:
+        return {"success": False, "error": f"Parte {index} fora do intervalo 0-{chunk_count(dataset) - 1}"}
+
+    # Received into a file of its own, so a failed re-send never touches
+    # the copy of the chunk that was already accepted
+    digest = hashlib.sha256()
+    received = 0
+    buffer = bytearray()
+    chunk_path = _chunk_tmp_path(dataset_id, index)
+    try:
+        f = await asyncio.to_thread(open, chunk_path, "wb")
+    except FileNotFoundError:
+        return {"success": False, "error": "Arquivo parcial do upload não encontrado", "conflict": True}
+    try:
+        try:
+            async for piece in body:
+                received += len(piece)
+                if received > expected:
+                    return {"success": False, "error": f"Parte {index} maior que {expected} bytes"}
+                buffer += piece
+                if len(buffer) >= _WRITE_BUFFER_BYTES:
+                    await asyncio.to_thread(_append, f, bytes(buffer), digest)
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(_append, f, bytes(buffer), digest)
+        finally:
+            await asyncio.to_thread(f.close)
+
+        if received != expected:
+            return {"success": False, "error": f"Parte {index} tem {received} bytes, esperado {expected}"}
+        chunk_sha256 = digest.hexdigest()
+        if sha256 and sha256.lower() != chunk_sha256:
+            return {"success": False, "error": f"SHA-256 da parte {index} ({chunk_sha256}) difere do informado"}
+        count = await asyncio.to_thread(_splice_chunk, dataset, index, chunk_path, received, chunk_sha256)
+    finally:
+        try:
+            await asyncio.to_thread(os.remove, chunk_path)
+        except FileNotFoundError:
+            pass
+    if count is None:
+        return {"success": False, "error": "Upload já concluído", "conflict": True}
+    return {
+        "success": True,
+        "index": index,
+        "size_bytes": received,
+        "sha256": chunk_sha256,
+        "received_count": count,
+        "chunk_count": chunk_count(dataset),
+    }
+
+
+def dataset_references(params: Optional[dict]) -> Dict[str, int]:
+    """Run parameters that refer to a dataset ("dataset:<id>"), by name."""
+    references = {}
+    for key, value in (params or {}).items():
+        match = DATASET_REFERENCE.match(value) if isinstance(value, str) else None
+        if match:
+            references[key] = int(match.group(1))
+    return references
+
+
+def _check_references(params: Optional[dict], project_id: int) -> Optional[str]:
+    references = dataset_references(params)
+    if not references:
+        return None
+    with Session(engine) as session:
+        datasets = {
+            dataset.id: dataset for dataset in session.exec(
+                select(Dataset).where(Dataset.id.in_(set(references.values())))
+            ).all()
+        }
+    for key, dataset_id in references.items():
+        dataset = datasets.get(dataset_id)
+        if dataset is None or dataset.project_id != project_id:
+            return f"Parâmetro '{key}': dataset {dataset_id} não encontrado neste projeto"
+        if dataset.status != "ready":
+            return f"Parâmetro '{key}': upload do dataset {dataset_id} não foi concluído"
+    return None
+
+
+async def check_dataset_params(params: Optional[dict], project_id: int) -> Optional[str]:
+    """None when every dataset a run refers to is ready in the project, otherwise why not."""
+    return await asyncio.to_thread(_check_references, params, project_id)
+
+
+def _stage(dataset: Dataset, launch_dir: str) -> str:
+    source = blob_path(dataset.sha256)
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Conteúdo do dataset {dataset.id} não encontrado no armazenamento")
+    target_dir = os.path.join(launch_dir, STAGED_INPUTS_DIRNAME, str(dataset.id))
+    target = os.path.join(target_dir, dataset.filename)
+    try:
+        if os.path.samefile(source, target):
+            return target
+    except FileNotFoundError:
+        pass
+    os.makedirs(target_dir, exist_ok=True)
+    tmp = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.link(source, tmp)
+    except OSError:
+        # Store on another filesystem (or no hard links there)
+        os.symlink(source, tmp)
+    os.replace(tmp, target)
+    return target
+
+
+def _staged_dataset_ids(launch_dir: str) -> Set[int]:
+    try:
+        names = os.listdir(os.path.join(launch_dir, STAGED_INPUTS_DIRNAME))
+    except OSError:
+        return set()
+    return {int(name) for name in names if name.isdigit()}
+
+
+def remove_staged_inputs(launch_dir: str, dataset_ids: Optional[Iterable[int]] = None) -> int:
+    """Remove the datasets staged in `launch_dir` (all of them by default); returns how many."""
+    staged = _staged_dataset_ids(launch_dir)
+    if dataset_ids is not None:
+        staged &= set(dataset_ids)
+    for dataset_id in staged:
+        shutil.rmtree(os.path.join(launch_dir, STAGED_INPUTS_DIRNAME, str(dataset_id)), ignore_errors=True)
+    return len(staged)
+
+
+def prune_staged_inputs(launch_dir: str) -> int:
+    """Remove the datasets staged in `launch_dir` that were deleted since; returns how many."""
+    staged = _staged_dataset_ids(launch_dir)
+    if not staged:
+        return 0
+    with Session(engine) as session:
+        existing = set(session.exec(select(Dataset.id).where(Dataset.id.in_(staged))).all())
+    return remove_staged_inputs(launch_dir, staged - existing)
+
+
+def staged_inputs_size(launch_dir: str) -> int:
+    """
+    Bytes of the files staged in `launch_dir` that are their content's only
+    copy. Links that share their inode with the dataset store cost nothing
+    here; once the blob is gone (dataset deleted) the link alone keeps the
+    content on disk.
+    """
+    total = 0
+    for root, _, files in os.walk(os.path.join(launch_dir, STAGED_INPUTS_DIRNAME)):
+        for name in files:
+            try:
+                info = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if S_ISREG(info.st_mode) and info.st_nlink == 1:
+                total += info.st_size
+    return total
+
+
+def stage_dataset_params(params: dict, launch_dir: str) -> dict:
+    """
+    Replace "dataset:<id>" parameters by the path of the dataset staged in
+    `launch_dir`.
+
+    Datasets are hard-linked (symlinked across filesystems), never copied.
+    They are staged at the same path for every run of a pipeline, so
+    Nextflow's task cache still matches when a later run resumes.
+    """
+    references = dataset_references(params)
+    if not references:
+        return params
+    with Session(engine) as session:
+        datasets = {
+            dataset.id: dataset for dataset in session.exec(
+                select(Dataset).where(Dataset.id.in_(set(references.values())))
+            ).all()
+        }
+    staged = dict(params)
+    for key, dataset_id in references.items():
+        dataset = datasets.get(dataset_id)
+        if dataset is None or dataset.status != "ready":
+            raise LookupError(f"Dataset {dataset_id} (parâmetro '{key}') não está disponível")
+        staged[key] = _stage(dataset, launch_dir)
+    return staged
+
+
+def expire_uploads(max_age_hours: float = DATASET_UPLOAD_TTL_HOURS) -> int:
+    """Delete uploads that received no chunk for `max_age_hours`; returns how many."""
+    if max_age_hours <= 0:
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    with Session(engine) as session:
+        uploads = session.exec(
+            select(Dataset.id, Dataset.project_id, Dataset.created_at)
+            .where(Dataset.status.in_(("uploading", "completing")))
+        ).all()
+    expired = 0
+    for dataset_id, project_id, created_at in uploads:
+        try:
+            last_write = os.path.getmtime(_upload_path(dataset_id))
+        except FileNotFoundError:
+            last_write = created_at.replace(tzinfo=timezone.utc).timestamp()
+        if last_write < cutoff and _delete_dataset(project_id, dataset_id):
+            expired += 1
+    return expired
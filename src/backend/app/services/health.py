@@ -0,0 +1,89 @@
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import text
+from sqlmodel import Session, select, func
+from ..database import engine, PipelineRun
+from .scheduler import scheduler, EXECUTION_BACKEND, LEASE_SECONDS
+
+# The queue is reported as stalled when the oldest pending run has waited
+# this long while nothing is running
+QUEUE_STALL_SECONDS = float(os.getenv("HEALTH_QUEUE_STALL_SECONDS", "300"))
+
+
+def check_database() -> dict:
+    try:
+        with Session(engine) as session:
+            session.exec(text("SELECT 1")).one()
+        return {"status": "ok", "url": engine.url.render_as_string(hide_password=True)}
+    except Exception as e:
+        return {"status": "error", "error": f"{type(e).__name__}: {str(e)}"}
+
+
+def check_nextflow() -> dict:
+    path = shutil.which("nextflow")
+    if path is None:
+        return {"status": "error", "error": "nextflow not found on PATH"}
+    if not os.access(path, os.X_OK):
+        return {"status": "error", "path": path, "error": "nextflow is not executable"}
+    return {"status": "ok", "path": path}
+
+
+def check_queue() -> dict:
+    """Queue depth and whether runs are being picked up."""
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        pending = session.exec(
+            select(func.count(), func.min(PipelineRun.queued_at)).where(PipelineRun.status == "pending")
+        ).one()
+        running, last_heartbeat = session.exec(
+            select(func.count(), func.max(PipelineRun.heartbeat_at)).where(PipelineRun.status == "running")
+        ).one()
+    depth, oldest_queued_at = pending
+    oldest_wait: Optional[float] = (now - oldest_queued_at).total_seconds() if oldest_queued_at else None
+
+    status = "ok"
+    problems = []
+    if EXECUTION_BACKEND == "local" and not scheduler.is_started:
+        status = "error"
+        problems.append("scheduler is not running")
+    if running and last_heartbeat and now - last_heartbeat > timedelta(seconds=LEASE_SECONDS):
+        status = "degraded"
+        problems.append("no heartbeat from running runs within the lease")
+    if depth and not running and oldest_wait is not None and oldest_wait > QUEUE_STALL_SECONDS:
+        status = "degraded"
+        problems.append("queued runs are not being picked up")
+
+    result = {
+        "status": status,
+        "backend": EXECUTION_BACKEND,
+        "pending": depth,
+        "running": running,
+        "oldest_pending_seconds": round(oldest_wait, 1) if oldest_wait is not None else None,
+    }
+    if problems:
+        result["problems"] = problems
+    return result
+
+
+def check_health() -> dict:
+    """
+    Readiness of the components the API depends on.
+
+    The overall status is "error" when the database is unreachable (the
+    API cannot serve anything), "degraded" when runs cannot execute, and
+    "ok" otherwise.
+    """
+    components = {"database": check_database()}
+    if components["database"]["status"] == "ok":
+        components["queue"] = check_queue()
+    components["nextflow_engine"] = check_nextflow()
+
+    if components["database"]["status"] != "ok":
+        status = "error"
+    elif any(component["status"] != "ok" for component in components.values()):
+        status = "degraded"
+    else:
+        status = "ok"
+    return {"status": status, "components": components}
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Set
+from .metrics import CACHE_REQUESTS
+
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../cache/llm_cache.db"))
+)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Minimum Jaccard similarity of character trigrams for a similarity hit;
+# 0 disables the similarity tier
+LLM_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("LLM_CACHE_SIMILARITY_THRESHOLD", "0"))
+# Similarity lookups only compare against this many recent entries
+LLM_CACHE_SIMILARITY_CANDIDATES = int(os.getenv("LLM_CACHE_SIMILARITY_CANDIDATES", "500"))
+
+
+def normalize_prompt(text: str) -> str:
+    """Case-fold and collapse whitespace so trivial edits hit the same entry."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache for LLM responses, persisted in SQLite.
+
+    The exact tier is keyed by SHA-256 of (kind, model, template version,
+    normalized prompt). The optional similarity tier compares character
+    trigrams of the normalized prompt against recent entries of the same
+    kind/model/template and returns the closest one above the threshold.
+    Entries expire after the TTL and the oldest-used ones are evicted
+    beyond the maximum entry count.
+    """
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        similarity_threshold: float = LLM_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.counters: Counter = Counter()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_llm_cache_namespace ON llm_cache (namespace, last_access);
+            """)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _namespace(kind: str, model_name: str, template_version: str) -> str:
+        return f"{kind}|{model_name}|{template_version}"
+
+    def _key(self, namespace: str, normalized: str) -> str:
+        return hashlib.sha256(f"{namespace}|{normalized}".encode("utf-8")).hexdigest()
+
+    def get(
+        self,
+        kind: str,
+        model_name: str,
+        template_version: str,
+        prompt: str,
+        allow_similar: bool = True,
+    ) -> Optional[dict]:
+        """
+        Return the cached response dict, or None on a miss.
+
+        `allow_similar=False` restricts the lookup to the exact tier (for
+        inputs such as scripts, where "almost the same" is not the same).
+        """
+        namespace = self._namespace(kind, model_name, template_version)
+        normalized = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT key, response FROM llm_cache WHERE key = ? AND created_at > ?",
+                (self._key(namespace, normalized), now - self.ttl_seconds)
+            ).fetchone()
+            tier = "exact"
+
+            if row is None and allow_similar and self.similarity_threshold > 0:
+                row = self._similar(db, namespace, normalized, now)
+                tier = "similar"
+
+            if row is None:
+                self.counters[f"{kind}.miss"] += 1
+                CACHE_REQUESTS.inc(cache=f"llm_{kind}", result="miss")
+                return None
+
+            db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, row[0]))
+            db.commit()
+            self.counters[f"{kind}.hit_{tier}"] += 1
+            CACHE_REQUESTS.inc(cache=f"llm_{kind}", result=f"hit_{tier}")
+            return json.loads(row[1])
+
+    def _similar(self, db: sqlite3.Connection, namespace: str, normalized: str, now: float):
+        query = _trigrams(normalized)
+        candidates = db.execute(
+            "SELECT key, response, prompt FROM llm_cache "
+            "WHERE namespace = ? AND created_at > ? ORDER BY last_access DESC LIMIT ?",
+            (namespace, now - self.ttl_seconds, LLM_CACHE_SIMILARITY_CANDIDATES)
+        ).fetchall()
+        best, best_score = None, self.similarity_threshold
+        for key, response, prompt in candidates:
+            score = _jaccard(query, _trigrams(prompt))
+            if score >= best_score:
+                best, best_score = (key, response), score
+        return best
+
+    def put(self, kind: str, model_name: str, template_version: str, prompt: str, response: dict):
+        namespace = self._namespace(kind, model_name, template_version)
+        normalized = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, namespace, prompt, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(namespace, normalized), namespace, normalized,
+                 json.dumps(response, ensure_ascii=False), now, now)
+            )
+            self._evict(db, now)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        db.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+        db.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self) -> Dict[str, object]:
+        """Hit/miss counters per kind and tier, plus the overall hit ratio."""
+        hits = sum(v for k, v in self.counters.items() if ".hit_" in k)
+        misses = sum(v for k, v in self.counters.items() if k.endswith(".miss"))
+        total = hits + misses
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "counters": dict(self.counters),
+        }
+
+
+llm_cache = LLMResponseCache()
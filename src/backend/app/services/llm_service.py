@@ -1,15 +1,88 @@
+import asyncio
 import os
-import google.generativeai as genai
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
+from .llm_cache import llm_cache
+from .metrics import track_upstream
 
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Using gemini-2.5-flash (stable, 1M tokens)
+MODEL_NAME = 'models/gemini-2.5-flash'
 
-# Initialize model - Using gemini-2.5-flash (stable, 1M tokens)
-model = genai.GenerativeModel('models/gemini-2.5-flash')
+# Built on first use by get_model(): importing the Gemini SDK takes most of
+# a second, which processes that never chat should not pay at startup
+model = None
+
+def get_model():
+    """Configure the Gemini SDK and create the model on first use."""
+    global model
+    if model is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        model = genai.GenerativeModel(MODEL_NAME)
+    return model
+
+async def _get_model_async():
+    """`get_model` without blocking the event loop on the SDK import."""
+    if model is None:
+        await asyncio.to_thread(get_model)
+    return model
+
+# Bump when a prompt template changes so cached responses are not reused
+PIPELINE_PROMPT_VERSION = "1"
+VALIDATION_PROMPT_VERSION = "1"
+
+# Per-call timeout and maximum number of Gemini calls in flight
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+_llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+@asynccontextmanager
+async def _llm_slot():
+    """
+    Hold one of the LLM_MAX_CONCURRENCY slots.
+    
+    Waiting for the slot counts towards LLM_TIMEOUT_SECONDS: this yields
+    the seconds left for the call itself, and raises asyncio.TimeoutError
+    when no slot frees up in time.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LLM_TIMEOUT_SECONDS
+    await asyncio.wait_for(_llm_semaphore.acquire(), timeout=LLM_TIMEOUT_SECONDS)
+    try:
+        yield max(0.0, deadline - loop.time())
+    finally:
+        _llm_semaphore.release()
+
+async def _generate(prompt: str):
+    """
+    Call Gemini through the SDK's async API so the event loop is never blocked.
+    
+    Calls beyond LLM_MAX_CONCURRENCY wait for a free slot; each call,
+    including that wait, is bounded by LLM_TIMEOUT_SECONDS and stops if
+    the caller is cancelled.
+    """
+    llm = await _get_model_async()
+    async with _llm_slot() as remaining:
+        with track_upstream("gemini"):
+            return await asyncio.wait_for(
+                llm.generate_content_async(prompt, request_options={"timeout": remaining}),
+                timeout=remaining
+            )
+
+async def _send_chat_message(message: str, history: list):
+    """Async chat turn, with the same limits as `_generate`."""
+    llm = await _get_model_async()
+    async with _llm_slot() as remaining:
+        chat = llm.start_chat(history=history)
+        with track_upstream("gemini"):
+            return await asyncio.wait_for(
+                chat.send_message_async(message, request_options={"timeout": remaining}),
+                timeout=remaining
+            )
 
 PIPELINE_GENERATION_PROMPT = """You are an expert bioinformatics engineer specializing in Nextflow pipeline development.
 
@@ -27,6 +100,55 @@ User's experiment description:
 
 Generate the complete Nextflow pipeline script:"""
 
+async def _close_stream(response):
+    """Stop an upstream streaming generation that is no longer consumed."""
+    # The SDK exposes no public cancel; close the underlying stream so
+    # Gemini stops generating tokens nobody will read.
+    iterator = getattr(response, "_iterator", None)
+    if hasattr(iterator, "aclose"):
+        await iterator.aclose()
+    elif hasattr(iterator, "cancel"):
+        iterator.cancel()
+
+async def _stream_text(start) -> AsyncIterator[str]:
+    """
+    Yield text chunks from a streaming Gemini call.
+    
+    `start` is the coroutine returned by `generate_content_async(...,
+    stream=True)` or `send_message_async(..., stream=True)`. The wait for
+    a slot plus the first chunk must fit in LLM_TIMEOUT_SECONDS, and each
+    later chunk must arrive within it. Closing this generator (e.g. on
+    client disconnect) closes the upstream stream.
+    """
+    try:
+        async with _llm_slot() as remaining:
+            # Streams are timed to the first response, not to the last token
+            with track_upstream("gemini_stream"):
+                response = await asyncio.wait_for(start, timeout=remaining)
+            chunks = response.__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=LLM_TIMEOUT_SECONDS)
+                    except StopAsyncIteration:
+                        break
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunk without text parts (e.g. safety metadata only)
+                        continue
+                    if text:
+                        yield text
+            finally:
+                await _close_stream(response)
+    finally:
+        # Never started when no slot freed up in time (no-op otherwise)
+        start.close()
+
+def _require_api_key():
+    if not os.getenv("GEMINI_API_KEY"):
+        raise RuntimeError("❌ GEMINI_API_KEY não configurada. Configure no arquivo .env do backend.")
+
 async def generate_pipeline_from_description(description: str) -> dict:
     """
     Generate a Nextflow pipeline script from natural language description.
@@ -47,10 +169,17 @@ async def generate_pipeline_from_description(description: str) -> dict:
                 "success": False
             }
         
+        cached = await asyncio.to_thread(
+            llm_cache.get, "pipeline", MODEL_NAME, PIPELINE_PROMPT_VERSION, description
+        )
+        if cached:
+            print(f"[LLM] Cache hit for: {description[:50]}...")
+            return cached
+        
         prompt = PIPELINE_GENERATION_PROMPT.format(description=description)
         print(f"[LLM] Generating pipeline for: {description[:50]}...")
         
-        response = model.generate_content(prompt)
+        response = await _generate(prompt)
         
         # Check if response was blocked
         if not response.text:
@@ -63,11 +192,22 @@ async def generate_pipeline_from_description(description: str) -> dict:
         script = response.text
         print(f"[LLM] Pipeline generated successfully ({len(script)} chars)")
         
-        return {
+        result = {
             "script": script,
             "explanation": "✅ Pipeline Nextflow gerado com sucesso!",
             "success": True
         }
+        await asyncio.to_thread(
+            llm_cache.put, "pipeline", MODEL_NAME, PIPELINE_PROMPT_VERSION, description, result
+        )
+        return result
+    except asyncio.TimeoutError:
+        print(f"[LLM ERROR] Timeout after {LLM_TIMEOUT_SECONDS}s")
+        return {
+            "script": "",
+            "explanation": f"⏱️ Tempo limite de {LLM_TIMEOUT_SECONDS:.0f}s excedido ao gerar o pipeline. Tente novamente.",
+            "success": False
+        }
     except Exception as e:
         print(f"[LLM ERROR] {type(e).__name__}: {str(e)}")
         return {
@@ -92,18 +232,106 @@ async def chat_with_ai(message: str, context: Optional[list] = None) -> str:
         if not api_key:
             return "❌ GEMINI_API_KEY não configurada. Configure no arquivo .env do backend."
         
-        # Start a chat session
-        chat = model.start_chat(history=context or [])
-        response = chat.send_message(message)
+        response = await _send_chat_message(message, context or [])
         
         if not response.text:
             return "⚠️ Resposta vazia da API. Tente novamente."
         
         return response.text
+    except asyncio.TimeoutError:
+        print(f"[CHAT ERROR] Timeout after {LLM_TIMEOUT_SECONDS}s")
+        return f"⏱️ Tempo limite de {LLM_TIMEOUT_SECONDS:.0f}s excedido. Tente novamente."
     except Exception as e:
         print(f"[CHAT ERROR] {type(e).__name__}: {str(e)}")
         return f"❌ Erro: {type(e).__name__} - {str(e)}"
 
+async def send_chat_turn(message: str, history: list) -> str:
+    """
+    One chat turn over an explicit Gemini history.
+    
+    Unlike `chat_with_ai`, failures raise instead of being returned as
+    text, so callers that persist the conversation can tell them apart.
+    """
+    _require_api_key()
+    response = await _send_chat_message(message, history)
+    if not response.text:
+        raise ValueError("Resposta vazia da API")
+    return response.text
+
+CONVERSATION_SUMMARY_PROMPT = """You maintain the running summary of a conversation between a user and a bioinformatics assistant.
+
+Merge the previous summary and the new turns below into one updated summary. Keep facts the user stated, decisions, names of organisms, genes, proteins, tools, files and parameters, and questions still open. Drop greetings and repetition. Write in the language of the conversation, as plain prose, in at most {max_words} words.
+
+Previous summary:
+{previous_summary}
+
+New turns:
+{turns}
+"""
+
+async def summarize_conversation(previous_summary: Optional[str], turns: list, max_words: int) -> str:
+    """
+    Fold conversation turns into a running summary.
+    
+    Args:
+        previous_summary: Summary of the turns folded earlier, if any
+        turns: (role, content) pairs, oldest first
+        max_words: Length limit given to the model
+        
+    Returns:
+        The updated summary; raises on API errors
+    """
+    _require_api_key()
+    prompt = CONVERSATION_SUMMARY_PROMPT.format(
+        max_words=max_words,
+        previous_summary=previous_summary or "(none)",
+        turns="\n\n".join(f"{role}: {content}" for role, content in turns)
+    )
+    response = await _generate(prompt)
+    if not response.text:
+        raise ValueError("Resposta vazia da API")
+    return response.text.strip()
+
+async def stream_pipeline_from_description(description: str) -> AsyncIterator[str]:
+    """
+    Stream a generated Nextflow pipeline script as it is produced.
+    
+    Args:
+        description: User's experiment description
+        
+    Yields:
+        Text chunks of the script
+    """
+    _require_api_key()
+    prompt = PIPELINE_GENERATION_PROMPT.format(description=description)
+    print(f"[LLM] Streaming pipeline for: {description[:50]}...")
+    llm = await _get_model_async()
+    start = llm.generate_content_async(
+        prompt, stream=True, request_options={"timeout": LLM_TIMEOUT_SECONDS}
+    )
+    async for text in _stream_text(start):
+        yield text
+
+async def stream_chat_with_ai(message: str, context: Optional[list] = None) -> AsyncIterator[str]:
+    """
+    Stream the AI assistant's reply token by token.
+    
+    Args:
+        message: User message
+        context: Conversation history (optional)
+        
+    Yields:
+        Text chunks of the reply
+    """
+    _require_api_key()
+    llm = await _get_model_async()
+    chat = llm.start_chat(history=context or [])
+    start = chat.send_message_async(
+        message, stream=True, request_options={"timeout": LLM_TIMEOUT_SECONDS}
+    )
+    async for text in _stream_text(start):
+        yield text
+
 async def validate_nextflow_script(script: str) -> dict:
     """
     Validate Nextflow script syntax using AI.
@@ -129,13 +357,56 @@ ISSUES: list of issues or "none"
 SUGGESTIONS: list of suggestions"""
 
     try:
-        response = model.generate_content(validation_prompt)
-        return {
+        cached = await asyncio.to_thread(
+            llm_cache.get, "validation", MODEL_NAME, VALIDATION_PROMPT_VERSION, script, False
+        )
+        if cached:
+            return cached
+        
+        response = await _generate(validation_prompt)
+        result = {
             "validation": response.text,
             "success": True
         }
+        await asyncio.to_thread(
+            llm_cache.put, "validation", MODEL_NAME, VALIDATION_PROMPT_VERSION, script, result
+        )
+        return result
+    except asyncio.TimeoutError:
+        return {
+            "validation": f"Error: timeout after {LLM_TIMEOUT_SECONDS:.0f}s",
+            "success": False
+        }
     except Exception as e:
         return {
             "validation": f"Error: {str(e)}",
             "success": False
         }
+
+def parse_validation_response(validation_text: str) -> dict:
+    """
+    Parse the VALID / ISSUES / SUGGESTIONS format requested by
+    `validate_nextflow_script`.
+    
+    Returns:
+        dict with 'is_valid' (None if the answer had no VALID line),
+        'issues' and 'suggestions'
+    """
+    result = {"is_valid": None, "issues": [], "suggestions": []}
+    current = None
+    for raw_line in validation_text.splitlines():
+        line = raw_line.strip().lstrip("*#").strip()
+        upper = line.upper()
+        if upper.startswith("VALID:"):
+            result["is_valid"] = line.split(":", 1)[1].strip().lower().startswith("yes")
+            current = None
+            continue
+        if upper.startswith("ISSUES:") or upper.startswith("SUGGESTIONS:"):
+            current = "issues" if upper.startswith("ISSUES:") else "suggestions"
+            line = line.split(":", 1)[1].strip()
+        if current is None or not line:
+            continue
+        item = line.lstrip("-*•0123456789.) ").strip()
+        if item and item.lower() != "none":
+            result[current].append(item)
+    return result
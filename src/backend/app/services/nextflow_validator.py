@@ -0,0 +1,235 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# Names that may be called inside a workflow without being defined in the
+# script (Nextflow/Groovy built-ins and channel factories)
+BUILTIN_CALLS = {
+    "Channel", "channel", "file", "files", "path", "val", "tuple", "env", "stdin", "stdout",
+    "println", "print", "printf", "log", "error", "exit", "assert", "sleep",
+    "if", "else", "for", "while", "switch", "catch", "return", "def", "new", "when",
+    "params", "workflow", "include", "groupKey", "branchCriteria", "multiMapCriteria",
+    "sendMail", "checkIf", "tap", "set", "map", "collect", "each",
+}
+
+SECTION_RE = re.compile(r"^\s*(input|output|script|shell|exec|when|stub)\s*:", re.MULTILINE)
+PROCESS_RE = re.compile(r"\bprocess\s+([A-Za-z_]\w*)\s*\{")
+WORKFLOW_RE = re.compile(r"\bworkflow(?:\s+([A-Za-z_]\w*))?\s*\{")
+FUNCTION_RE = re.compile(r"\bdef\s+(?:[\w<>\[\], ]+\s+)?([A-Za-z_]\w*)\s*\(")
+INCLUDE_RE = re.compile(r"\binclude\s*\{([^}]*)\}")
+CALL_RE = re.compile(r"(?<![\w.$])([A-Za-z_]\w*)\s*\(")
+OUT_REF_RE = re.compile(r"(?<![\w.$])([A-Za-z_]\w*)\.out\b")
+ASSIGN_RE = re.compile(r"(?<![\w.$])([A-Za-z_]\w*)\s*=(?!=)")
+SET_RE = re.compile(r"\.set\s*\{\s*([A-Za-z_]\w*)\s*\}")
+DSL1_RE = re.compile(r"nextflow\.enable\.dsl\s*=\s*1\b")
+
+OPENERS = {"{": "}", "(": ")", "[": "]"}
+CLOSERS = {v: k for k, v in OPENERS.items()}
+
+
+def _issue(severity: str, code: str, message: str, line: Optional[int] = None) -> dict:
+    return {"severity": severity, "code": code, "message": message, "line": line}
+
+
+def _strip_code(script: str) -> Tuple[str, List[dict]]:
+    """
+    Blank out comments and string literals, keeping offsets and newlines.
+
+    Braces inside strings (e.g. `${var}` in a script block) or comments must
+    not count towards block balance, and section labels or calls inside a
+    shell script must not be mistaken for Nextflow code.
+    """
+    out = list(script)
+    issues = []
+    i, n = 0, len(script)
+
+    def blank(start: int, end: int):
+        for k in range(start, min(end, n)):
+            if out[k] != "\n":
+                out[k] = " "
+
+    while i < n:
+        ch = script[i]
+        if script.startswith("//", i):
+            end = script.find("\n", i)
+            end = n if end == -1 else end
+            blank(i, end)
+            i = end
+        elif script.startswith("/*", i):
+            end = script.find("*/", i + 2)
+            if end == -1:
+                issues.append(_issue("error", "unclosed-comment", "Unclosed block comment",
+                                     script.count("\n", 0, i) + 1))
+                end = n
+            else:
+                end += 2
+            blank(i, end)
+            i = end
+        elif script.startswith('"""', i) or script.startswith("'''", i):
+            quote = script[i:i + 3]
+            end = script.find(quote, i + 3)
+            if end == -1:
+                issues.append(_issue("error", "unclosed-string", f"Unclosed {quote} string",
+                                     script.count("\n", 0, i) + 1))
+                end = n
+            else:
+                end += 3
+            blank(i + 3, end - 3 if end != n else n)
+            i = end
+        elif ch in ("'", '"'):
+            j = i + 1
+            while j < n and script[j] != ch and script[j] != "\n":
+                j += 2 if script[j] == "\\" else 1
+            if j >= n or script[j] == "\n":
+                issues.append(_issue("error", "unclosed-string", f"Unclosed {ch} string",
+                                     script.count("\n", 0, i) + 1))
+            blank(i + 1, j)
+            i = j + 1
+        else:
+            i += 1
+    return "".join(out), issues
+
+
+def _match_brackets(code: str) -> Tuple[Dict[int, int], List[dict]]:
+    """Map each opening bracket offset to its closing offset and report imbalance."""
+    pairs: Dict[int, int] = {}
+    issues = []
+    stack: List[Tuple[str, int]] = []
+    line = 1
+    for pos, ch in enumerate(code):
+        if ch == "\n":
+            line += 1
+        elif ch in OPENERS:
+            stack.append((ch, pos))
+        elif ch in CLOSERS:
+            if not stack:
+                issues.append(_issue("error", "unbalanced-block", f"Unexpected '{ch}'", line))
+                continue
+            opener, start = stack.pop()
+            if opener != CLOSERS[ch]:
+                issues.append(_issue(
+                    "error", "unbalanced-block",
+                    f"'{opener}' opened on line {code.count(chr(10), 0, start) + 1} closed by '{ch}'", line
+                ))
+            pairs[start] = pos
+    for opener, start in stack:
+        issues.append(_issue("error", "unbalanced-block", f"'{opener}' is never closed",
+                             code.count("\n", 0, start) + 1))
+    return pairs, issues
+
+
+def _blocks(regex: re.Pattern, code: str, pairs: Dict[int, int]):
+    """Yield (name, body, body_offset, line) for each `keyword name {...}` block."""
+    for match in regex.finditer(code):
+        open_pos = match.end() - 1
+        close_pos = pairs.get(open_pos, len(code))
+        yield (
+            match.group(1),
+            code[open_pos + 1:close_pos],
+            open_pos + 1,
+            code.count("\n", 0, match.start()) + 1,
+        )
+
+
+def analyze_nextflow_script(script: str) -> dict:
+    """
+    Statically check a Nextflow DSL2 script without running Nextflow.
+
+    Detects unbalanced blocks, unclosed strings/comments, processes without
+    a script or output section or container, calls to undefined processes
+    or workflows, and references to undefined channels.
+
+    Args:
+        script: Nextflow script content
+
+    Returns:
+        dict with `is_valid` (no errors), `issues` (severity, code, message,
+        line) and a small `summary` of what was found
+    """
+    if not script or not script.strip():
+        return {
+            "is_valid": False,
+            "issues": [_issue("error", "empty-script", "Script is empty")],
+            "summary": {"processes": [], "workflows": []},
+        }
+
+    code, issues = _strip_code(script)
+    pairs, bracket_issues = _match_brackets(code)
+    issues.extend(bracket_issues)
+
+    if DSL1_RE.search(code):
+        issues.append(_issue("warning", "dsl1", "Script enables DSL1; only DSL2 is supported"))
+
+    processes = list(_blocks(PROCESS_RE, code, pairs))
+    workflows = list(_blocks(WORKFLOW_RE, code, pairs))
+
+    defined: Set[str] = set(BUILTIN_CALLS)
+    defined.update(name for name, *_ in processes)
+    defined.update(name for name, *_ in workflows if name)
+    defined.update(FUNCTION_RE.findall(code))
+    for included in INCLUDE_RE.findall(code):
+        for part in included.split(";"):
+            tokens = part.split()
+            if tokens:
+                # `include { FOO as BAR }` defines BAR
+                defined.add(tokens[-1])
+    process_names = {name for name, *_ in processes}
+    callable_names = defined - BUILTIN_CALLS
+
+    seen = set()
+    for name, body, _, line in processes:
+        if name in seen:
+            issues.append(_issue("error", "duplicate-process", f"Process '{name}' is defined more than once", line))
+        seen.add(name)
+
+        sections = set(SECTION_RE.findall(body))
+        # Without a label, the trailing string literal is the script
+        has_script = bool(sections & {"script", "shell", "exec"}) or '"""' in body or "'''" in body
+        if not has_script:
+            issues.append(_issue("error", "missing-script", f"Process '{name}' has no script:, shell: or exec: section", line))
+        if "output" not in sections:
+            issues.append(_issue("warning", "missing-output", f"Process '{name}' has no output: section", line))
+        if not re.search(r"^\s*(container|conda)\b", body, re.MULTILINE):
+            issues.append(_issue("warning", "missing-container", f"Process '{name}' does not declare a container", line))
+
+    if processes and not any(name is None for name, *_ in workflows):
+        issues.append(_issue("warning", "no-entry-workflow", "Script has no entry workflow { } block"))
+
+    for _, body, offset, _ in workflows:
+        assigned = set(ASSIGN_RE.findall(body)) | set(SET_RE.findall(body))
+        take = re.search(r"^\s*take\s*:(.*?)(?=^\s*(?:main|emit)\s*:|\Z)", body, re.MULTILINE | re.DOTALL)
+        if take:
+            assigned.update(re.findall(r"[A-Za-z_]\w*", take.group(1)))
+
+        for match in CALL_RE.finditer(body):
+            called = match.group(1)
+            line = code.count("\n", 0, offset + match.start()) + 1
+            if called not in defined and called not in assigned:
+                issues.append(_issue("error", "undefined-process", f"Call to undefined process or workflow '{called}'", line))
+                continue
+            if called not in callable_names:
+                continue
+            # Bare identifiers passed to a process must be known channels
+            args_start = offset + match.end() - 1
+            args_end = pairs.get(args_start)
+            if args_end is None:
+                continue
+            for arg in code[args_start + 1:args_end].split(","):
+                arg = arg.strip()
+                if re.fullmatch(r"[A-Za-z_]\w*", arg) and arg not in assigned and arg not in defined:
+                    issues.append(_issue("error", "undefined-channel", f"Channel '{arg}' passed to '{called}' is never defined", line))
+
+        for match in OUT_REF_RE.finditer(body):
+            ref = match.group(1)
+            if ref not in callable_names:
+                line = code.count("\n", 0, offset + match.start()) + 1
+                issues.append(_issue("error", "undefined-channel", f"'{ref}.out' refers to an undefined process", line))
+
+    issues.sort(key=lambda issue: (issue["line"] or 0, issue["severity"] != "error"))
+    return {
+        "is_valid": not any(issue["severity"] == "error" for issue in issues),
+        "issues": issues,
+        "summary": {
+            "processes": sorted(process_names),
+            "workflows": sorted(name or "<entry>" for name, *_ in workflows),
+        },
+    }
@@ -0,0 +1,162 @@
+import asyncio
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlmodel import Session
+from ..database import engine, PipelineRunProgress
+
+# How often the trace file is re-read and progress persisted
+PROGRESS_POLL_SECONDS = float(os.getenv("RUN_PROGRESS_POLL_SECONDS", "2"))
+
+FINAL_STATUSES = {"COMPLETED", "CACHED", "FAILED", "ABORTED"}
+
+
+def _to_float(value) -> float:
+    try:
+        return float(str(value).rstrip("%"))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class _RunState:
+    """Progress of one run; kept in memory only while the run is active."""
+    trace_path: str
+    trace_offset: int = 0
+    header: Optional[List[str]] = None
+    tasks: Dict[str, str] = field(default_factory=dict)  # task_id -> status
+    accounted: set = field(default_factory=set)  # tasks whose usage was added
+    cpu_seconds: float = 0.0
+    cached_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    dirty: bool = True
+
+
+class ProgressTracker:
+    """
+    Tracks task progress of active runs from Nextflow's trace file and,
+    optionally, its weblog events.
+
+    The trace file is tailed from the last byte offset read, so each poll
+    only parses new lines. Counters are persisted to `PipelineRunProgress`
+    at most once per poll interval.
+    """
+
+    def __init__(self):
+        self._runs: Dict[int, _RunState] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def start(self, run_id: int, trace_path: str):
+        self._runs[run_id] = _RunState(trace_path=trace_path)
+        self._tasks[run_id] = asyncio.create_task(self._follow(run_id))
+
+    async def finish(self, run_id: int) -> Optional[dict]:
+        """
+        Read the rest of the trace, persist final counters and forget the run.
+
+        Returns:
+            the final counters, or None if the run was not tracked
+        """
+        task = self._tasks.pop(run_id, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        state = self._runs.pop(run_id, None)
+        if state is not None:
+            self._read_trace(state)
+            # Anything still marked running when Nextflow exits was aborted
+            for task_id, status in state.tasks.items():
+                if status not in FINAL_STATUSES:
+                    state.tasks[task_id] = "ABORTED"
+            counters = self._counters(state)
+            await asyncio.to_thread(_save_progress, run_id, counters)
+            return counters
+        return None
+
+    def record_weblog_event(self, run_id: int, payload: dict):
+        """Apply a `-with-weblog` event (process_submitted/started/completed)."""
+        state = self._runs.get(run_id)
+        trace = payload.get("trace") if isinstance(payload, dict) else None
+        if state is None or not isinstance(trace, dict) or "task_id" not in trace:
+            return
+        self._apply_task(state, trace)
+
+    async def _follow(self, run_id: int):
+        while True:
+            state = self._runs.get(run_id)
+            if state is None:
+                return
+            try:
+                self._read_trace(state)
+                if state.dirty:
+                    state.dirty = False
+                    await asyncio.to_thread(_save_progress, run_id, self._counters(state))
+            except Exception as e:
+                print(f"[PROGRESS ERROR] Run {run_id}: {type(e).__name__}: {str(e)}")
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+
+    def _read_trace(self, state: _RunState):
+        if not os.path.exists(state.trace_path):
+            return
+        with open(state.trace_path, "rb") as f:
+            f.seek(state.trace_offset)
+            data = f.read()
+        # Only consume complete lines; a partial one is re-read next time
+        end = data.rfind(b"\n") + 1
+        state.trace_offset += end
+        for raw in data[:end].decode("utf-8", errors="replace").splitlines():
+            columns = raw.split("\t")
+            if state.header is None:
+                state.header = columns
+                continue
+            self._apply_task(state, dict(zip(state.header, columns)))
+
+    def _apply_task(self, state: _RunState, task: dict):
+        task_id = str(task.get("task_id"))
+        status = str(task.get("status", "SUBMITTED")).upper()
+        previous = state.tasks.get(task_id)
+        if previous in FINAL_STATUSES and status not in FINAL_STATUSES:
+            return  # Late weblog event for a task the trace already closed
+        state.tasks[task_id] = status
+        state.dirty = True
+
+        if status in FINAL_STATUSES and task_id not in state.accounted:
+            state.accounted.add(task_id)
+            # raw trace: realtime in ms, %cpu as percent, peak_rss in bytes
+            realtime_seconds = _to_float(task.get("realtime")) / 1000
+            if status == "CACHED":
+                # Usage reported for a cached task is from the run that
+                # computed it; count it as time saved, not time spent
+                state.cached_seconds += realtime_seconds
+                return
+            state.cpu_seconds += realtime_seconds * _to_float(task.get("%cpu")) / 100
+            state.peak_rss_bytes = max(state.peak_rss_bytes, int(_to_float(task.get("peak_rss"))))
+
+    @staticmethod
+    def _counters(state: _RunState) -> dict:
+        counts = Counter(state.tasks.values())
+        return {
+            "tasks_submitted": len(state.tasks),
+            "tasks_running": counts["RUNNING"],
+            "tasks_completed": counts["COMPLETED"] + counts["CACHED"],
+            "tasks_failed": counts["FAILED"] + counts["ABORTED"],
+            "tasks_cached": counts["CACHED"],
+            "cpu_seconds": round(state.cpu_seconds, 3),
+            "cached_seconds": round(state.cached_seconds, 3),
+            "peak_rss_bytes": state.peak_rss_bytes,
+        }
+
+
+def _save_progress(run_id: int, counters: dict):
+    with Session(engine) as session:
+        progress = session.get(PipelineRunProgress, run_id) or PipelineRunProgress(run_id=run_id)
+        for key, value in counters.items():
+            setattr(progress, key, value)
+        progress.updated_at = datetime.utcnow()
+        session.add(progress)
+        session.commit()
+
+
+progress_tracker = ProgressTracker()
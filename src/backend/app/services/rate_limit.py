@@ -0,0 +1,68 @@
+import asyncio
+import os
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+# Default request rate allowed against each upstream host
+UPSTREAM_RATE_PER_SECOND = float(os.getenv("UPSTREAM_RATE_PER_SECOND", "10"))
+UPSTREAM_RATE_BURST = int(os.getenv("UPSTREAM_RATE_BURST", "20"))
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    `rate` tokens are added per second up to `capacity`. `try_acquire`
+    never waits; `acquire` sleeps until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def retry_after(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` will be available."""
+        self._refill()
+        missing = tokens - self._tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+    async def acquire(self, tokens: float = 1):
+        # The lock keeps waiters in FIFO order
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.retry_after(tokens))
+
+
+class HostRateLimiter:
+    """One token bucket per upstream host."""
+
+    def __init__(self, rate: float = UPSTREAM_RATE_PER_SECOND, burst: int = UPSTREAM_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    async def acquire(self, url: str):
+        host = urlsplit(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+
+host_rate_limiter = HostRateLimiter()
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, Hashable, Optional, Tuple
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from .metrics import CACHE_REQUESTS
+
+# How long a cached resource is served without reading the database.
+# Writes made by this process invalidate it at once; writes made by other
+# processes (other uvicorn workers, `python -m app.worker`) are seen once
+# it expires
+READ_CACHE_TTL_SECONDS = float(os.getenv("READ_CACHE_TTL_SECONDS", "10"))
+# Runs change more often, and run workers update them from other processes
+READ_CACHE_RUN_TTL_SECONDS = float(os.getenv("READ_CACHE_RUN_TTL_SECONDS", "2"))
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "4096"))
+
+# Loader result: (response model, version or None to hash the body,
+# last modification or None to send no Last-Modified)
+Loaded = Tuple[BaseModel, Optional[str], Optional[datetime]]
+
+
+@dataclass
+class CachedResource:
+    body: bytes  # Serialized JSON
+    etag: str  # Quoted strong validator
+    last_modified: Optional[datetime]  # UTC, whole seconds
+    expires_at: float
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "ETag": self.etag,
+            # Browsers revalidate on every poll instead of guessing freshness
+            "Cache-Control": "no-cache",
+        }
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+
+def _utc_seconds(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def version_from_timestamp(value: datetime) -> str:
+    """Version string of a row from its `updated_at` (microseconds, hex)."""
+    return f"{int(_utc_seconds(value).timestamp()) * 1_000_000 + value.microsecond:x}"
+
+
+class ReadCache:
+    """
+    In-process read-through cache of serialized API resources.
+
+    Resources are kept as JSON with their ETag for a TTL that depends on
+    their kind, so an unchanged poll is answered (often with 304) without
+    opening a database session or serializing the row again. Code that
+    changes a resource calls `invalidate` after committing; a load that
+    overlaps an invalidation is not stored, so a stale row read before the
+    write cannot outlive it.
+    """
+
+    def __init__(self, ttl_seconds: Dict[str, float], default_ttl_seconds: float = READ_CACHE_TTL_SECONDS,
+                 max_entries: int = READ_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.default_ttl_seconds = default_ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, Hashable], CachedResource]" = OrderedDict()
+        # Bumped by every invalidation (writers run in threads too)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, cache_key: Tuple[str, Hashable]) -> Tuple[Optional[CachedResource], int]:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(cache_key)
+                    return entry, self._generation
+                del self._entries[cache_key]
+            return None, self._generation
+
+    def _store(self, kind: str, key: Hashable, loaded: Loaded, generation: int) -> CachedResource:
+        model, version, last_modified = loaded
+        body = model.model_dump_json().encode()
+        if version is None:
+            version = hashlib.blake2b(body, digest_size=8).hexdigest()
+        ttl = self.ttl_seconds.get(kind, self.default_ttl_seconds)
+        entry = CachedResource(
+            body=body,
+            etag=f'"{kind}-{key}-{version}"',
+            last_modified=_utc_seconds(last_modified) if last_modified is not None else None,
+            expires_at=time.monotonic() + ttl,
+        )
+        with self._lock:
+            if ttl > 0 and generation == self._generation:
+                self._entries[(kind, key)] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    async def fetch(self, kind: str, key: Hashable, load: Callable[[], Optional[Loaded]]) -> Optional[CachedResource]:
+        """
+        The cached resource, or the one `load` (blocking, run in a thread)
+        returns; None when it does not exist. Misses are not cached.
+        """
+        entry, generation = self._lookup((kind, key))
+        if entry is not None:
+            CACHE_REQUESTS.inc(cache=f"read_{kind}", result="hit")
+            return entry
+        CACHE_REQUESTS.inc(cache=f"read_{kind}", result="miss")
+        loaded = await asyncio.to_thread(load)
+        if loaded is None:
+            return None
+        return self._store(kind, key, loaded, generation)
+
+    def invalidate(self, kind: str, *keys: Hashable):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop((kind, key), None)
+
+    def invalidate_kind(self, kind: str):
+        with self._lock:
+            self._generation += 1
+            for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == kind]:
+                del self._entries[cache_key]
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, so validators made weak by compression still match."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(headers: Headers, resource: CachedResource) -> bool:
+    """
+    Whether a conditional GET can be answered with 304. If-None-Match takes
+    precedence over If-Modified-Since (RFC 9110).
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, resource.etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and resource.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return resource.last_modified <= since
+    return False
+
+
+def cached_response(headers: Headers, resource: CachedResource) -> Response:
+    """200 with the cached JSON, or 304 when the client's copy is current."""
+    if not_modified(headers, resource):
+        return Response(status_code=304, headers=resource.headers())
+    return Response(content=resource.body, media_type="application/json", headers=resource.headers())
+
+
+read_cache = ReadCache({"run": READ_CACHE_RUN_TTL_SECONDS})
@@ -0,0 +1,151 @@
+import asyncio
+import os
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from .runner import RUNS_DIR
+
+LOG_FILENAME = "run.log"
+
+# Upper bound for a single read from the log file
+LOG_READ_CHUNK_BYTES = 64 * 1024
+
+# Followers re-check the file at this interval even without a local
+# notification (covers runs whose output is pumped by another process)
+LOG_POLL_INTERVAL_SECONDS = float(os.getenv("RUN_LOG_POLL_INTERVAL_SECONDS", "2"))
+
+
+def run_log_path(run_id: int) -> str:
+    return os.path.join(RUNS_DIR, f"run_{run_id}", LOG_FILENAME)
+
+
+def log_size(run_id: int) -> int:
+    path = run_log_path(run_id)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class LogHub:
+    """
+    In-process notification hub for run logs.
+
+    The log itself lives on disk; the hub only wakes up followers when new
+    bytes were appended, so any number of watchers share one file and no
+    log content is kept in memory.
+    """
+
+    def __init__(self):
+        self._events: Dict[int, asyncio.Event] = {}
+        self._open: Set[int] = set()
+
+    def open(self, run_id: int):
+        self._open.add(run_id)
+
+    def is_open(self, run_id: int) -> bool:
+        return run_id in self._open
+
+    def notify(self, run_id: int):
+        event = self._events.pop(run_id, None)
+        if event is not None:
+            event.set()
+
+    def close(self, run_id: int):
+        self._open.discard(run_id)
+        self.notify(run_id)
+
+    async def wait(self, run_id: int, timeout: float):
+        event = self._events.setdefault(run_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+log_hub = LogHub()
+
+
+async def pump_process_output(stream: asyncio.StreamReader, run_id: int):
+    """
+    Copy a process' output to the run log file as it arrives.
+
+    Reading continuously keeps the pipe drained, so Nextflow never blocks
+    on a full buffer. Output is copied in chunks rather than lines (readers
+    split lines), so a line longer than the stream's limit cannot stop it.
+    """
+    path = run_log_path(run_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    log_hub.open(run_id)
+    try:
+        with open(path, "ab") as f:
+            while True:
+                data = await stream.read(LOG_READ_CHUNK_BYTES)
+                if not data:
+                    break
+                f.write(data)
+                f.flush()
+                log_hub.notify(run_id)
+    finally:
+        log_hub.close(run_id)
+
+
+def read_log_lines(
+    run_id: int,
+    offset: int = 0,
+    max_bytes: int = LOG_READ_CHUNK_BYTES,
+    include_partial: bool = False,
+) -> Tuple[List[Tuple[int, str]], int]:
+    """
+    Read complete lines from the run log starting at a byte offset.
+
+    A line longer than `max_bytes` is returned in pieces of `max_bytes`,
+    so readers always make progress.
+
+    Returns:
+        (lines, next_offset) where each line is paired with the offset just
+        after it, usable as a resume position.
+    """
+    path = run_log_path(run_id)
+    if not os.path.exists(path):
+        return [], offset
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+
+    lines = []
+    position = offset
+    # No newline within a full read: the line does not fit in max_bytes
+    oversized = len(data) >= max_bytes and b"\n" not in data
+    for raw in data.splitlines(keepends=True):
+        if not raw.endswith(b"\n") and not (include_partial or oversized):
+            break
+        position += len(raw)
+        lines.append((position, raw.rstrip(b"\r\n").decode("utf-8", errors="replace")))
+    return lines, position
+
+
+async def follow_log(
+    run_id: int,
+    offset: int,
+    is_finished,
+) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Yield (next_offset, line) pairs as they are appended to the run log.
+
+    Args:
+        run_id: Run to follow
+        offset: Byte offset to resume from
+        is_finished: Async callable returning True once the run can produce
+            no more output; checked only when the reader has caught up
+    """
+    while True:
+        lines, offset = read_log_lines(run_id, offset)
+        for item in lines:
+            yield item
+        if lines:
+            continue
+
+        if not log_hub.is_open(run_id) and await is_finished():
+            # Flush a trailing line without newline, then stop
+            lines, offset = read_log_lines(run_id, offset, include_partial=True)
+            for item in lines:
+                yield item
+            return
+        await log_hub.wait(run_id, LOG_POLL_INTERVAL_SECONDS)
@@ -1,15 +1,32 @@
 import subprocess
+import hashlib
 import os
 import uuid
-import asyncio
+from typing import Optional, Tuple
 from ..models.pipeline import PipelineRunResponse, PipelineStatus
+from .supervisor import supervisor
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../"))
 PIPELINES_DIR = os.path.join(PROJECT_ROOT, "pipelines")
 RUNS_DIR = os.path.join(PROJECT_ROOT, "runs")
+# Scripts stored by content hash, shared by every run that uses them
+SCRIPTS_DIR = os.path.join(PROJECT_ROOT, "scripts")
+# One launch directory per pipeline: holds Nextflow's task cache
+# (.nextflow/) and the shared work directory used by -resume
+WORKSPACES_DIR = os.path.join(PROJECT_ROOT, "workspaces")
 
-# Ensure runs directory exists
-os.makedirs(RUNS_DIR, exist_ok=True)
+# Trace file written by Nextflow for every run (parsed by services/progress)
+TRACE_FILENAME = "trace.txt"
+TRACE_FIELDS = "task_id,hash,name,status,exit,realtime,%cpu,peak_rss"
+
+# Base URL of this API as seen from Nextflow, e.g. http://127.0.0.1:8000.
+# When set, runs also report task events live through -with-weblog.
+NEXTFLOW_WEBLOG_URL = os.getenv("NEXTFLOW_WEBLOG_URL")
+
+def prepare_directories():
+    """Create the runs, scripts and workspaces directories (at startup)."""
+    for directory in (RUNS_DIR, SCRIPTS_DIR, WORKSPACES_DIR):
+        os.makedirs(directory, exist_ok=True)
 
 def execute_nextflow(pipeline_name: str, params: dict) -> PipelineRunResponse:
     run_id = str(uuid.uuid4())
@@ -35,53 +52,152 @@ def execute_nextflow(pipeline_name: str, params: dict) -> PipelineRunResponse:
         message=f"Pipeline execution prepared for {pipeline_name}. Command: {' '.join(cmd)}"
     )
 
-async def execute_nextflow_async(script_content: str, run_id: int, params: dict = None):
+def store_script(script_content: str) -> Tuple[str, str]:
+    """
+    Store a script under its SHA-256, writing it only once.
+    
+    Returns:
+        (script_hash, script_path)
+    """
+    data = script_content.encode("utf-8")
+    script_hash = hashlib.sha256(data).hexdigest()
+    script_path = os.path.join(SCRIPTS_DIR, f"{script_hash}.nf")
+    if not os.path.exists(script_path):
+        os.makedirs(SCRIPTS_DIR, exist_ok=True)
+        tmp_path = f"{script_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, script_path)
+    return script_hash, script_path
+
+def pipeline_workspace(pipeline_id: int) -> str:
+    return os.path.join(WORKSPACES_DIR, f"pipeline_{pipeline_id}")
+
+def read_session_id(launch_dir: str, run_name: str) -> Optional[str]:
+    """
+    Look up the Nextflow session ID of a run in the launch directory's
+    `.nextflow/history` (tab-separated; session ID is the 6th column).
+    """
+    history_path = os.path.join(launch_dir, ".nextflow", "history")
+    if not os.path.exists(history_path):
+        return None
+    with open(history_path) as f:
+        for line in reversed(f.readlines()):
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) >= 6 and columns[2] == run_name:
+                return columns[5]
+    return None
+
+async def execute_nextflow_async(
+    script_content: str,
+    run_id: int,
+    params: dict = None,
+    pipeline_id: Optional[int] = None,
+    resume_session_id: Optional[str] = None,
+    cpus: int = 1,
+    memory_gb: int = 2,
+    timeout_seconds: Optional[float] = None
+):
     """
     Execute a Nextflow script asynchronously.
     
+    Runs of the same pipeline share a launch directory and work directory,
+    so passing the session ID of a previous run as `resume_session_id`
+    lets Nextflow's task cache skip every step that already completed.
+    Results are published per run: `--outdir` is always the run's
+    `results` directory (an `outdir` in `params` is replaced).
+    
     Args:
         script_content: The Nextflow script as a string
         run_id: Unique run identifier
         params: Additional parameters
+        pipeline_id: Pipeline the run belongs to (enables the shared workspace)
+        resume_session_id: Nextflow session ID to resume
+        cpus: CPUs reserved for the run (caps Nextflow's local executor)
+        memory_gb: Memory reserved for the run in GB
+        timeout_seconds: Wall-clock limit (supervisor default if None)
     
     Returns:
-        dict with execution details
+        dict with execution details, including the `process` handle. The
+        process is owned by the supervisor: wait for it with
+        `supervisor.wait(run_id)`.
     """
-    # Create a temporary directory for this run
+    # Per-run directory for logs, trace and published results
     run_dir = os.path.join(RUNS_DIR, f"run_{run_id}")
     os.makedirs(run_dir, exist_ok=True)
     
-    # Write script to file
-    script_path = os.path.join(run_dir, "main.nf")
-    with open(script_path, 'w') as f:
-        f.write(script_content)
+    launch_dir = pipeline_workspace(pipeline_id) if pipeline_id is not None else run_dir
+    os.makedirs(launch_dir, exist_ok=True)
+    
+    script_hash, script_path = store_script(script_content)
+    
+    # Nextflow rejects a run name already in the launch directory's history.
+    # That happens when an orphaned run is launched again: resume its own
+    # session under a fresh name instead.
+    run_name = f"run_{run_id}"
+    previous_session_id = read_session_id(launch_dir, run_name)
+    if previous_session_id:
+        resume_session_id = previous_session_id
+        run_name = f"{run_name}_{uuid.uuid4().hex[:8]}"
+    
+    # Raw (unformatted) trace values so progress can be parsed reliably
+    trace_path = os.path.join(run_dir, TRACE_FILENAME)
+    config_path = os.path.join(run_dir, "ciencia.config")
+    with open(config_path, 'w') as f:
+        f.write(
+            "trace {\n"
+            "    raw = true\n"
+            "    overwrite = true\n"
+            f"    fields = '{TRACE_FIELDS}'\n"
+            "}\n"
+            # Keep the local executor within the slots the scheduler reserved
+            "executor {\n"
+            f"    cpus = {cpus}\n"
+            f"    memory = '{memory_gb} GB'\n"
+            "}\n"
+        )
     
     # Prepare command
     cmd = [
         "nextflow",
+        "-log", os.path.join(run_dir, "nextflow.log"),
+        "-c", config_path,
         "run",
         script_path,
-        "-work-dir", os.path.join(run_dir, "work"),
-        "-name", f"run_{run_id}"
+        "-work-dir", os.path.join(launch_dir, "work"),
+        "-name", run_name,
+        "-with-trace", trace_path
     ]
+    if resume_session_id:
+        cmd.extend(["-resume", resume_session_id])
+    if NEXTFLOW_WEBLOG_URL:
+        cmd.extend(["-with-weblog", f"{NEXTFLOW_WEBLOG_URL.rstrip('/')}/projects/runs/{run_id}/weblog"])
     
     # Add params if provided
-    if params:
-        for key, value in params.items():
-            cmd.extend([f"--{key}", str(value)])
+    params = dict(params or {})
+    # Always the run's own results directory: outputs are indexed and
+    # served from there, so a client-chosen path must not be published
+    params["outdir"] = os.path.join(run_dir, "results")
+    for key, value in params.items():
+        cmd.extend([f"--{key}", str(value)])
     
-    # Execute in background (non-blocking)
-    # In production, use Celery or similar
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        cwd=run_dir
+    # Execute in background (non-blocking) under the supervisor.
+    # stderr is merged into stdout so the log keeps Nextflow's own ordering;
+    # the caller must keep reading `process.stdout` (see run_logs)
+    process = await supervisor.spawn(
+        run_id, cmd, launch_dir,
+        cpus=cpus, memory_gb=memory_gb, timeout_seconds=timeout_seconds
     )
     
     return {
         "run_id": run_id,
         "run_dir": run_dir,
+        "run_name": run_name,
+        "launch_dir": launch_dir,
+        "script_hash": script_hash,
+        "resume_session_id": resume_session_id,
+        "trace_path": trace_path,
         "process_id": process.pid,
+        "process": process,
         "command": " ".join(cmd)
     }
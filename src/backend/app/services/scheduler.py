@@ -0,0 +1,529 @@
+import asyncio
+import json
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, func, update, and_, or_
+from ..database import engine, Pipeline, PipelineRun
+from .runner import execute_nextflow_async, pipeline_workspace, read_session_id
+from .datasets import stage_dataset_params
+from .run_logs import pump_process_output
+from .progress import progress_tracker
+from .workspace import index_run_outputs
+from .supervisor import supervisor, DEFAULT_RUN_TIMEOUT_SECONDS
+from .metrics import registry, Gauge
+from .read_cache import read_cache
+
+# Scheduler capacity (configurable per host)
+MAX_CONCURRENT_RUNS = int(os.getenv("RUNNER_MAX_CONCURRENT_RUNS", "2"))
+CPU_SLOTS = int(os.getenv("RUNNER_CPU_SLOTS", str(os.cpu_count() or 1)))
+MEMORY_SLOTS_GB = int(os.getenv("RUNNER_MEMORY_SLOTS_GB", "8"))
+
+# Slots reserved by a run that does not ask for specific resources
+DEFAULT_RUN_CPUS = int(os.getenv("RUNNER_DEFAULT_RUN_CPUS", "1"))
+DEFAULT_RUN_MEMORY_GB = int(os.getenv("RUNNER_DEFAULT_RUN_MEMORY_GB", "2"))
+
+# How often the queue is re-read even without a local submit (e.g. rows
+# inserted by another API process)
+POLL_INTERVAL_SECONDS = float(os.getenv("RUNNER_POLL_INTERVAL_SECONDS", "5"))
+
+# How many pending runs a dispatch looks at when some are held back
+# because another run of their pipeline is active
+CLAIM_SCAN_LIMIT = int(os.getenv("RUNNER_CLAIM_SCAN_LIMIT", "200"))
+
+# Where runs execute: "local" runs them inside the API process, "worker"
+# only queues them for `python -m app.worker` processes
+EXECUTION_BACKEND = os.getenv("RUN_EXECUTION_BACKEND", "local")
+if EXECUTION_BACKEND not in ("local", "worker"):
+    raise ValueError(f"RUN_EXECUTION_BACKEND must be 'local' or 'worker', not '{EXECUTION_BACKEND}'")
+
+# A claimed run belongs to its scheduler until the lease expires. Leases
+# are renewed every heartbeat, so the runs of a crashed worker are
+# re-queued after at most RUNNER_LEASE_SECONDS.
+LEASE_SECONDS = float(os.getenv("RUNNER_LEASE_SECONDS", "60"))
+HEARTBEAT_SECONDS = float(os.getenv("RUNNER_HEARTBEAT_SECONDS", "10"))
+
+
+class RunScheduler:
+    """
+    Durable FIFO scheduler for pipeline runs.
+
+    The queue lives in the `PipelineRun` table: every row with status
+    `pending` is waiting for slots. The scheduler only launches a run when
+    the concurrency, CPU and memory budgets all have room for it, and moves
+    it through pending -> running -> completed/failed based on the exit
+    code of the Nextflow process.
+
+    Runs of the same pipeline share a Nextflow workspace and resume the
+    previous run's session, so they are never run concurrently: a pending
+    run waits while another run of its pipeline is active.
+
+    Several schedulers (the API in "local" mode and any number of
+    `app.worker` processes) can share one database. Each claims runs with
+    a conditional update and holds them under a lease renewed by its
+    heartbeat; a run whose lease expired is put back in the queue, and a
+    scheduler that lost a run's lease neither finishes nor records it.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_RUNS,
+        cpu_slots: int = CPU_SLOTS,
+        memory_slots_gb: int = MEMORY_SLOTS_GB,
+        worker_id: Optional[str] = None,
+    ):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.max_concurrent = max_concurrent
+        self.cpu_slots = cpu_slots
+        self.memory_slots_gb = memory_slots_gb
+        self._active: Dict[int, asyncio.Task] = {}
+        self._active_pipelines: Dict[int, int] = {}  # run_id -> pipeline_id
+        self._cpus_in_use = 0
+        self._memory_in_use = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    # ----- public API -----
+
+    def fits(self, cpus: int, memory_gb: int) -> bool:
+        """Whether a run with these requirements can ever be scheduled."""
+        return 0 < cpus <= self.cpu_slots and 0 < memory_gb <= self.memory_slots_gb
+
+    def submit(self):
+        """Signal that new runs were queued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @property
+    def is_started(self) -> bool:
+        return self._loop_task is not None and not self._loop_task.done()
+
+    @property
+    def running_count(self) -> int:
+        return len(self._active)
+
+    def queue_depth(self) -> int:
+        with Session(engine) as session:
+            return session.exec(
+                select(func.count()).select_from(PipelineRun).where(PipelineRun.status == "pending")
+            ).one()
+
+    def running_total(self) -> int:
+        """Runs executing in any scheduler or worker sharing the database."""
+        with Session(engine) as session:
+            return session.exec(
+                select(func.count()).select_from(PipelineRun).where(PipelineRun.status == "running")
+            ).one()
+
+    async def start(self):
+        """Start the dispatch loop and the lease heartbeat."""
+        if self._loop_task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._loop_task = asyncio.create_task(self._run_loop())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        print(f"[SCHEDULER] Started as {self.worker_id}")
+
+    async def stop(self):
+        """
+        Stop dispatching and terminate running Nextflow processes.
+
+        Their runs are released back to the queue for any scheduler to
+        pick up; with the shared workspace they resume from the tasks
+        already cached.
+        """
+        for task in (self._loop_task, self._heartbeat_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._loop_task = self._heartbeat_task = None
+        run_ids = list(self._active)
+        await supervisor.shutdown()
+        tasks = list(self._active.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if run_ids:
+            await asyncio.to_thread(_release_runs, self.worker_id, run_ids)
+
+    # ----- internals -----
+
+    async def _run_loop(self):
+        while True:
+            try:
+                await self._dispatch()
+            except Exception as e:
+                print(f"[SCHEDULER ERROR] {type(e).__name__}: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            if not self._active:
+                continue
+            try:
+                lost, cancelled = await asyncio.to_thread(_renew_leases, self.worker_id, list(self._active))
+            except Exception as e:
+                print(f"[SCHEDULER ERROR] Heartbeat: {type(e).__name__}: {str(e)}")
+                continue
+            # Cancels requested through any API process reach the run here
+            for run_id in cancelled:
+                supervisor.cancel_soon(run_id)
+            for run_id in lost:
+                print(f"[SCHEDULER] Lost the lease of run {run_id}, stopping it")
+                supervisor.cancel_soon(run_id, reason="lease_lost")
+
+    async def _dispatch(self):
+        """Launch queued runs, oldest first, while slots are available."""
+        # Slots only ever free up while the claim runs in a worker thread,
+        # so this snapshot never over-commits.
+        claimed = await asyncio.to_thread(
+            _claim_runs,
+            self.worker_id,
+            self.max_concurrent - len(self._active),
+            self.cpu_slots - self._cpus_in_use,
+            self.memory_slots_gb - self._memory_in_use,
+            set(self._active_pipelines.values()),
+        )
+        for run_id, pipeline_id, cpus, memory_gb in claimed:
+            self._cpus_in_use += cpus
+            self._memory_in_use += memory_gb
+            self._active_pipelines[run_id] = pipeline_id
+            self._active[run_id] = asyncio.create_task(self._execute(run_id, cpus, memory_gb))
+
+    async def _execute(self, run_id: int, cpus: int, memory_gb: int):
+        status = "failed"
+        exit_code = None
+        error = None
+        output_dir = None
+        reuse = {}
+        try:
+            script, params, pipeline_id, resume_from, timeout_seconds = await asyncio.to_thread(
+                _load_run_inputs, run_id
+            )
+            resume_run_id, resume_session_id = resume_from or (None, None)
+            # "dataset:<id>" parameters become paths linked into the workspace
+            params = await asyncio.to_thread(stage_dataset_params, params, pipeline_workspace(pipeline_id))
+
+            result = await execute_nextflow_async(
+                script, run_id, params,
+                pipeline_id=pipeline_id,
+                resume_session_id=resume_session_id,
+                cpus=cpus,
+                memory_gb=memory_gb,
+                timeout_seconds=timeout_seconds,
+            )
+            output_dir = result["run_dir"]
+            process = result["process"]
+            # A cancel that arrived between the claim and the spawn found no
+            # process to signal
+            if await asyncio.to_thread(_cancel_requested, run_id):
+                supervisor.cancel_soon(run_id)
+            reuse["script_hash"] = result["script_hash"]
+            if result["resume_session_id"] == resume_session_id:
+                reuse["resumed_from_run_id"] = resume_run_id
+            progress_tracker.start(run_id, result["trace_path"])
+            counters = None
+            try:
+                # Stream output to the run log while waiting; reading keeps
+                # the pipe drained so a chatty run never blocks on a full buffer.
+                _, (exit_code, stop_reason) = await asyncio.gather(
+                    pump_process_output(process.stdout, run_id),
+                    supervisor.wait(run_id),
+                )
+            finally:
+                counters = await progress_tracker.finish(run_id)
+            if stop_reason in ("shutdown", "lease_lost"):
+                # The row is released by stop() or already owned by another
+                # scheduler
+                return
+            if counters:
+                reuse["cached_tasks"] = counters["tasks_cached"]
+                reuse["cached_seconds"] = counters["cached_seconds"]
+            reuse["session_id"] = read_session_id(result["launch_dir"], result["run_name"])
+            if stop_reason == "cancelled":
+                status = "cancelled"
+            elif stop_reason == "timeout":
+                status = "timed_out"
+                error = f"Run exceeded its time limit of {timeout_seconds or DEFAULT_RUN_TIMEOUT_SECONDS:.0f} seconds"
+            else:
+                status = "completed" if exit_code == 0 else "failed"
+        except asyncio.CancelledError:
+            # API shutdown: leave the row as `running` so it is recovered
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            print(f"[SCHEDULER ERROR] Run {run_id}: {error}")
+        finally:
+            self._active.pop(run_id, None)
+            self._active_pipelines.pop(run_id, None)
+            self._cpus_in_use -= cpus
+            self._memory_in_use -= memory_gb
+            self.submit()
+
+        finished = await asyncio.to_thread(
+            _finish_run, self.worker_id, run_id, status, exit_code, error, output_dir, reuse
+        )
+        if not finished:
+            print(f"[SCHEDULER] Run {run_id} is no longer leased by {self.worker_id}; result discarded")
+            return
+        try:
+            await asyncio.to_thread(index_run_outputs, run_id)
+        except Exception as e:
+            # The janitor retries runs whose outputs were not indexed
+            print(f"[SCHEDULER ERROR] Indexing outputs of run {run_id}: {type(e).__name__}: {str(e)}")
+        print(
+            f"[SCHEDULER] Run {run_id} finished: {status} (exit code {exit_code}, "
+            f"{reuse.get('cached_tasks', 0)} cached tasks)"
+        )
+
+
+# ----- database helpers (blocking; called through asyncio.to_thread) -----
+
+def _lease_until(now: datetime) -> datetime:
+    return now + timedelta(seconds=LEASE_SECONDS)
+
+def _requeue_expired(session: Session, now: datetime) -> int:
+    """
+    Put runs whose lease expired (their scheduler died or stalled) back in
+    the queue, or mark them cancelled if a cancel was requested.
+
+    Returns the number of runs changed (not committed yet).
+    """
+    expired = and_(
+        PipelineRun.status == "running",
+        or_(PipelineRun.lease_expires_at == None, PipelineRun.lease_expires_at < now),  # noqa: E711
+    )
+    cancelled = session.execute(
+        update(PipelineRun)
+        .where(expired, PipelineRun.cancel_requested_at != None)  # noqa: E711
+        .values(status="cancelled", completed_at=now, lease_expires_at=None)
+    )
+    result = session.execute(
+        update(PipelineRun)
+        .where(expired)
+        .values(status="pending", started_at=None, worker_id=None, lease_expires_at=None)
+    )
+    if result.rowcount:
+        print(f"[SCHEDULER] Re-queued {result.rowcount} runs with expired leases")
+    return cancelled.rowcount + result.rowcount
+
+def _claim_runs(
+    worker_id: str,
+    free_runs: int,
+    free_cpus: int,
+    free_memory_gb: int,
+    busy_pipelines: Set[int] = frozenset(),
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Lease the oldest pending runs that fit the free slots to `worker_id`.
+
+    Each run is claimed with its own conditional update, which only
+    succeeds while the run is still pending and no other run of its
+    pipeline is running, so concurrent schedulers never claim the same
+    run. Under READ COMMITTED two claims for the same pipeline can both
+    pass the NOT EXISTS check; the unique partial index on running
+    `pipeline_id` rejects the second one. Runs whose pipeline is busy are
+    skipped without blocking the runs behind them.
+
+    Returns:
+        list of (run_id, pipeline_id, cpus, memory_gb) that were claimed
+    """
+    claimed = []
+    if free_runs <= 0:
+        return claimed
+    now = datetime.utcnow()
+    other = aliased(PipelineRun)
+    with Session(engine) as session:
+        changed = _requeue_expired(session, now)
+        session.commit()
+        if changed:
+            # The bulk update does not say which runs it changed
+            read_cache.invalidate_kind("run")
+        busy_pipelines = set(busy_pipelines) | set(session.exec(
+            select(PipelineRun.pipeline_id).where(PipelineRun.status == "running")
+        ).all())
+        pending = session.exec(
+            select(PipelineRun.id, PipelineRun.pipeline_id, PipelineRun.cpus, PipelineRun.memory_gb)
+            .where(PipelineRun.status == "pending")
+            .order_by(PipelineRun.id)
+            .limit(CLAIM_SCAN_LIMIT)
+        ).all()
+        for run_id, pipeline_id, cpus, memory_gb in pending:
+            if len(claimed) >= free_runs:
+                break
+            if pipeline_id in busy_pipelines:
+                continue
+            # Strict FIFO: a large run at the head is not starved by
+            # smaller runs queued behind it.
+            if cpus > free_cpus or memory_gb > free_memory_gb:
+                break
+            pipeline_running = (
+                select(other.id)
+                .where(other.pipeline_id == pipeline_id, other.status == "running")
+                .exists()
+            )
+            try:
+                result = session.execute(
+                    update(PipelineRun)
+                    .where(PipelineRun.id == run_id, PipelineRun.status == "pending", ~pipeline_running)
+                    .values(
+                        status="running", started_at=now, worker_id=worker_id,
+                        lease_expires_at=_lease_until(now), heartbeat_at=now,
+                    )
+                )
+                session.commit()
+            except IntegrityError:
+                # Another scheduler started a run of this pipeline concurrently
+                session.rollback()
+                busy_pipelines.add(pipeline_id)
+                continue
+            busy_pipelines.add(pipeline_id)
+            if result.rowcount != 1:
+                continue  # Claimed or cancelled by someone else meanwhile
+            read_cache.invalidate("run", run_id)
+            free_cpus -= cpus
+            free_memory_gb -= memory_gb
+            claimed.append((run_id, pipeline_id, cpus, memory_gb))
+    return claimed
+
+def _renew_leases(worker_id: str, run_ids: List[int]) -> Tuple[List[int], List[int]]:
+    """
+    Extend the leases `worker_id` holds on `run_ids`.
+
+    Returns:
+        (lost, cancelled): runs no longer leased to this worker, and runs
+        with a pending cancel request
+    """
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        session.execute(
+            update(PipelineRun)
+            .where(
+                PipelineRun.id.in_(run_ids),
+                PipelineRun.worker_id == worker_id,
+                PipelineRun.status == "running",
+            )
+            .values(lease_expires_at=_lease_until(now), heartbeat_at=now)
+        )
+        session.commit()
+        rows = session.exec(
+            select(PipelineRun.id, PipelineRun.worker_id, PipelineRun.status, PipelineRun.cancel_requested_at)
+            .where(PipelineRun.id.in_(run_ids))
+        ).all()
+    lost = [run_id for run_id, owner, status, _ in rows if owner != worker_id or status != "running"]
+    cancelled = [
+        run_id for run_id, _, _, cancel_requested_at in rows
+        if cancel_requested_at is not None and run_id not in lost
+    ]
+    return lost, cancelled
+
+def _release_runs(worker_id: str, run_ids: List[int]):
+    """Hand runs stopped by a shutdown back to the queue right away."""
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        owned = and_(
+            PipelineRun.id.in_(run_ids),
+            PipelineRun.worker_id == worker_id,
+            PipelineRun.status == "running",
+        )
+        session.execute(
+            update(PipelineRun)
+            .where(owned, PipelineRun.cancel_requested_at != None)  # noqa: E711
+            .values(status="cancelled", completed_at=now, lease_expires_at=None)
+        )
+        session.execute(
+            update(PipelineRun)
+            .where(owned)
+            .values(status="pending", started_at=None, worker_id=None, lease_expires_at=None)
+        )
+        session.commit()
+    read_cache.invalidate("run", *run_ids)
+
+def _load_run_inputs(run_id: int) -> Tuple[str, dict, int, Optional[Tuple[int, str]], Optional[int]]:
+    """
+    Returns:
+        (script, params, pipeline_id, resume_from, timeout_seconds) where
+        `resume_from` is the (run_id, session_id) of the latest earlier run
+        of the same pipeline that recorded a Nextflow session, if any
+    """
+    with Session(engine) as session:
+        run = session.get(PipelineRun, run_id)
+        pipeline = session.get(Pipeline, run.pipeline_id)
+        previous = session.exec(
+            select(PipelineRun.id, PipelineRun.session_id)
+            .where(
+                PipelineRun.pipeline_id == run.pipeline_id,
+                PipelineRun.id != run_id,
+                PipelineRun.session_id != None,  # noqa: E711
+            )
+            .order_by(PipelineRun.completed_at.desc(), PipelineRun.id.desc())
+            .limit(1)
+        ).first()
+        return (
+            pipeline.script,
+            json.loads(run.params) if run.params else {},
+            pipeline.id,
+            tuple(previous) if previous else None,
+            run.timeout_seconds,
+        )
+
+def _cancel_requested(run_id: int) -> bool:
+    with Session(engine) as session:
+        run = session.get(PipelineRun, run_id)
+        return run is not None and run.cancel_requested_at is not None
+
+def _finish_run(
+    worker_id: str,
+    run_id: int,
+    status: str,
+    exit_code: Optional[int],
+    error: Optional[str],
+    output_dir: Optional[str],
+    reuse: Optional[dict] = None,
+) -> bool:
+    """Record the outcome of a run; False if the run's lease was lost."""
+    with Session(engine) as session:
+        run = session.get(PipelineRun, run_id)
+        if run is None or run.worker_id != worker_id or run.status != "running":
+            return False
+        run.status = status
+        run.lease_expires_at = None
+        run.exit_code = exit_code
+        run.completed_at = datetime.utcnow()
+        # Script hash, Nextflow session and cache reuse of this run
+        for key, value in (reuse or {}).items():
+            if value is not None:
+                setattr(run, key, value)
+        if output_dir:
+            run.output_dir = output_dir
+        if error:
+            run.logs = error
+        session.add(run)
+        session.commit()
+        read_cache.invalidate("run", run_id)
+        return True
+
+
+scheduler = RunScheduler()
+
+registry.register(Gauge(
+    "scheduler_queue_depth", "Pipeline runs waiting in the queue",
+    function=lambda: {(): scheduler.queue_depth()}
+))
+registry.register(Gauge(
+    "scheduler_running_runs", "Pipeline runs executing, across all schedulers and workers",
+    function=lambda: {(): scheduler.running_total()}
+))
+registry.register(Gauge(
+    "scheduler_local_running_runs", "Pipeline runs executing in this process",
+    function=lambda: {(): scheduler.running_count}
+))
@@ -0,0 +1,79 @@
+import json
+import re
+from typing import Iterator, Optional, Tuple, Union
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Disable proxy buffering (nginx)
+}
+
+
+def sse_event(data: Union[str, dict], event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """
+    Format a single server-sent event.
+
+    Dicts are JSON-encoded; multi-line strings are split into several
+    `data:` fields as required by the SSE spec.
+    """
+    if isinstance(data, dict):
+        data = json.dumps(data, ensure_ascii=False)
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    for line in data.splitlines() or [""]:
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+FILE_CHUNK_BYTES = 64 * 1024
+
+# A single byte range; anything else (other units, several ranges) is ignored
+_BYTE_RANGE = re.compile(r"^bytes=\s*(\d*)-(\d*)\s*$", re.ASCII)
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range: bytes=...` header.
+
+    Returns:
+        (start, end) with `end` inclusive, or None when the whole file should
+        be sent (no header, another unit, several ranges, or a header that
+        is not a valid range, which RFC 9110 says to ignore)
+
+    Raises:
+        ValueError: if the range cannot be satisfied for a file of `size` bytes
+    """
+    match = _BYTE_RANGE.match(header or "")
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "":
+        if last == "":
+            return None
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(f"Unsatisfiable range: {header}")
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def iter_file(path: str, start: int, end: int, chunk_size: int = FILE_CHUNK_BYTES) -> Iterator[bytes]:
+    """Yield bytes `start`..`end` (inclusive) of a file in chunks."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
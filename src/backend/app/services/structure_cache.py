@@ -0,0 +1,256 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+CACHE_DIR = os.getenv(
+    "ALPHAFOLD_CACHE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../cache/alphafold"))
+)
+CACHE_MAX_BYTES = int(os.getenv("ALPHAFOLD_CACHE_MAX_MB", "1024")) * 1024 * 1024
+CACHE_TTL_SECONDS = int(os.getenv("ALPHAFOLD_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+class StructureCache:
+    """
+    Content-addressed disk cache for AlphaFold metadata and PDB files.
+
+    Blobs are stored once under their SHA-256 (`blobs/ab/abcdef...`) and
+    referenced from a small SQLite index keyed by (UniProt ID, model
+    version). Entries older than the TTL are revalidated upstream with the
+    stored ETag / Last-Modified; the least recently used entries are evicted
+    once the blobs exceed the size limit.
+
+    Data derived from a blob (such as the parsed structure columns) is kept
+    next to it under `derived/` and removed together with the blob.
+
+    All methods are blocking; call them through `asyncio.to_thread`.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.join(self.cache_dir, "blobs"), exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.cache_dir, "index.db"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    uniprot_id TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    metadata_hash TEXT NOT NULL,
+                    pdb_hash TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (uniprot_id, model_version)
+                );
+                CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access);
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", digest[:2], digest)
+
+    def _write_blob(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self._db().execute("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", (digest, len(data)))
+        return digest
+
+    def _derived_path(self, digest: str, kind: str) -> str:
+        return os.path.join(self.cache_dir, "derived", digest[:2], f"{digest}.{kind}")
+
+    def _remove_derived(self, digest: str):
+        directory = os.path.dirname(self._derived_path(digest, ""))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(f"{digest}."):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get(self, uniprot_id: str) -> Optional[dict]:
+        """
+        Return the most recently fetched entry for a UniProt ID.
+
+        The dict has `metadata` and `pdb_data` as bytes, the validators and
+        `fresh` (False once the TTL has elapsed and it must be revalidated).
+        """
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT model_version, metadata_hash, pdb_hash, etag, last_modified, fetched_at "
+                "FROM entries WHERE uniprot_id = ? ORDER BY fetched_at DESC LIMIT 1",
+                (uniprot_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            model_version, metadata_hash, pdb_hash, etag, last_modified, fetched_at = row
+            metadata = self._read_blob(metadata_hash)
+            pdb_data = self._read_blob(pdb_hash)
+            if metadata is None or pdb_data is None:
+                # Blob removed behind our back; drop the entry
+                db.execute(
+                    "DELETE FROM entries WHERE uniprot_id = ? AND model_version = ?",
+                    (uniprot_id, model_version)
+                )
+                db.commit()
+                return None
+            now = time.time()
+            db.execute(
+                "UPDATE entries SET last_access = ? WHERE uniprot_id = ? AND model_version = ?",
+                (now, uniprot_id, model_version)
+            )
+            db.commit()
+            return {
+                "model_version": model_version,
+                "metadata": metadata,
+                "metadata_hash": metadata_hash,
+                "pdb_data": pdb_data,
+                "pdb_hash": pdb_hash,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fresh": now - fetched_at < self.ttl_seconds,
+            }
+
+    def lookup(self, uniprot_id: str) -> Optional[dict]:
+        """
+        Like `get` but without reading the blobs: `model_version`, `pdb_hash`
+        and `fresh` of the most recently fetched entry.
+        """
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT model_version, pdb_hash, fetched_at FROM entries "
+                "WHERE uniprot_id = ? ORDER BY fetched_at DESC LIMIT 1",
+                (uniprot_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            model_version, pdb_hash, fetched_at = row
+            now = time.time()
+            db.execute(
+                "UPDATE entries SET last_access = ? WHERE uniprot_id = ? AND model_version = ?",
+                (now, uniprot_id, model_version)
+            )
+            db.commit()
+            return {
+                "model_version": model_version,
+                "pdb_hash": pdb_hash,
+                "fresh": now - fetched_at < self.ttl_seconds,
+            }
+
+    def get_derived(self, digest: str, kind: str) -> Optional[bytes]:
+        """Data of `kind` derived from the blob `digest`, if stored."""
+        try:
+            with open(self._derived_path(digest, kind), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_derived(self, digest: str, kind: str, data: bytes):
+        """Store data derived from a cached blob; it is evicted with the blob."""
+        with self._lock:
+            if self._db().execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is None:
+                return  # Source already evicted
+            path = self._derived_path(digest, kind)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def put(
+        self,
+        uniprot_id: str,
+        model_version: str,
+        metadata: bytes,
+        pdb_data: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        with self._lock:
+            db = self._db()
+            metadata_hash = self._write_blob(metadata)
+            pdb_hash = self._write_blob(pdb_data)
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(uniprot_id, model_version, metadata_hash, pdb_hash, etag, last_modified, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (uniprot_id, model_version, metadata_hash, pdb_hash, etag, last_modified, now, now)
+            )
+            db.commit()
+            self._evict()
+
+    def mark_validated(self, uniprot_id: str, model_version: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Reset the TTL of an entry after a successful revalidation."""
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "UPDATE entries SET fetched_at = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) "
+                "WHERE uniprot_id = ? AND model_version = ?",
+                (time.time(), etag, last_modified, uniprot_id, model_version)
+            )
+            db.commit()
+
+    def _total_bytes(self) -> int:
+        return self._db().execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _evict(self):
+        """Drop least recently used entries until the blobs fit the size limit."""
+        db = self._db()
+        while self._total_bytes() > self.max_bytes:
+            row = db.execute(
+                "SELECT uniprot_id, model_version FROM entries ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            db.execute("DELETE FROM entries WHERE uniprot_id = ? AND model_version = ?", row)
+            orphans = db.execute(
+                "SELECT hash FROM blobs WHERE hash NOT IN "
+                "(SELECT metadata_hash FROM entries UNION SELECT pdb_hash FROM entries)"
+            ).fetchall()
+            for (digest,) in orphans:
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                self._remove_derived(digest)
+                db.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+        db.commit()
+
+
+structure_cache = StructureCache()
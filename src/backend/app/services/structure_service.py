@@ -0,0 +1,515 @@
+import asyncio
+import bisect
+import json
+import os
+import re
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from .alphafold_service import get_alphafold_prediction
+from .compression import compress
+from .metrics import CACHE_REQUESTS
+from .structure_cache import structure_cache
+
+# Parsed structures kept in memory, keyed by the SHA-256 of the source file
+STRUCTURE_MEMORY_ENTRIES = int(os.getenv("STRUCTURE_MEMORY_CACHE_ENTRIES", "64"))
+
+# Name of the parsed columns in the structure cache; bump when the layout changes
+PARSED_FORMAT = "columns-v1"
+_MAGIC = b"CST1"
+
+# pLDDT bands used by AlphaFold DB, as (name, lower bound)
+PLDDT_BANDS = (("very_high", 90.0), ("confident", 70.0), ("low", 50.0), ("very_low", float("-inf")))
+
+THREE_TO_ONE = {
+    "ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C", "GLN": "Q", "GLU": "E",
+    "GLY": "G", "HIS": "H", "ILE": "I", "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F",
+    "PRO": "P", "SER": "S", "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V",
+    "MSE": "M", "SEC": "U", "PYL": "O",
+}
+
+_CIF_TOKEN = re.compile(r"'[^']*'|\"[^\"]*\"|\S+")
+
+
+@dataclass
+class ParsedStructure:
+    """
+    Column-oriented view of a structure (first model only).
+
+    Atom columns: `coords` (x, y, z interleaved, float32), `atom_names`,
+    `elements`. Residue columns: `residue_names`, `residue_numbers`,
+    `residue_plddt` (B-factor of the CA, which AlphaFold sets to the pLDDT)
+    and `residue_atom_start`, where residue i owns atoms
+    `residue_atom_start[i]:residue_atom_start[i + 1]`. `chains` holds
+    (chain ID, first residue index, end residue index).
+    """
+    coords: array
+    atom_names: List[str]
+    elements: List[str]
+    residue_names: List[str]
+    residue_numbers: array
+    residue_plddt: array
+    residue_atom_start: array
+    chains: List[Tuple[str, int, int]]
+
+    @property
+    def atom_count(self) -> int:
+        return len(self.atom_names)
+
+    @property
+    def residue_count(self) -> int:
+        return len(self.residue_names)
+
+    def residue_range(self, chain_id: Optional[str] = None, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Residue indexes [first, last) of a chain and residue number range
+        (inclusive, in author numbering).
+
+        Raises:
+            LookupError: unknown chain
+            ValueError: range without a chain in a multi-chain structure, or start > end
+        """
+        if chain_id is None:
+            if len(self.chains) > 1 and (start is not None or end is not None):
+                raise ValueError("Informe a cadeia para selecionar resíduos em uma estrutura com várias cadeias")
+            first, last = 0, self.residue_count
+        else:
+            for chain, chain_first, chain_last in self.chains:
+                if chain == chain_id:
+                    first, last = chain_first, chain_last
+                    break
+            else:
+                raise LookupError(f"Cadeia {chain_id} não encontrada")
+        if start is not None and end is not None and start > end:
+            raise ValueError("O início do intervalo deve ser menor ou igual ao fim")
+        if start is not None:
+            first = bisect.bisect_left(self.residue_numbers, start, first, last)
+        if end is not None:
+            last = bisect.bisect_right(self.residue_numbers, end, first, last)
+        return first, last
+
+    def summary(self) -> dict:
+        chains = []
+        for chain_id, first, last in self.chains:
+            plddt = self.residue_plddt[first:last]
+            chains.append({
+                "chain_id": chain_id,
+                "residue_count": last - first,
+                "first_residue": self.residue_numbers[first] if last > first else None,
+                "last_residue": self.residue_numbers[last - 1] if last > first else None,
+                "sequence": "".join(THREE_TO_ONE.get(name, "X") for name in self.residue_names[first:last]),
+                "mean_plddt": round(sum(plddt) / len(plddt), 2) if plddt else None,
+            })
+        bands = {name: 0 for name, _ in PLDDT_BANDS}
+        for value in self.residue_plddt:
+            for name, lower in PLDDT_BANDS:
+                if value >= lower:
+                    bands[name] += 1
+                    break
+        total = self.residue_count or 1
+        return {
+            "atom_count": self.atom_count,
+            "residue_count": self.residue_count,
+            "mean_plddt": round(sum(self.residue_plddt) / total, 2) if self.residue_count else None,
+            "plddt_bands": {name: round(count / total, 4) for name, count in bands.items()},
+            "chains": chains,
+        }
+
+    def plddt_track(self, first: int, last: int) -> dict:
+        return {
+            "residue_numbers": self.residue_numbers[first:last].tolist(),
+            "plddt": [round(value, 2) for value in self.residue_plddt[first:last]],
+        }
+
+    def _chain_of(self, residue: int) -> str:
+        for chain_id, first, last in self.chains:
+            if first <= residue < last:
+                return chain_id
+        return ""
+
+    def coordinates(self, first: int, last: int, ca_only: bool = False) -> Tuple[bytes, int]:
+        """Little-endian float32 x, y, z of the atoms of residues [first, last), and the atom count."""
+        atom_first, atom_last = self.residue_atom_start[first], self.residue_atom_start[last]
+        if not ca_only:
+            selected = self.coords[atom_first * 3:atom_last * 3]
+        else:
+            selected = array("f")
+            for atom in range(atom_first, atom_last):
+                if self.atom_names[atom] == "CA":
+                    selected.extend(self.coords[atom * 3:atom * 3 + 3])
+        return _little_endian(selected), len(selected) // 3
+
+    def to_pdb(self, first: int, last: int) -> str:
+        """PDB text with the ATOM records of residues [first, last)."""
+        lines = []
+        serial = 1
+        for residue in range(first, last):
+            chain_id = self._chain_of(residue)[:1] or "A"
+            name = self.residue_names[residue]
+            number = self.residue_numbers[residue]
+            plddt = self.residue_plddt[residue]
+            for atom in range(self.residue_atom_start[residue], self.residue_atom_start[residue + 1]):
+                atom_name = self.atom_names[atom]
+                # Atom names shorter than 4 characters start in column 14
+                padded = atom_name if len(atom_name) == 4 else f" {atom_name:<3}"
+                x, y, z = self.coords[atom * 3:atom * 3 + 3]
+                lines.append(
+                    f"ATOM  {serial:5d} {padded} {name:>3} {chain_id}{number:4d}    "
+                    f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00{plddt:6.2f}          {self.elements[atom]:>2}"
+                )
+                serial += 1
+        lines.append("END")
+        return "\n".join(lines) + "\n"
+
+
+class _StructureBuilder:
+    """Accumulates atoms (grouped by residue, in file order) into a ParsedStructure."""
+
+    def __init__(self):
+        self.coords = array("f")
+        self.atom_names: List[str] = []
+        self.elements: List[str] = []
+        self.residue_names: List[str] = []
+        self.residue_numbers = array("i")
+        self.residue_plddt = array("f")
+        self.residue_atom_start = array("I")
+        self.chains: List[Tuple[str, int, int]] = []
+        self._residue_key = None
+        self._chain_id = None
+        self._b_sum = 0.0
+        self._ca_b: Optional[float] = None
+
+    def _close_residue(self):
+        if self._residue_key is not None:
+            atoms = len(self.atom_names) - self.residue_atom_start[-1]
+            self.residue_plddt.append(self._ca_b if self._ca_b is not None else self._b_sum / atoms)
+
+    def _close_chain(self):
+        if self._chain_id is not None:
+            first = self.chains[-1][2] if self.chains else 0
+            self.chains.append((self._chain_id, first, len(self.residue_names)))
+
+    def add_atom(self, chain_id: str, residue_number: int, insertion_code: str, residue_name: str,
+                 atom_name: str, element: str, x: float, y: float, z: float, b_factor: float):
+        key = (chain_id, residue_number, insertion_code)
+        if key != self._residue_key:
+            self._close_residue()
+            if chain_id != self._chain_id:
+                self._close_chain()
+                self._chain_id = chain_id
+            self._residue_key = key
+            self._b_sum = 0.0
+            self._ca_b = None
+            self.residue_names.append(residue_name)
+            self.residue_numbers.append(residue_number)
+            self.residue_atom_start.append(len(self.atom_names))
+        self.coords.extend((x, y, z))
+        self.atom_names.append(atom_name)
+        self.elements.append(element or atom_name[:1])
+        self._b_sum += b_factor
+        if atom_name == "CA":
+            self._ca_b = b_factor
+
+    def build(self) -> ParsedStructure:
+        self._close_residue()
+        self._close_chain()
+        self.residue_atom_start.append(len(self.atom_names))
+        return ParsedStructure(
+            coords=self.coords,
+            atom_names=self.atom_names,
+            elements=self.elements,
+            residue_names=self.residue_names,
+            residue_numbers=self.residue_numbers,
+            residue_plddt=self.residue_plddt,
+            residue_atom_start=self.residue_atom_start,
+            chains=self.chains,
+        )
+
+
+def parse_pdb(text: str) -> ParsedStructure:
+    """Parse the ATOM/HETATM records of the first model of a PDB file."""
+    builder = _StructureBuilder()
+    for line in text.splitlines():
+        record = line[:6]
+        if record == "ATOM  " or record == "HETATM":
+            builder.add_atom(
+                chain_id=line[21:22].strip(),
+                residue_number=int(line[22:26]),
+                insertion_code=line[26:27].strip(),
+                residue_name=line[17:20].strip(),
+                atom_name=line[12:16].strip(),
+                element=line[76:78].strip(),
+                x=float(line[30:38]), y=float(line[38:46]), z=float(line[46:54]),
+                b_factor=float(line[60:66] or 0),
+            )
+        elif record == "ENDMDL":
+            break
+    return builder.build()
+
+
+def _cif_value(token: str) -> str:
+    if len(token) > 1 and token[0] in "'\"" and token[-1] == token[0]:
+        return token[1:-1]
+    return token
+
+
+def parse_mmcif(text: str) -> ParsedStructure:
+    """Parse the `_atom_site` loop (first model) of an mmCIF file."""
+    builder = _StructureBuilder()
+    fields: List[str] = []
+    column: Optional[Dict[str, int]] = None
+    model = None
+    for line in text.splitlines():
+        if column is None:
+            if line.startswith("_atom_site."):
+                fields.append(line.split()[0][len("_atom_site."):])
+                continue
+            if not fields:
+                continue
+            column = {name: i for i, name in enumerate(fields)}
+            pick = lambda *names: next((column[name] for name in names if name in column), None)
+            i_atom = pick("auth_atom_id", "label_atom_id")
+            i_residue_name = pick("auth_comp_id", "label_comp_id")
+            i_chain = pick("auth_asym_id", "label_asym_id")
+            i_number = pick("auth_seq_id", "label_seq_id")
+            i_insertion = pick("pdbx_PDB_ins_code")
+            i_element = pick("type_symbol")
+            i_b = pick("B_iso_or_equiv")
+            i_model = pick("pdbx_PDB_model_num")
+            i_x, i_y, i_z = pick("Cartn_x"), pick("Cartn_y"), pick("Cartn_z")
+        if not line.strip():
+            continue
+        if line.startswith(("#", "_", "loop_", "data_")):
+            break
+        values = [_cif_value(token) for token in _CIF_TOKEN.findall(line)]
+        if i_model is not None:
+            if model is None:
+                model = values[i_model]
+            elif values[i_model] != model:
+                break
+        insertion = values[i_insertion] if i_insertion is not None else ""
+        builder.add_atom(
+            chain_id=values[i_chain],
+            residue_number=int(values[i_number]),
+            insertion_code="" if insertion in ("?", ".") else insertion,
+            residue_name=values[i_residue_name],
+            atom_name=values[i_atom],
+            element=values[i_element] if i_element is not None else "",
+            x=float(values[i_x]), y=float(values[i_y]), z=float(values[i_z]),
+            b_factor=float(values[i_b]) if i_b is not None else 0.0,
+        )
+    return builder.build()
+
+
+def parse_structure(text: str) -> ParsedStructure:
+    """Parse a PDB or mmCIF file (detected from its content)."""
+    if text.lstrip().startswith("data_"):
+        return parse_mmcif(text)
+    return parse_pdb(text)
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def serialize_structure(structure: ParsedStructure) -> bytes:
+    """Binary form stored in the structure cache: a JSON header, then the numeric columns."""
+    header = json.dumps({
+        "atom_names": structure.atom_names,
+        "elements": structure.elements,
+        "residue_names": structure.residue_names,
+        "chains": structure.chains,
+    }, separators=(",", ":")).encode("utf-8")
+    return b"".join([
+        _MAGIC,
+        struct.pack("<I", len(header)),
+        header,
+        _little_endian(structure.coords),
+        _little_endian(structure.residue_numbers),
+        _little_endian(structure.residue_plddt),
+        _little_endian(structure.residue_atom_start),
+    ])
+
+
+def deserialize_structure(data: bytes) -> Optional[ParsedStructure]:
+    """Inverse of `serialize_structure`; None if the data is not in this format."""
+    if data[:4] != _MAGIC:
+        return None
+    (header_size,) = struct.unpack_from("<I", data, 4)
+    offset = 8 + header_size
+    header = json.loads(data[8:offset])
+    atoms, residues = len(header["atom_names"]), len(header["residue_names"])
+    sections = []
+    for typecode, count in (("f", atoms * 3), ("i", residues), ("f", residues), ("I", residues + 1)):
+        size = array(typecode).itemsize * count
+        sections.append(_from_little_endian(typecode, data[offset:offset + size]))
+        offset += size
+    coords, residue_numbers, residue_plddt, residue_atom_start = sections
+    return ParsedStructure(
+        coords=coords,
+        atom_names=header["atom_names"],
+        elements=header["elements"],
+        residue_names=header["residue_names"],
+        residue_numbers=residue_numbers,
+        residue_plddt=residue_plddt,
+        residue_atom_start=residue_atom_start,
+        chains=[tuple(chain) for chain in header["chains"]],
+    )
+
+
+# Parsed structures by source hash, least recently used first
+_memory: "OrderedDict[str, ParsedStructure]" = OrderedDict()
+# Parses in progress by source hash, so concurrent requests parse once
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def _remember(pdb_hash: str, structure: ParsedStructure):
+    _memory[pdb_hash] = structure
+    _memory.move_to_end(pdb_hash)
+    while len(_memory) > STRUCTURE_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _load_parsed(uniprot_id: str, pdb_hash: str, pdb_text: Optional[str]) -> Optional[ParsedStructure]:
+    """Read the parsed columns from the cache, or parse the source and store them."""
+    data = structure_cache.get_derived(pdb_hash, PARSED_FORMAT)
+    structure = deserialize_structure(data) if data else None
+    if structure is not None:
+        CACHE_REQUESTS.inc(cache="structure_parsed", result="disk")
+        return structure
+    if pdb_text is None:
+        cached = structure_cache.get(uniprot_id)
+        if cached is None or cached["pdb_hash"] != pdb_hash:
+            return None
+        pdb_text = cached["pdb_data"].decode("utf-8")
+    CACHE_REQUESTS.inc(cache="structure_parsed", result="miss")
+    structure = parse_structure(pdb_text)
+    structure_cache.put_derived(pdb_hash, PARSED_FORMAT, serialize_structure(structure))
+    return structure
+
+
+async def _cached_entry(uniprot_id: str) -> dict:
+    """
+    Cache index entry of a fresh prediction, fetching it from AlphaFold DB
+    when missing or stale (then `pdb_text` holds the file just fetched).
+    """
+    entry = await asyncio.to_thread(structure_cache.lookup, uniprot_id)
+    if entry is not None and entry["fresh"]:
+        return {"success": True, "pdb_text": None, **entry}
+    result = await get_alphafold_prediction(uniprot_id)
+    if not result["success"]:
+        return result
+    entry = await asyncio.to_thread(structure_cache.lookup, uniprot_id)
+    if entry is None:
+        return {"success": False, "error": f"Estrutura de {uniprot_id} indisponível no cache"}
+    return {"success": True, "pdb_text": result["pdb_data"], **entry}
+
+
+async def get_structure(uniprot_id: str) -> dict:
+    """
+    Parsed AlphaFold structure for a UniProt ID.
+
+    The PDB file comes from the structure cache (fetched from AlphaFold DB
+    when missing or stale) and is parsed once per file version: parsed
+    columns are kept in memory and stored next to the PDB in the cache.
+
+    Returns:
+        dict with `structure` (ParsedStructure), `uniprot_id` and
+        `model_version`, or `success` False and `error` (and `not_found`
+        when AlphaFold DB has no prediction)
+    """
+    uniprot_id = uniprot_id.strip().upper()
+    entry = await _cached_entry(uniprot_id)
+    if not entry["success"]:
+        return entry
+
+    pdb_hash = entry["pdb_hash"]
+    structure = _memory.get(pdb_hash)
+    if structure is not None:
+        _memory.move_to_end(pdb_hash)
+        CACHE_REQUESTS.inc(cache="structure_parsed", result="hit")
+    else:
+        task = _inflight.get(pdb_hash)
+        if task is None:
+            task = asyncio.ensure_future(
+                asyncio.to_thread(_load_parsed, uniprot_id, pdb_hash, entry["pdb_text"])
+            )
+            _inflight[pdb_hash] = task
+            task.add_done_callback(lambda t: _inflight.pop(pdb_hash, None) if _inflight.get(pdb_hash) is t else None)
+        try:
+            structure = await asyncio.shield(task)
+        except Exception as e:
+            return {"success": False, "error": f"Erro ao processar a estrutura: {type(e).__name__} - {str(e)}"}
+        if structure is None:
+            return {"success": False, "error": f"Estrutura de {uniprot_id} indisponível no cache"}
+        _remember(pdb_hash, structure)
+
+    if structure.atom_count == 0:
+        return {"success": False, "error": f"Nenhum átomo encontrado na estrutura de {uniprot_id}"}
+    return {
+        "success": True,
+        "structure": structure,
+        "uniprot_id": uniprot_id,
+        "model_version": entry["model_version"],
+    }
+
+
+def _load_file(uniprot_id: str, pdb_hash: str, pdb_text: Optional[str], encoding: Optional[str]) -> Optional[bytes]:
+    """The PDB file, compressed with `encoding` once and then served from the cache."""
+    if encoding is not None:
+        data = structure_cache.get_derived(pdb_hash, f"pdb.{encoding}")
+        if data is not None:
+            return data
+    if pdb_text is not None:
+        raw = pdb_text.encode("utf-8")
+    else:
+        cached = structure_cache.get(uniprot_id)
+        if cached is None or cached["pdb_hash"] != pdb_hash:
+            return None
+        raw = cached["pdb_data"]
+    if encoding is None:
+        return raw
+    # Maximum compression: it is paid once per file version
+    data = compress(raw, encoding, gzip_level=9, brotli_quality=9)
+    structure_cache.put_derived(pdb_hash, f"pdb.{encoding}", data)
+    return data
+
+
+async def get_structure_file(uniprot_id: str, encoding: Optional[str] = None) -> dict:
+    """
+    Raw AlphaFold PDB file for a UniProt ID, precompressed when `encoding`
+    ("gzip" or "br") is given.
+
+    Returns:
+        dict with `data` (bytes), `encoding`, `uniprot_id`, `model_version`
+        and `pdb_hash`, or an error dict as in `get_structure`
+    """
+    uniprot_id = uniprot_id.strip().upper()
+    entry = await _cached_entry(uniprot_id)
+    if not entry["success"]:
+        return entry
+    data = await asyncio.to_thread(_load_file, uniprot_id, entry["pdb_hash"], entry["pdb_text"], encoding)
+    if data is None:
+        return {"success": False, "error": f"Estrutura de {uniprot_id} indisponível no cache"}
+    return {
+        "success": True,
+        "data": data,
+        "encoding": encoding,
+        "uniprot_id": uniprot_id,
+        "model_version": entry["model_version"],
+        "pdb_hash": entry["pdb_hash"],
+    }
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import signal
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Wall-clock limit of a run when it does not set its own; 0 disables it
+DEFAULT_RUN_TIMEOUT_SECONDS = float(os.getenv("RUNNER_RUN_TIMEOUT_SECONDS", "0"))
+# Time between SIGTERM and SIGKILL of a run's process group. Nextflow uses
+# it to stop its tasks and write the session cache so -resume still works.
+KILL_GRACE_SECONDS = float(os.getenv("RUNNER_KILL_GRACE_SECONDS", "30"))
+# cgroup v2 directory under which each run gets its own group with
+# memory.max and cpu.max set from its reservation (must be writable and
+# delegated to this user); unset disables cgroups
+CGROUP_ROOT = os.getenv("RUNNER_CGROUP_ROOT")
+# Fallback without cgroups: RLIMIT_AS of each process is the reservation
+# times this factor (the JVM reserves much more address space than it
+# uses); 0 disables it
+RLIMIT_AS_FACTOR = float(os.getenv("RUNNER_RLIMIT_AS_FACTOR", "0"))
+
+GIB = 1024 ** 3
+
+
+@dataclass
+class _Supervised:
+    process: asyncio.subprocess.Process
+    timeout_seconds: Optional[float]
+    cgroup: Optional[str] = None
+    stop_reason: Optional[str] = None  # "cancelled", "timeout" or "shutdown"
+    terminating: Optional[asyncio.Task] = None
+
+
+def _create_cgroup(run_id: int, cpus: int, memory_gb: int) -> Optional[str]:
+    if not CGROUP_ROOT:
+        return None
+    path = os.path.join(CGROUP_ROOT, f"ciencia-run-{run_id}")
+    try:
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "memory.max"), "w") as f:
+            f.write(str(memory_gb * GIB))
+        with open(os.path.join(path, "cpu.max"), "w") as f:
+            f.write(f"{cpus * 100000} 100000")
+    except OSError as e:
+        print(f"[SUPERVISOR] cgroup unavailable for run {run_id}, running without it: {e}")
+        return None
+    return path
+
+
+def _remove_cgroup(path: Optional[str]):
+    if path:
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass  # Still has processes or already gone
+
+
+def _child_setup(cgroup: Optional[str], memory_gb: int) -> Optional[Callable[[], None]]:
+    """
+    Build the pre-exec hook that confines the child before Nextflow starts,
+    or None when there is no cap to apply (a pre-exec hook rules out the
+    faster vfork/posix_spawn path and is not safe alongside threads).
+    """
+    if not cgroup and (resource is None or RLIMIT_AS_FACTOR <= 0):
+        return None
+
+    def setup():
+        if cgroup:
+            # Join the cgroup before exec so every descendant inherits it
+            with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+                f.write(str(os.getpid()))
+        elif resource is not None and RLIMIT_AS_FACTOR > 0:
+            limit = int(memory_gb * GIB * RLIMIT_AS_FACTOR)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return setup
+
+
+class ProcessSupervisor:
+    """
+    Owns the Nextflow processes of every run executing in this API process.
+
+    Each run is started in its own session (process group), so a cancel,
+    a timeout or the API shutting down signals Nextflow together with every
+    task it spawned: SIGTERM first, SIGKILL after the grace period. After
+    Nextflow exits, anything left in its group is killed so no stray JVM
+    or task outlives the run. Memory and CPU are capped through a cgroup
+    when `RUNNER_CGROUP_ROOT` is set, or through RLIMIT_AS otherwise.
+    """
+
+    def __init__(self, kill_grace_seconds: float = KILL_GRACE_SECONDS):
+        self.kill_grace_seconds = kill_grace_seconds
+        self._runs: Dict[int, _Supervised] = {}
+        # Cancels started without waiting; the loop only keeps weak references
+        self._cancelling: Set[asyncio.Task] = set()
+
+    async def spawn(
+        self,
+        run_id: int,
+        cmd: List[str],
+        cwd: str,
+        cpus: int = 1,
+        memory_gb: int = 2,
+        timeout_seconds: Optional[float] = None,
+    ) -> asyncio.subprocess.Process:
+        """Start a run's process; stdout is a pipe with stderr merged into it."""
+        cgroup = _create_cgroup(run_id, cpus, memory_gb)
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=cwd,
+            start_new_session=True,
+            preexec_fn=_child_setup(cgroup, memory_gb),
+        )
+        if timeout_seconds is None:
+            timeout_seconds = DEFAULT_RUN_TIMEOUT_SECONDS
+        self._runs[run_id] = _Supervised(process, timeout_seconds or None, cgroup)
+        return process
+
+    def is_running(self, run_id: int) -> bool:
+        return run_id in self._runs
+
+    async def wait(self, run_id: int) -> Tuple[int, Optional[str]]:
+        """
+        Wait for a run's process to exit, enforcing its timeout.
+
+        Returns:
+            (exit_code, stop_reason) where `stop_reason` is None for a
+            normal exit, or "cancelled", "timeout" or "shutdown"
+        """
+        entry = self._runs[run_id]
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(entry.process.wait()), timeout=entry.timeout_seconds)
+            except asyncio.TimeoutError:
+                print(f"[SUPERVISOR] Run {run_id} exceeded {entry.timeout_seconds:.0f}s, terminating")
+                await self._terminate(run_id, entry, "timeout")
+            if entry.terminating is not None:
+                await entry.terminating
+            # Reap whatever Nextflow left behind in its process group
+            _signal_group(entry.process.pid, signal.SIGKILL)
+            return entry.process.returncode, entry.stop_reason
+        finally:
+            self._runs.pop(run_id, None)
+            _remove_cgroup(entry.cgroup)
+
+    async def cancel(self, run_id: int, reason: str = "cancelled") -> bool:
+        """Terminate a run; False if it is not running in this process."""
+        entry = self._runs.get(run_id)
+        if entry is None:
+            return False
+        await self._terminate(run_id, entry, reason)
+        return True
+
+    def cancel_soon(self, run_id: int, reason: str = "cancelled"):
+        """Start `cancel` without waiting for the grace period to end."""
+        task = asyncio.create_task(self.cancel(run_id, reason=reason))
+        self._cancelling.add(task)
+        task.add_done_callback(self._cancelling.discard)
+
+    async def shutdown(self):
+        """Terminate every supervised run (API shutdown)."""
+        await asyncio.gather(
+            *(self._terminate(run_id, entry, "shutdown") for run_id, entry in list(self._runs.items())),
+            return_exceptions=True,
+        )
+
+    async def _terminate(self, run_id: int, entry: _Supervised, reason: str):
+        if entry.stop_reason is None:
+            entry.stop_reason = reason
+        if entry.terminating is None:
+            entry.terminating = asyncio.create_task(self._stop_group(run_id, entry.process))
+        await asyncio.shield(entry.terminating)
+
+    async def _stop_group(self, run_id: int, process: asyncio.subprocess.Process):
+        if process.returncode is not None:
+            return
+        _signal_group(process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=self.kill_grace_seconds)
+        except asyncio.TimeoutError:
+            print(f"[SUPERVISOR] Run {run_id} ignored SIGTERM, killing process group")
+            _signal_group(process.pid, signal.SIGKILL)
+            await process.wait()
+
+
+def _signal_group(pgid: int, sig: int):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+supervisor = ProcessSupervisor()
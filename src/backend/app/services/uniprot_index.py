@@ -0,0 +1,618 @@
+"""
+Local index of reviewed UniProt entries for gene search and autocomplete.
+
+Built from a UniProt bulk export, either the Swiss-Prot flat file
+(uniprot_sprot.dat[.gz]) or a TSV download from the UniProt REST API:
+
+    python -m app.services.uniprot_index load uniprot_sprot.dat.gz --prune
+    python -m app.services.uniprot_index refresh   # entries modified since the last load
+
+Gene names, synonyms and accessions are kept in a clustered B-tree so exact
+and prefix lookups are a single range scan; protein names are searched
+through SQLite FTS5 when the SQLite build has it.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import datetime, date
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, TextIO
+import httpx
+from .metrics import CACHE_REQUESTS
+
+UNIPROT_INDEX_PATH = os.getenv(
+    "UNIPROT_INDEX_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../cache/uniprot_index.db"))
+)
+UNIPROT_REST_URL = os.getenv("UNIPROT_REST_URL", "https://rest.uniprot.org")
+# Bytes of the index file the reader maps into memory
+UNIPROT_INDEX_MMAP_BYTES = int(os.getenv("UNIPROT_INDEX_MMAP_BYTES", str(512 * 1024 * 1024)))
+
+# Kinds of indexed names, in ranking order
+PRIMARY_GENE, GENE_SYNONYM, ACCESSION, ENTRY_NAME = range(4)
+KIND_LABELS = {PRIMARY_GENE: "gene", GENE_SYNONYM: "synonym", ACCESSION: "accession", ENTRY_NAME: "entry_name"}
+
+# Fields requested from /uniprotkb/stream by `refresh`
+STREAM_FIELDS = (
+    "accession,id,protein_name,gene_primary,gene_synonym,gene_oln,gene_orf,"
+    "organism_name,organism_id,annotation_score,date_modified"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    accession TEXT NOT NULL UNIQUE,
+    entry_name TEXT,
+    protein_name TEXT,
+    protein_names TEXT,
+    gene_name TEXT,
+    taxon_id INTEGER,
+    score REAL NOT NULL DEFAULT 0,
+    modified TEXT,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS organisms (
+    taxon_id INTEGER PRIMARY KEY,
+    scientific_name TEXT NOT NULL COLLATE NOCASE,
+    common_name TEXT COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS ix_organisms_scientific_name ON organisms (scientific_name);
+CREATE INDEX IF NOT EXISTS ix_organisms_common_name ON organisms (common_name);
+CREATE TABLE IF NOT EXISTS names (
+    term TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    accession TEXT NOT NULL,
+    label TEXT NOT NULL,
+    taxon_id INTEGER,
+    PRIMARY KEY (term, kind, accession)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_names_taxon_term ON names (taxon_id, term);
+CREATE INDEX IF NOT EXISTS ix_names_accession ON names (accession);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS protein_fts USING fts5(
+    protein_names, content='entries', content_rowid='id', prefix='2 3'
+);
+"""
+
+_EVIDENCE = re.compile(r"\s*\{[^}]*\}")
+_FTS_TOKEN = re.compile(r"\w+")
+
+
+def normalize_term(text: str) -> str:
+    return text.strip().upper()
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Smallest string greater than every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _split_organism(text: str) -> tuple:
+    """'Homo sapiens (Human)' -> ('Homo sapiens', 'Human')."""
+    text = text.strip().rstrip(".")
+    match = re.match(r"^(.*?)\s*\(([^()]*)\)(?:\s*\(.*\))?$", text)
+    if match:
+        return match.group(1), match.group(2)
+    return text, None
+
+
+def _split_protein_names(text: str) -> List[str]:
+    """
+    'Cellular tumor antigen p53 (Antigen NY-CO-13) (p53)' -> the
+    recommended name followed by the alternative names.
+    """
+    text = re.sub(r"\s*\[(?:Cleaved into|Includes):.*$", "", text)
+    names, depth, current = [], 0, ""
+    for char in text:
+        if char == "(":
+            if depth == 0:
+                if current.strip():
+                    names.append(current.strip())
+                current = ""
+                depth += 1
+                continue
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                if current.strip():
+                    names.append(current.strip())
+                current = ""
+                continue
+        current += char
+    if current.strip():
+        names.append(current.strip())
+    return names
+
+
+def _open_text(path: str) -> TextIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _read_tsv(lines: Iterator[str]) -> Iterator[dict]:
+    """Entries of a UniProt REST TSV export (the columns of STREAM_FIELDS, or 'Gene Names')."""
+    header = next(lines, "").rstrip("\n").split("\t")
+    columns = {name: i for i, name in enumerate(header)}
+    if "Entry" not in columns:
+        raise ValueError("TSV sem a coluna 'Entry'")
+
+    def value(fields: List[str], name: str) -> str:
+        i = columns.get(name)
+        return fields[i].strip() if i is not None and i < len(fields) else ""
+
+    for line in lines:
+        fields = line.rstrip("\n").split("\t")
+        if not fields[0]:
+            continue
+        if value(fields, "Reviewed") == "unreviewed":
+            continue
+        if "Gene Names (primary)" in columns:
+            primary = [g.strip() for g in value(fields, "Gene Names (primary)").split(";") if g.strip()]
+            synonyms = [
+                g for column in ("Gene Names (synonym)", "Gene Names (ordered locus)", "Gene Names (ORF)")
+                for g in re.split(r"[\s;]+", value(fields, column)) if g
+            ]
+        else:
+            genes = value(fields, "Gene Names").split()
+            primary, synonyms = genes[:1], genes[1:]
+        scientific, common = _split_organism(value(fields, "Organism"))
+        taxon = value(fields, "Organism (ID)")
+        score = value(fields, "Annotation")
+        yield {
+            "accession": fields[0],
+            "secondary": [],
+            "entry_name": value(fields, "Entry Name") or None,
+            "protein_names": _split_protein_names(value(fields, "Protein names")),
+            "genes": primary[:1],
+            "synonyms": primary[1:] + synonyms,
+            "organism": scientific or None,
+            "common_name": common,
+            "taxon_id": int(taxon) if taxon.isdigit() else None,
+            "score": float(score) if re.match(r"^\d+(\.\d+)?$", score) else 0.0,
+            "modified": value(fields, "Date of last modification") or None,
+        }
+
+
+def _flat_date(text: str) -> Optional[str]:
+    try:
+        return datetime.strptime(text, "%d-%b-%Y").date().isoformat()
+    except ValueError:
+        return None
+
+
+def _flat_entry(lines: Dict[str, List[str]]) -> Optional[dict]:
+    id_line = lines.get("ID", [""])[0].split()
+    if len(id_line) < 2 or not id_line[1].startswith("Reviewed"):
+        return None
+    accessions = [a.strip() for a in " ".join(lines.get("AC", [])).split(";") if a.strip()]
+
+    protein_names = []
+    for line in lines.get("DE", []):
+        line = _EVIDENCE.sub("", line).strip()
+        if line.startswith(("Contains:", "Includes:")):
+            break
+        match = re.search(r"(?:Full|Short)=([^;]+);", line)
+        if match:
+            protein_names.append(match.group(1).strip())
+
+    genes, synonyms = [], []
+    for part in _EVIDENCE.sub("", " ".join(lines.get("GN", []))).split(";"):
+        key, _, values = part.strip().partition("=")
+        names = [v.strip() for v in values.split(",") if v.strip()]
+        if key.endswith("Name"):
+            (genes if not genes else synonyms).extend(names)
+        elif key in ("Synonyms", "OrderedLocusNames", "ORFNames"):
+            synonyms.extend(names)
+
+    scientific, common = _split_organism(" ".join(lines.get("OS", [])))
+    taxon = re.search(r"NCBI_TaxID=(\d+)", " ".join(lines.get("OX", [])))
+    modified = None
+    for line in lines.get("DT", []):
+        if "entry version" in line:
+            modified = _flat_date(line.split(",")[0].strip())
+    return {
+        "accession": accessions[0],
+        "secondary": accessions[1:],
+        "entry_name": id_line[0],
+        "protein_names": protein_names,
+        "genes": genes[:1],
+        "synonyms": genes[1:] + synonyms,
+        "organism": scientific or None,
+        "common_name": common,
+        "taxon_id": int(taxon.group(1)) if taxon else None,
+        "score": 0.0,
+        "modified": modified,
+    }
+
+
+def _read_flat(lines: Iterator[str]) -> Iterator[dict]:
+    """Reviewed entries of a UniProtKB flat file (uniprot_sprot.dat)."""
+    current: Dict[str, List[str]] = {}
+    for line in lines:
+        if line.startswith("//"):
+            entry = _flat_entry(current)
+            if entry is not None:
+                yield entry
+            current = {}
+            continue
+        code = line[:2]
+        if code in ("ID", "AC", "DE", "GN", "OS", "OX", "DT"):
+            current.setdefault(code, []).append(line[5:].rstrip("\n"))
+
+
+def read_export(path: str) -> Iterator[dict]:
+    """Entries of a UniProt export file, detecting flat file or TSV from the first line."""
+    with _open_text(path) as f:
+        first = f.readline()
+        lines = chain([first], f)
+        if first.startswith("ID   "):
+            yield from _read_flat(lines)
+        else:
+            yield from _read_tsv(lines)
+
+
+class UniProtIndex:
+    """
+    SQLite index of UniProt entries.
+
+    Readers share one connection with the database memory-mapped; loads
+    use their own connection and a single transaction, so lookups keep
+    answering from the previous state (WAL) until a load commits.
+    """
+
+    def __init__(self, path: str = UNIPROT_INDEX_PATH, mmap_bytes: int = UNIPROT_INDEX_MMAP_BYTES):
+        self.path = path
+        self.mmap_bytes = mmap_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._fts: Optional[bool] = None
+
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        """Read connection, or None while no index has been built."""
+        if self._conn is None:
+            if not os.path.exists(self.path):
+                return None
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={self.mmap_bytes}")
+            self._fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'protein_fts'"
+            ).fetchone() is not None
+            self._conn = conn
+        return self._conn
+
+    def _writer(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        try:
+            conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            print(f"[UNIPROT INDEX] FTS5 unavailable, protein names will not be searchable: {e}")
+        return conn
+
+    def _loaded(self, conn: sqlite3.Connection) -> bool:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'entry_count'").fetchone()
+        return bool(row and int(row[0]) > 0)
+
+    def _taxa(self, conn: sqlite3.Connection, organism: Optional[str]) -> Optional[List[int]]:
+        """Taxon IDs for an organism given as NCBI taxon ID, scientific or common name."""
+        if not organism:
+            return None
+        organism = organism.strip()
+        if organism.isdigit():
+            return [int(organism)]
+        rows = conn.execute(
+            "SELECT taxon_id FROM organisms WHERE scientific_name = ? OR common_name = ?",
+            (organism, organism)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _taxon_filter(taxa: Optional[List[int]]) -> str:
+        if taxa is None:
+            return ""
+        return f" AND n.taxon_id IN ({','.join(str(int(t)) for t in taxa)})"
+
+    def search(self, query: str, organism: Optional[str] = None, limit: int = 5) -> Optional[List[dict]]:
+        """
+        Entries whose gene name, gene synonym, accession or entry name is
+        `query` (case-insensitive): primary gene names first, then names
+        with the same case as the query, then by annotation score.
+
+        Returns None when no index has been loaded.
+        """
+        with self._lock:
+            conn = self._reader()
+            if conn is None or not self._loaded(conn):
+                return None
+            taxa = self._taxa(conn, organism)
+            if taxa == []:
+                return []
+            rows = conn.execute(
+                "SELECT e.accession, e.protein_name, e.gene_name, o.scientific_name, n.label "
+                "FROM names n JOIN entries e ON e.accession = n.accession "
+                "LEFT JOIN organisms o ON o.taxon_id = e.taxon_id "
+                f"WHERE n.term = ?{self._taxon_filter(taxa)} "
+                "ORDER BY n.kind, n.label = ? DESC, e.score DESC, e.accession LIMIT ?",
+                (normalize_term(query), query.strip(), limit * 2)
+            ).fetchall()
+        results, seen = [], set()
+        for accession, protein_name, gene_name, organism_name, label in rows:
+            if accession in seen:
+                continue
+            seen.add(accession)
+            results.append({
+                "uniprot_id": accession,
+                "protein_name": protein_name or "Unknown",
+                "gene_name": gene_name or label,
+                "organism": organism_name or "Unknown",
+            })
+        CACHE_REQUESTS.inc(cache="uniprot_index", result="hit" if results else "miss")
+        return results[:limit]
+
+    def suggest(self, prefix: str, organism: Optional[str] = None, limit: int = 10) -> Optional[List[dict]]:
+        """
+        Autocomplete: gene names, synonyms and accessions starting with
+        `prefix`, in alphabetical order, then protein names containing
+        words that start with the prefix words.
+
+        Returns None when no index has been loaded.
+        """
+        term = normalize_term(prefix)
+        if not term:
+            return []
+        with self._lock:
+            conn = self._reader()
+            if conn is None or not self._loaded(conn):
+                return None
+            taxa = self._taxa(conn, organism)
+            if taxa == []:
+                return []
+            rows = conn.execute(
+                "SELECT n.label, n.kind, e.accession, e.protein_name, e.gene_name, o.scientific_name "
+                "FROM names n JOIN entries e ON e.accession = n.accession "
+                "LEFT JOIN organisms o ON o.taxon_id = e.taxon_id "
+                f"WHERE n.term >= ? AND n.term < ? AND n.kind <= {ACCESSION}{self._taxon_filter(taxa)} "
+                "ORDER BY n.term, n.kind LIMIT ?",
+                (term, _prefix_upper_bound(term), limit * 2)
+            ).fetchall()
+            suggestions, seen = [], set()
+            for label, kind, accession, protein_name, gene_name, organism_name in rows:
+                if accession in seen:
+                    continue
+                seen.add(accession)
+                suggestions.append({
+                    "text": label, "match": KIND_LABELS[kind], "uniprot_id": accession,
+                    "gene_name": gene_name, "protein_name": protein_name, "organism": organism_name,
+                })
+            tokens = _FTS_TOKEN.findall(prefix)
+            if self._fts and len(suggestions) < limit and len(term) >= 2 and tokens:
+                match = " ".join(f'"{token}"*' for token in tokens)
+                taxon_filter = self._taxon_filter(taxa).replace("n.taxon_id", "e.taxon_id")
+                rows = conn.execute(
+                    "SELECT e.protein_name, e.accession, e.gene_name, o.scientific_name "
+                    "FROM protein_fts JOIN entries e ON e.id = protein_fts.rowid "
+                    "LEFT JOIN organisms o ON o.taxon_id = e.taxon_id "
+                    # Unordered: ranking every match of a common word costs
+                    # far more than the lookup itself
+                    f"WHERE protein_fts MATCH ?{taxon_filter} LIMIT ?",
+                    (match, limit * 2)
+                ).fetchall()
+                for protein_name, accession, gene_name, organism_name in rows:
+                    if accession in seen:
+                        continue
+                    seen.add(accession)
+                    suggestions.append({
+                        "text": protein_name, "match": "protein_name", "uniprot_id": accession,
+                        "gene_name": gene_name, "protein_name": protein_name, "organism": organism_name,
+                    })
+        return suggestions[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._reader()
+            if conn is None:
+                return {"loaded": False, "entries": 0}
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        return {
+            "loaded": int(meta.get("entry_count", 0)) > 0,
+            "entries": int(meta.get("entry_count", 0)),
+            "organisms": int(meta.get("organism_count", 0)),
+            "last_modified": meta.get("last_modified"),
+            "loaded_at": meta.get("loaded_at"),
+            "source": meta.get("source"),
+        }
+
+    # ----- Building -----
+
+    @staticmethod
+    def _digest(entry: dict) -> str:
+        return hashlib.sha1(json.dumps(entry, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _name_rows(entry: dict) -> List[tuple]:
+        accession, taxon_id = entry["accession"], entry["taxon_id"]
+        names = [(gene, PRIMARY_GENE) for gene in entry["genes"]]
+        names += [(gene, GENE_SYNONYM) for gene in entry["synonyms"]]
+        names += [(acc, ACCESSION) for acc in [accession] + entry["secondary"]]
+        if entry["entry_name"]:
+            names.append((entry["entry_name"], ENTRY_NAME))
+        rows = {}
+        for label, kind in names:
+            key = (normalize_term(label), kind)
+            if key[0] and key not in rows:
+                rows[key] = (key[0], kind, accession, label, taxon_id)
+        return list(rows.values())
+
+    def _remove(self, conn: sqlite3.Connection, fts: bool, row_id: int, accession: str, protein_names: str):
+        conn.execute("DELETE FROM names WHERE accession = ?", (accession,))
+        if fts:
+            conn.execute(
+                "INSERT INTO protein_fts (protein_fts, rowid, protein_names) VALUES ('delete', ?, ?)",
+                (row_id, protein_names or "")
+            )
+
+    def load(self, entries: Iterator[dict], prune: bool = False, source: Optional[str] = None) -> dict:
+        """
+        Add or update entries; unchanged entries (same content digest) are
+        skipped. With `prune` the input is taken as a full export and
+        entries missing from it are removed.
+
+        Returns counts of added, updated, unchanged and removed entries.
+        """
+        conn = self._writer()
+        fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'protein_fts'").fetchone() is not None
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+        try:
+            conn.execute("BEGIN")
+            if prune:
+                conn.execute("CREATE TEMP TABLE seen (accession TEXT PRIMARY KEY)")
+            for entry in entries:
+                digest = self._digest(entry)
+                protein_names = "; ".join(entry["protein_names"])
+                if prune:
+                    conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (entry["accession"],))
+                if entry["taxon_id"] is not None and entry["organism"]:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO organisms VALUES (?, ?, ?)",
+                        (entry["taxon_id"], entry["organism"], entry["common_name"])
+                    )
+                existing = conn.execute(
+                    "SELECT id, digest, protein_names FROM entries WHERE accession = ?", (entry["accession"],)
+                ).fetchone()
+                values = (
+                    entry["entry_name"], entry["protein_names"][0] if entry["protein_names"] else None,
+                    protein_names, entry["genes"][0] if entry["genes"] else None,
+                    entry["taxon_id"], entry["score"], entry["modified"], digest,
+                )
+                if existing is None:
+                    row_id = conn.execute(
+                        "INSERT INTO entries (entry_name, protein_name, protein_names, gene_name, taxon_id, "
+                        "score, modified, digest, accession) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        values + (entry["accession"],)
+                    ).lastrowid
+                    counts["added"] += 1
+                elif existing[1] == digest:
+                    counts["unchanged"] += 1
+                    continue
+                else:
+                    row_id = existing[0]
+                    self._remove(conn, fts, row_id, entry["accession"], existing[2])
+                    conn.execute(
+                        "UPDATE entries SET entry_name = ?, protein_name = ?, protein_names = ?, gene_name = ?, "
+                        "taxon_id = ?, score = ?, modified = ?, digest = ? WHERE accession = ?",
+                        values + (entry["accession"],)
+                    )
+                    counts["updated"] += 1
+                conn.executemany("INSERT OR IGNORE INTO names VALUES (?, ?, ?, ?, ?)", self._name_rows(entry))
+                if fts:
+                    conn.execute("INSERT INTO protein_fts (rowid, protein_names) VALUES (?, ?)", (row_id, protein_names))
+
+            if prune:
+                stale = conn.execute(
+                    "SELECT id, accession, protein_names FROM entries "
+                    "WHERE accession NOT IN (SELECT accession FROM seen)"
+                ).fetchall()
+                for row_id, accession, protein_names in stale:
+                    self._remove(conn, fts, row_id, accession, protein_names)
+                    conn.execute("DELETE FROM entries WHERE id = ?", (row_id,))
+                counts["removed"] = len(stale)
+                conn.execute("DROP TABLE seen")
+
+            meta = {
+                "entry_count": conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+                "organism_count": conn.execute("SELECT COUNT(*) FROM organisms").fetchone()[0],
+                "last_modified": conn.execute("SELECT MAX(modified) FROM entries").fetchone()[0] or "",
+                "loaded_at": datetime.utcnow().isoformat(),
+                "source": source or "",
+            }
+            conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        print(f"[UNIPROT INDEX] Loaded {source or 'entries'}: {counts}")
+        return counts
+
+    def load_file(self, path: str, prune: bool = False) -> dict:
+        return self.load(read_export(path), prune=prune, source=os.path.basename(path))
+
+    def refresh(self, since: Optional[str] = None, timeout: float = 600) -> dict:
+        """
+        Download reviewed entries modified since `since` (ISO date; default:
+        the newest modification date in the index) from the UniProt REST
+        API and load them.
+
+        Entries deleted from UniProt are only dropped by a full load with
+        `prune`.
+        """
+        if since is None:
+            with self._lock:
+                conn = self._reader()
+                if conn is not None:
+                    row = conn.execute("SELECT value FROM meta WHERE key = 'last_modified'").fetchone()
+                    since = row[0] if row and row[0] else None
+        query = "reviewed:true"
+        if since:
+            query += f" AND date_modified:[{date.fromisoformat(since).isoformat()} TO *]"
+        with tempfile.NamedTemporaryFile("w+", suffix=".tsv", encoding="utf-8") as tmp:
+            with httpx.stream(
+                "GET", f"{UNIPROT_REST_URL}/uniprotkb/stream",
+                params={"query": query, "format": "tsv", "fields": STREAM_FIELDS},
+                timeout=timeout
+            ) as response:
+                response.raise_for_status()
+                for chunk in response.iter_text():
+                    tmp.write(chunk)
+            tmp.flush()
+            tmp.seek(0)
+            first = tmp.readline()
+            if not first.strip():
+                return {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+            return self.load(_read_tsv(chain([first], tmp)), source=f"uniprot stream since {since or 'start'}")
+
+
+uniprot_index = UniProtIndex()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the local UniProt index")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    load = subcommands.add_parser("load", help="Load a Swiss-Prot flat file or UniProt TSV export (.gz allowed)")
+    load.add_argument("path")
+    load.add_argument("--prune", action="store_true", help="Remove entries missing from this (full) export")
+    refresh = subcommands.add_parser("refresh", help="Fetch entries modified since the last load from UniProt")
+    refresh.add_argument("--since", help="ISO date (default: newest modification date in the index)")
+    subcommands.add_parser("stats", help="Show index statistics")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        result = uniprot_index.load_file(args.path, prune=args.prune)
+    elif args.command == "refresh":
+        result = uniprot_index.refresh(args.since)
+    else:
+        result = uniprot_index.stats()
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session, select
+from ..database import engine, Pipeline, PipelineRun, RunOutputFile, RUN_FINISHED_STATUSES
+from .runner import RUNS_DIR, pipeline_workspace
+from .datasets import (
+    STAGED_INPUTS_DIRNAME, expire_uploads, prune_staged_inputs, remove_staged_inputs, staged_inputs_size
+)
+from .read_cache import read_cache
+
+# Disk budget of each project (run directories + pipeline workspaces);
+# 0 disables the quota
+PROJECT_QUOTA_MB = int(os.getenv("WORKSPACE_PROJECT_QUOTA_MB", "10240"))
+# Work directories untouched for longer than this are evicted
+WORK_MAX_AGE_HOURS = float(os.getenv("WORKSPACE_WORK_MAX_AGE_HOURS", "168"))
+JANITOR_INTERVAL_SECONDS = float(os.getenv("WORKSPACE_JANITOR_INTERVAL_SECONDS", "900"))
+
+ACTIVE_STATUSES = ("pending", "running")
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def dir_size(path: str, exclude: Tuple[str, ...] = ()) -> int:
+    """
+    Total size of the files under `path`, without following symlinks.
+    Top-level entries named in `exclude` are skipped.
+    """
+    total = 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if current == path and entry.name in exclude:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    return total
+
+
+def run_dir(run_id: int) -> str:
+    return os.path.join(RUNS_DIR, f"run_{run_id}")
+
+
+def run_results_dir(run: PipelineRun) -> str:
+    """Directory the run published its outputs to (`--outdir`, set by the runner)."""
+    return os.path.join(run_dir(run.id), "results")
+
+
+def _output_roots(run: PipelineRun) -> Tuple[str, ...]:
+    """
+    Directories published outputs may resolve to: the run directory and,
+    as publishDir symlinks into the work directory by default, the
+    pipeline workspace.
+    """
+    return tuple(os.path.realpath(path) for path in (run_dir(run.id), pipeline_workspace(run.pipeline_id)))
+
+
+def _is_within(path: str, roots: Tuple[str, ...]) -> bool:
+    real = os.path.realpath(path)
+    return any(real == root or real.startswith(root + os.sep) for root in roots)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_run_outputs(run_id: int) -> int:
+    """
+    (Re)build the `RunOutputFile` rows of a run from its results directory.
+
+    Checksums of files whose size and modification time did not change
+    are reused instead of being recomputed.
+
+    Returns:
+        number of indexed files
+    """
+    with Session(engine) as session:
+        run = session.get(PipelineRun, run_id)
+        if run is None:
+            return 0
+        results_dir = run_results_dir(run)
+        roots = _output_roots(run)
+        existing = {
+            row.path: row
+            for row in session.exec(select(RunOutputFile).where(RunOutputFile.run_id == run_id)).all()
+        }
+        seen = set()
+        for root, _, files in os.walk(results_dir):
+            for name in files:
+                full_path = os.path.join(root, name)
+                if not _is_within(full_path, roots):
+                    continue  # Symlink to a file outside the run
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue  # Dangling symlink
+                rel_path = os.path.relpath(full_path, results_dir).replace(os.sep, "/")
+                modified_at = datetime.utcfromtimestamp(stat.st_mtime)
+                seen.add(rel_path)
+                row = existing.get(rel_path)
+                if row is not None and row.size_bytes == stat.st_size and row.modified_at == modified_at:
+                    continue
+                row = row or RunOutputFile(run_id=run_id, path=rel_path)
+                row.size_bytes = stat.st_size
+                row.modified_at = modified_at
+                row.sha256 = _sha256(full_path)
+                row.media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                session.add(row)
+        for rel_path, row in existing.items():
+            if rel_path not in seen:
+                session.delete(row)
+        run.outputs_indexed_at = datetime.utcnow()
+        session.add(run)
+        session.commit()
+    read_cache.invalidate("run", run_id)
+    return len(seen)
+
+
+def output_file_path(run: PipelineRun, output: RunOutputFile) -> Optional[str]:
+    """Path of an indexed output, or None if it now resolves outside the run."""
+    path = os.path.join(run_results_dir(run), *output.path.split("/"))
+    if not _is_within(path, _output_roots(run)):
+        return None
+    return path
+
+
+@dataclass
+class _WorkDir:
+    path: str
+    project_id: int
+    last_used: datetime
+    size_bytes: int
+    pipeline_id: Optional[int] = None  # Shared pipeline workspace
+    run_id: Optional[int] = None  # Legacy per-run work directory
+
+
+class WorkspaceJanitor:
+    """
+    Background garbage collector for run workspaces.
+
+    Nextflow work directories (intermediate task files) are evicted when
+    they are older than the maximum age, and then least-recently-used
+    first while a project is over its disk quota. Published results and
+    run logs are never deleted, and workspaces of pipelines with a pending
+    or running run are left alone. Datasets staged in a workspace are
+    removed with its work directory, or once the dataset is deleted. Each
+    pass also indexes the outputs of finished runs that were not indexed
+    yet and discards abandoned dataset uploads.
+    """
+
+    def __init__(
+        self,
+        quota_bytes: int = PROJECT_QUOTA_MB * 1024 * 1024,
+        max_age: timedelta = timedelta(hours=WORK_MAX_AGE_HOURS),
+        interval_seconds: float = JANITOR_INTERVAL_SECONDS,
+    ):
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.interval_seconds = interval_seconds
+        self.usage: Dict[int, int] = {}  # project_id -> bytes, from the last pass
+        self.last_run_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def over_quota(self, project_id: int) -> bool:
+        """Whether the project was still over quota after the last pass."""
+        return self.quota_bytes > 0 and self.usage.get(project_id, 0) > self.quota_bytes
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.collect)
+            except Exception as e:
+                print(f"[JANITOR ERROR] {type(e).__name__}: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def collect(self) -> Dict[str, int]:
+        """Run one pass: index outputs, evict work directories, update usage."""
+        indexed = self._index_pending_outputs()
+        expired_uploads = expire_uploads()
+        run_owners, pipeline_projects, active_pipelines, last_used = self._load_ownership()
+
+        usage: Dict[int, int] = {}
+        work_dirs: List[_WorkDir] = []
+        for run_id, (pipeline_id, project_id) in run_owners.items():
+            path = run_dir(run_id)
+            if not os.path.isdir(path):
+                continue
+            usage[project_id] = usage.get(project_id, 0) + dir_size(path)
+            work_path = os.path.join(path, "work")
+            if os.path.isdir(work_path) and pipeline_id not in active_pipelines:
+                work_dirs.append(_WorkDir(
+                    work_path, project_id, last_used.get(("run", run_id), datetime.min),
+                    dir_size(work_path), run_id=run_id,
+                ))
+        for pipeline_id, project_id in pipeline_projects.items():
+            path = pipeline_workspace(pipeline_id)
+            if not os.path.isdir(path):
+                continue
+            if pipeline_id not in active_pipelines:
+                prune_staged_inputs(path)
+            # Staged datasets are links into the dataset store, not copies,
+            # unless their dataset was deleted while a run was using them
+            staged_size = staged_inputs_size(path)
+            usage[project_id] = usage.get(project_id, 0) + dir_size(path, exclude=(STAGED_INPUTS_DIRNAME,)) \
+                + staged_size
+            work_path = os.path.join(path, "work")
+            if os.path.isdir(work_path) and pipeline_id not in active_pipelines:
+                work_dirs.append(_WorkDir(
+                    work_path, project_id, last_used.get(("pipeline", pipeline_id), datetime.min),
+                    dir_size(work_path) + staged_size, pipeline_id=pipeline_id,
+                ))
+
+        evicted = 0
+        freed = 0
+        cutoff = datetime.utcnow() - self.max_age
+        for work_dir in sorted(work_dirs, key=lambda w: w.last_used):
+            expired = work_dir.last_used < cutoff
+            over = self.quota_bytes > 0 and usage.get(work_dir.project_id, 0) > self.quota_bytes
+            if not (expired or over):
+                continue
+            shutil.rmtree(work_dir.path, ignore_errors=True)
+            if work_dir.pipeline_id is not None:
+                # Staged again by the next run
+                remove_staged_inputs(pipeline_workspace(work_dir.pipeline_id))
+            self._mark_evicted(work_dir)
+            usage[work_dir.project_id] -= work_dir.size_bytes
+            evicted += 1
+            freed += work_dir.size_bytes
+
+        for project_id, used in usage.items():
+            if self.quota_bytes > 0 and used > self.quota_bytes:
+                print(f"[JANITOR] Project {project_id} still over quota with outputs only: {used} bytes")
+        self.usage = usage
+        self.last_run_at = datetime.utcnow()
+        if indexed or evicted or expired_uploads:
+            print(
+                f"[JANITOR] Indexed {indexed} runs, evicted {evicted} work directories ({freed} bytes), "
+                f"expired {expired_uploads} dataset uploads"
+            )
+        return {"indexed_runs": indexed, "evicted": evicted, "freed_bytes": freed, "expired_uploads": expired_uploads}
+
+    def _index_pending_outputs(self) -> int:
+        with Session(engine) as session:
+            run_ids = session.exec(
+                select(PipelineRun.id).where(
+                    PipelineRun.status.in_(RUN_FINISHED_STATUSES),
+                    PipelineRun.outputs_indexed_at == None,  # noqa: E711
+                )
+            ).all()
+        for run_id in run_ids:
+            index_run_outputs(run_id)
+        return len(run_ids)
+
+    @staticmethod
+    def _load_ownership() -> Tuple[Dict[int, Tuple[int, int]], Dict[int, int], set, Dict[tuple, datetime]]:
+        """
+        Map run and pipeline directories to their owners and find when each
+        was last used.
+
+        Returns:
+            (run_id -> (pipeline_id, project_id), pipeline_id -> project_id,
+            pipelines with an active run, last use per directory)
+        """
+        with Session(engine) as session:
+            pipeline_projects = dict(session.exec(select(Pipeline.id, Pipeline.project_id)).all())
+            rows = session.exec(
+                select(PipelineRun.id, PipelineRun.pipeline_id, PipelineRun.status,
+                       PipelineRun.completed_at, PipelineRun.queued_at)
+            ).all()
+        run_owners: Dict[int, Tuple[int, int]] = {}
+        active_pipelines = set()
+        last_used: Dict[tuple, datetime] = {}
+        for run_id, pipeline_id, status, completed_at, queued_at in rows:
+            if pipeline_id not in pipeline_projects:
+                continue
+            run_owners[run_id] = (pipeline_id, pipeline_projects[pipeline_id])
+            if status in ACTIVE_STATUSES:
+                active_pipelines.add(pipeline_id)
+            used = completed_at or queued_at or datetime.min
+            last_used[("run", run_id)] = used
+            key = ("pipeline", pipeline_id)
+            last_used[key] = max(last_used.get(key, datetime.min), used)
+        return run_owners, pipeline_projects, active_pipelines, last_used
+
+    @staticmethod
+    def _mark_evicted(work_dir: _WorkDir):
+        with Session(engine) as session:
+            query = select(PipelineRun).where(PipelineRun.work_evicted_at == None)  # noqa: E711
+            if work_dir.pipeline_id is not None:
+                query = query.where(PipelineRun.pipeline_id == work_dir.pipeline_id)
+            else:
+                query = query.where(PipelineRun.id == work_dir.run_id)
+            now = datetime.utcnow()
+            runs = session.exec(query).all()
+            for run in runs:
+                run.work_evicted_at = now
+                session.add(run)
+            session.commit()
+            read_cache.invalidate("run", *(run.id for run in runs))
+
+
+workspace_janitor = WorkspaceJanitor()
@@ -0,0 +1,55 @@
+"""
+Standalone pipeline run worker.
+
+Claims queued `PipelineRun` rows from the shared database and executes
+them, holding each under a lease renewed by a heartbeat. Any number of
+workers, on one or several machines, can serve the same queue; start the
+API with RUN_EXECUTION_BACKEND=worker so it only queues runs.
+
+Workers on different machines need the runs, scripts and workspaces
+directories on a shared filesystem, like Nextflow's work directory.
+
+Usage:
+    python -m app.worker [--max-runs N] [--cpus N] [--memory-gb N]
+"""
+import argparse
+import asyncio
+import signal
+from .database import create_db_and_tables, dispose_engines
+from .services.runner import prepare_directories
+from .services.scheduler import RunScheduler, MAX_CONCURRENT_RUNS, CPU_SLOTS, MEMORY_SLOTS_GB
+
+
+async def run_worker(max_runs: int, cpus: int, memory_gb: int, worker_id: str = None):
+    prepare_directories()
+    create_db_and_tables()
+    scheduler = RunScheduler(
+        max_concurrent=max_runs,
+        cpu_slots=cpus,
+        memory_slots_gb=memory_gb,
+        worker_id=worker_id,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await scheduler.start()
+    await stop.wait()
+    print(f"[WORKER] {scheduler.worker_id} stopping; releasing {scheduler.running_count} runs")
+    await scheduler.stop()
+    await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CiencIA pipeline run worker")
+    parser.add_argument("--max-runs", type=int, default=MAX_CONCURRENT_RUNS, help="Concurrent runs")
+    parser.add_argument("--cpus", type=int, default=CPU_SLOTS, help="CPU slots")
+    parser.add_argument("--memory-gb", type=int, default=MEMORY_SLOTS_GB, help="Memory slots in GB")
+    parser.add_argument("--worker-id", default=None, help="Worker name (default: host:pid)")
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.max_runs, args.cpus, args.memory_gb, args.worker_id))
+
+
+if __name__ == "__main__":
+    main()
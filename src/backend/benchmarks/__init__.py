@@ -0,0 +1,4 @@
+"""
+Load benchmarks for the CiencIA API, run against local stand-ins for
+AlphaFold DB, UniProt, Gemini and Nextflow. See `benchmarks.run`.
+"""
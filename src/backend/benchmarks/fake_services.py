@@ -0,0 +1,209 @@
+"""
+Local stand-ins for the external services the API calls.
+
+`app` serves the AlphaFold DB and UniProt endpoints used by
+`alphafold_service` (run it with uvicorn and point ALPHAFOLD_DB_URL /
+UNIPROT_REST_URL at it). `FakeGenerativeModel` replaces the Gemini model
+object in `llm_service`.
+
+Latencies come from FAKE_UPSTREAM_LATENCY_MS and the FakeGenerativeModel
+arguments, so runs are reproducible.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import zlib
+from typing import List, Optional
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+UPSTREAM_LATENCY_SECONDS = float(os.getenv("FAKE_UPSTREAM_LATENCY_MS", "50")) / 1000
+# Residues per synthetic structure (PDB size grows linearly with it)
+STRUCTURE_RESIDUES = int(os.getenv("FAKE_STRUCTURE_RESIDUES", "400"))
+MODEL_VERSION = 4
+
+RESIDUE_NAMES = ("ALA", "GLY", "SER", "LEU", "VAL", "GLU", "LYS", "ASP", "THR", "ILE")
+
+app = FastAPI(title="Fake AlphaFold DB / UniProt")
+
+
+def synthetic_pdb(uniprot_id: str, residues: int = STRUCTURE_RESIDUES) -> str:
+    """A deterministic CA-only PDB file with pLDDT in the B-factor column."""
+    seed = int(hashlib.sha256(uniprot_id.encode()).hexdigest()[:8], 16)
+    lines = [f"HEADER    FAKE STRUCTURE {uniprot_id}"]
+    for i in range(residues):
+        angle = i * 1.745 + seed % 7
+        x, y, z = 2.3 * math.cos(angle), 2.3 * math.sin(angle), 1.5 * i
+        plddt = 50 + (seed + i * 37) % 50
+        name = RESIDUE_NAMES[(seed + i) % len(RESIDUE_NAMES)]
+        lines.append(
+            f"ATOM  {i + 1:5d}  CA  {name} A{i + 1:4d}    {x:8.3f}{y:8.3f}{z:8.3f}  1.00{plddt:6.2f}           C"
+        )
+    lines.append("END")
+    return "\n".join(lines) + "\n"
+
+
+def _accession(gene: str, i: int) -> str:
+    # A stable digest: hash() of strings changes with every process
+    return f"P{zlib.crc32(f'{gene}:{i}'.encode()) % 100000:05d}"
+
+
+def _etag(uniprot_id: str) -> str:
+    return f'"{uniprot_id}-v{MODEL_VERSION}"'
+
+
+@app.get("/api/prediction/{uniprot_id}")
+async def prediction(uniprot_id: str, request: Request):
+    await asyncio.sleep(UPSTREAM_LATENCY_SECONDS)
+    # IDs starting with X do not exist, to exercise the 404 path
+    if uniprot_id.startswith("X"):
+        return JSONResponse({"detail": "Not found"}, status_code=404)
+    etag = _etag(uniprot_id)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    base = str(request.base_url).rstrip("/")
+    entry = {
+        "entryId": f"AF-{uniprot_id}-F1",
+        "uniprotAccession": uniprot_id,
+        "latestVersion": MODEL_VERSION,
+        "pdbUrl": f"{base}/files/AF-{uniprot_id}-F1-model_v{MODEL_VERSION}.pdb",
+    }
+    return JSONResponse([entry], headers={"ETag": etag})
+
+
+@app.get("/files/{filename}")
+async def structure_file(filename: str):
+    await asyncio.sleep(UPSTREAM_LATENCY_SECONDS)
+    uniprot_id = filename.split("-")[1] if filename.count("-") >= 2 else filename
+    return PlainTextResponse(synthetic_pdb(uniprot_id))
+
+
+@app.get("/uniprotkb/search")
+async def uniprot_search(query: str = "", size: int = 5):
+    await asyncio.sleep(UPSTREAM_LATENCY_SECONDS)
+    gene = query.split("gene:", 1)[-1].split("+", 1)[0].split(" ", 1)[0].upper() or "GENE"
+    results = [
+        {
+            "primaryAccession": _accession(gene, i),
+            "proteinDescription": {"recommendedName": {"fullName": {"value": f"{gene} protein {i}"}}},
+            "organism": {"scientificName": "Homo sapiens"},
+        }
+        for i in range(min(size, 5))
+    ]
+    return {"results": results}
+
+
+# Genes of the synthetic UniProt export served by /uniprotkb/stream
+UNIPROT_GENES = ("TP53", "BRCA1", "EGFR", "MAP3K7", "KRAS", "MYC", "PTEN", "AKT1")
+UNIPROT_ORGANISMS = (("Homo sapiens (Human)", 9606), ("Mus musculus (Mouse)", 10090), ("Rattus norvegicus (Rat)", 10116))
+UNIPROT_SYNTHETIC_ENTRIES = int(os.getenv("FAKE_UNIPROT_ENTRIES", "5000"))
+UNIPROT_TSV_COLUMNS = (
+    "Entry", "Entry Name", "Protein names", "Gene Names (primary)", "Gene Names (synonym)",
+    "Organism", "Organism (ID)", "Annotation", "Date of last modification",
+)
+
+
+def synthetic_uniprot_tsv() -> str:
+    """A UniProt TSV export with the benchmark genes plus generated ones."""
+    rows = []
+    genes = list(UNIPROT_GENES) + [f"G{i:05d}" for i in range(UNIPROT_SYNTHETIC_ENTRIES)]
+    for i, gene in enumerate(genes):
+        organism, taxon = UNIPROT_ORGANISMS[i % len(UNIPROT_ORGANISMS)]
+        accession = _accession(gene, 0) if gene in UNIPROT_GENES else f"Q{i:05d}"
+        rows.append((
+            accession, f"{gene}_FAKE", f"{gene} protein (Fake {gene.lower()})", gene, f"{gene}L",
+            organism, str(taxon), "5.0", "2024-01-01",
+        ))
+    return "\n".join("\t".join(row) for row in [UNIPROT_TSV_COLUMNS] + rows) + "\n"
+
+
+@app.get("/uniprotkb/stream")
+async def uniprot_stream(query: str = "", format: str = "tsv", fields: str = ""):
+    await asyncio.sleep(UPSTREAM_LATENCY_SECONDS)
+    return PlainTextResponse(synthetic_uniprot_tsv())
+
+
+# ----- Gemini -----
+
+FAKE_PIPELINE = """#!/usr/bin/env nextflow
+nextflow.enable.dsl = 2
+
+process HELLO {
+    container 'ubuntu:22.04'
+    output:
+    stdout
+    script:
+    \"\"\"
+    echo hello
+    \"\"\"
+}
+
+workflow {
+    HELLO()
+}
+"""
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeStream:
+    """Async-iterable response of a `stream=True` call."""
+
+    def __init__(self, chunks: List[str], chunk_delay: float):
+        self._chunks = chunks
+        self._chunk_delay = chunk_delay
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._chunk_delay)
+            yield _FakeResponse(chunk)
+
+    def __aiter__(self):
+        self._iterator = self._iterate()
+        return self._iterator
+
+
+class _FakeChat:
+    def __init__(self, model: "FakeGenerativeModel", history: Optional[list]):
+        self._model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, message, request_options=None, stream: bool = False):
+        return await self._model.generate_content_async(message, request_options, stream=stream)
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for `genai.GenerativeModel` with fixed latency.
+
+    Non-streaming calls take `latency_seconds`; streaming calls return the
+    first chunk after `latency_seconds` and then one chunk every
+    `chunk_delay_seconds`.
+    """
+
+    def __init__(self, latency_seconds: float = 0.5, chunk_delay_seconds: float = 0.02, chunks: int = 20):
+        self.latency_seconds = latency_seconds
+        self.chunk_delay_seconds = chunk_delay_seconds
+        self.chunks = chunks
+        self.calls = 0
+
+    def _reply(self, prompt) -> str:
+        if "Nextflow" in str(prompt) and "script" in str(prompt).lower():
+            return FAKE_PIPELINE
+        return f"Fake answer to: {str(prompt)[:80]}"
+
+    async def generate_content_async(self, prompt, request_options=None, stream: bool = False):
+        self.calls += 1
+        await asyncio.sleep(self.latency_seconds)
+        text = self._reply(prompt)
+        if not stream:
+            return _FakeResponse(text)
+        size = max(1, math.ceil(len(text) / self.chunks))
+        return _FakeStream([text[i:i + size] for i in range(0, len(text), size)], self.chunk_delay_seconds)
+
+    def start_chat(self, history=None):
+        return _FakeChat(self, history)
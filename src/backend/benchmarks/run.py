@@ -0,0 +1,516 @@
+"""
+Load benchmark for the API.
+
+Starts the fake AlphaFold DB / UniProt server and the API (with a fake
+Gemini model and the fake `nextflow` in benchmarks/bin) on free local
+ports, with a throw-away database and caches, then drives a weighted mix
+of requests with N closed-loop clients for each concurrency level.
+
+Usage (from src/backend):
+    python -m benchmarks.run --concurrency 1,8,32 --duration 20 --output bench.json
+    python -m benchmarks.run --baseline bench-main.json
+    python -m benchmarks.run --workers 1,2,4 --runs 40
+
+The report is JSON with p50/p95/p99 latency and throughput per endpoint
+and concurrency level. With --baseline the p95 and throughput of each
+endpoint are compared with an earlier report.
+
+With --workers the API only queues runs (RUN_EXECUTION_BACKEND=worker)
+and, for each worker count, that many `python -m app.worker` processes
+share its database and execute a backlog of --runs runs with the fake
+`nextflow`. The report then has the runs per second of each worker count.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FAKE_BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
+
+GENES = ("TP53", "BRCA1", "EGFR", "MAP3K7", "KRAS", "MYC", "PTEN", "AKT1")
+
+PIPELINE_SCRIPT = """#!/usr/bin/env nextflow
+nextflow.enable.dsl = 2
+
+process BENCH {
+    container 'ubuntu:22.04'
+    output:
+    stdout
+    script:
+    \"\"\"
+    echo benchmark
+    \"\"\"
+}
+
+workflow {
+    BENCH()
+}
+"""
+
+# (name, weight) of each request in the mixed workload
+MIXED_WORKLOAD = (
+    ("alphafold_prediction", 30),
+    ("alphafold_search", 10),
+    ("chat_message", 15),
+    ("pipelines_list", 20),
+    ("runs_list", 15),
+    ("pipeline_execute", 2),
+    ("health", 8),
+)
+WORKLOADS = {
+    "mixed": MIXED_WORKLOAD,
+    "alphafold": (("alphafold_prediction", 1),),
+    "chat": (("chat_message", 1),),
+    "pipelines": (("pipelines_list", 1),),
+    "search": (("alphafold_search", 1), ("alphafold_autocomplete", 3)),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float], errors: Dict[str, int], elapsed: float) -> dict:
+    """Latency percentiles and throughput; `errors` counts failures by status or exception."""
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "requests": len(values) + sum(errors.values()),
+        "errors": sum(errors.values()),
+        "errors_by_kind": dict(sorted(errors.items())),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "max_ms": ms(values[-1]) if values else 0.0,
+    }
+
+
+class Environment:
+    """The fake upstream and the API under test, as subprocesses."""
+
+    def __init__(self, args):
+        self.args = args
+        self.tmpdir = tempfile.mkdtemp(prefix="ciencia-bench-")
+        self.upstream_port = free_port()
+        self.api_port = free_port()
+        self.api_url = f"http://127.0.0.1:{self.api_port}"
+        self._processes: List[subprocess.Popen] = []
+        self._workers: List[subprocess.Popen] = []
+
+    def _env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        upstream = f"http://127.0.0.1:{self.upstream_port}"
+        env.update({
+            "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+            "PATH": FAKE_BIN_DIR + os.pathsep + env.get("PATH", ""),
+            "FAKE_UPSTREAM_LATENCY_MS": str(self.args.upstream_latency_ms),
+            "ALPHAFOLD_DB_URL": f"{upstream}/api",
+            "UNIPROT_REST_URL": upstream,
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.tmpdir, 'bench.db')}",
+            "ALPHAFOLD_CACHE_DIR": os.path.join(self.tmpdir, "alphafold_cache"),
+            "LLM_CACHE_PATH": os.path.join(self.tmpdir, "llm_cache.db"),
+            "UNIPROT_INDEX_PATH": os.path.join(self.tmpdir, "uniprot_index.db"),
+            "GEMINI_API_KEY": "benchmark-fake-key",
+        })
+        # The upstream limiter would otherwise dominate the measurements
+        env.setdefault("UPSTREAM_RATE_PER_SECOND", "100000")
+        env.setdefault("UPSTREAM_RATE_BURST", "100000")
+        env.setdefault("FAKE_NF_TASK_SECONDS", "0.2")
+        # Every benchmark client shares one address, so per-client limits
+        # would throttle the whole load
+        env.setdefault("ADMISSION_CONTROL", "true" if self.args.admission else "false")
+        if self.args.workers:
+            env["RUN_EXECUTION_BACKEND"] = "worker"
+            # Workers are not woken by submits made in the API process
+            env.setdefault("RUNNER_POLL_INTERVAL_SECONDS", "0.2")
+        return env
+
+    def _spawn(self, cmd: List[str], name: str) -> subprocess.Popen:
+        log = open(os.path.join(self.tmpdir, f"{name}.log"), "w")
+        process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=self._env(), stdout=log, stderr=subprocess.STDOUT)
+        self._processes.append(process)
+        return process
+
+    def start_workers(self, count: int):
+        """Start `count` run workers on the API's database."""
+        for i in range(count):
+            worker_id = f"bench-worker-{len(self._workers) + 1}"
+            self._workers.append(self._spawn([
+                sys.executable, "-m", "app.worker",
+                "--max-runs", str(self.args.worker_runs), "--worker-id", worker_id,
+            ], worker_id))
+
+    def stop_workers(self):
+        _terminate(self._workers)
+        self._processes = [process for process in self._processes if process not in self._workers]
+        self._workers = []
+
+    async def start(self):
+        self._spawn([
+            sys.executable, "-m", "uvicorn", "benchmarks.fake_services:app",
+            "--host", "127.0.0.1", "--port", str(self.upstream_port), "--log-level", "warning",
+        ], "upstream")
+        async with httpx.AsyncClient() as client:
+            await self._wait_ready(client, f"http://127.0.0.1:{self.upstream_port}/docs")
+            if self.args.uniprot_index:
+                # Build the local index from the fake UniProt export, as
+                # `refresh` would from rest.uniprot.org
+                subprocess.run(
+                    [sys.executable, "-m", "app.services.uniprot_index", "refresh"],
+                    cwd=BACKEND_DIR, env=self._env(), check=True, stdout=subprocess.DEVNULL
+                )
+            self._spawn([
+                sys.executable, "-m", "benchmarks.serve", "--port", str(self.api_port),
+                "--gemini-latency-ms", str(self.args.gemini_latency_ms),
+            ], "api")
+            await self._wait_ready(client, f"{self.api_url}/health")
+
+    async def _wait_ready(self, client: httpx.AsyncClient, url: str, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for process in self._processes:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Benchmark server exited early, see logs in {self.tmpdir}")
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f"{url} not ready after {timeout:.0f}s, see logs in {self.tmpdir}")
+
+    def stop(self):
+        _terminate(self._processes)
+        if not self.args.keep_tmp:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def _terminate(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class Workload:
+    """Builds the requests of the workload; `rng` makes the mix reproducible."""
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, mix, id_pool: int):
+        self.client = client
+        self.rng = rng
+        self.names = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.uniprot_ids = [f"P{i:05d}" for i in range(id_pool)] + ["X00000"]
+        self.project_id: Optional[int] = None
+        self.pipeline_ids: List[int] = []
+
+    async def seed(self, pipelines: int = 20):
+        response = await self.client.post("/projects/", json={"name": "benchmark"})
+        response.raise_for_status()
+        self.project_id = response.json()["id"]
+        for i in range(pipelines):
+            response = await self.client.post("/projects/pipelines", json={
+                "project_id": self.project_id, "name": f"bench-{i}", "script": PIPELINE_SCRIPT,
+            })
+            response.raise_for_status()
+            self.pipeline_ids.append(response.json()["id"])
+
+    def next_request(self) -> Tuple[str, Callable]:
+        name = self.rng.choices(self.names, self.weights)[0]
+        return name, getattr(self, f"_{name}")()
+
+    def _alphafold_prediction(self):
+        uniprot_id = self.rng.choice(self.uniprot_ids)
+        return lambda: self.client.post("/alphafold/prediction", json={"uniprot_id": uniprot_id})
+
+    def _alphafold_search(self):
+        gene = self.rng.choice(GENES)
+        return lambda: self.client.post("/alphafold/search", json={"gene_name": gene})
+
+    def _alphafold_autocomplete(self):
+        gene = self.rng.choice(GENES)
+        prefix = gene[:self.rng.randint(1, len(gene))]
+        return lambda: self.client.get("/alphafold/autocomplete", params={"q": prefix})
+
+    def _chat_message(self):
+        message = f"What does {self.rng.choice(GENES)} do? #{self.rng.randrange(1000)}"
+        context = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}]
+        return lambda: self.client.post("/chat/message", json={"message": message, "context": context})
+
+    def _pipelines_list(self):
+        return lambda: self.client.get("/projects/pipelines", params={"project_id": self.project_id})
+
+    def _runs_list(self):
+        return lambda: self.client.get("/projects/runs", params={"limit": 50})
+
+    def _pipeline_execute(self):
+        pipeline_id = self.rng.choice(self.pipeline_ids)
+        return lambda: self.client.post(
+            f"/projects/pipelines/{pipeline_id}/execute", json={"pipeline_id": pipeline_id}
+        )
+
+    def _health(self):
+        return lambda: self.client.get("/health")
+
+
+async def run_level(workload: Workload, concurrency: int, duration: float, warmup: float) -> dict:
+    """Run `concurrency` closed-loop clients for `duration` seconds after a warm-up."""
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, Dict[str, int]] = {}
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def client_loop():
+        while True:
+            name, send = workload.next_request()
+            t0 = time.perf_counter()
+            if t0 >= stop_at:
+                return
+            error = None
+            try:
+                response = await send()
+                if response.status_code >= 400:
+                    error = str(response.status_code)
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            t1 = time.perf_counter()
+            if t0 < measure_from:
+                continue
+            if error is None:
+                latencies.setdefault(name, []).append(t1 - t0)
+            else:
+                by_kind = errors.setdefault(name, {})
+                by_kind[error] = by_kind.get(error, 0) + 1
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+
+    endpoints = {
+        name: summarize(latencies.get(name, []), errors.get(name, {}), elapsed)
+        for name in sorted(set(latencies) | set(errors))
+    }
+    all_errors: Dict[str, int] = {}
+    for by_kind in errors.values():
+        for kind, count in by_kind.items():
+            all_errors[kind] = all_errors.get(kind, 0) + count
+    total = summarize([value for values in latencies.values() for value in values], all_errors, elapsed)
+    return {"concurrency": concurrency, "duration_seconds": round(elapsed, 2), "total": total, "endpoints": endpoints}
+
+
+RUN_FINISHED_STATUSES = ("completed", "failed", "cancelled", "timed_out")
+
+
+async def run_worker_level(environment: Environment, client: httpx.AsyncClient, pipeline_ids: List[int],
+                           workers: int, timeout: float) -> dict:
+    """
+    Queue a run of each pipeline (runs of one pipeline never overlap),
+    start `workers` workers and time how long they take to execute them.
+    """
+    run_ids = []
+    for pipeline_id in pipeline_ids:
+        response = await client.post(f"/projects/pipelines/{pipeline_id}/execute", json={"pipeline_id": pipeline_id})
+        response.raise_for_status()
+        run_ids.append(response.json()["run_id"])
+
+    environment.start_workers(workers)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            response = await client.get("/projects/runs")
+            response.raise_for_status()
+            finished = [
+                run for run in response.json()
+                if run["id"] in set(run_ids) and run["status"] in RUN_FINISHED_STATUSES
+            ]
+            if len(finished) == len(run_ids) or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.2)
+    finally:
+        environment.stop_workers()
+
+    # From the first claim to the last completion, so worker start-up is not counted
+    started = [datetime.fromisoformat(run["started_at"]) for run in finished if run["started_at"]]
+    completed = [datetime.fromisoformat(run["completed_at"]) for run in finished if run["completed_at"]]
+    elapsed = (max(completed) - min(started)).total_seconds() if started and completed else 0.0
+    by_worker: Dict[str, int] = {}
+    for run in finished:
+        if run["status"] == "completed":
+            by_worker[run["worker_id"]] = by_worker.get(run["worker_id"], 0) + 1
+    done = sum(by_worker.values())
+    return {
+        "workers": workers,
+        "runs": len(run_ids),
+        "completed": done,
+        "failed": len(finished) - done,
+        "unfinished": len(run_ids) - len(finished),
+        "elapsed_seconds": round(elapsed, 2),
+        "runs_per_second": round(done / elapsed, 2) if elapsed else 0.0,
+        "completed_by_worker": dict(sorted(by_worker.items())),
+    }
+
+
+def compare(report: dict, baseline: dict) -> List[dict]:
+    """p95 and throughput change per endpoint and concurrency against a baseline report."""
+    previous = {level["concurrency"]: level for level in baseline.get("results", [])}
+    rows = []
+    for level in report["results"]:
+        before_level = previous.get(level["concurrency"])
+        if not before_level:
+            continue
+        for name, now in list(level["endpoints"].items()) + [("total", level["total"])]:
+            before = before_level["total"] if name == "total" else before_level["endpoints"].get(name)
+            if not before:
+                continue
+            rows.append({
+                "concurrency": level["concurrency"],
+                "endpoint": name,
+                "p95_ms": [before["p95_ms"], now["p95_ms"]],
+                "p95_change_pct": _change(before["p95_ms"], now["p95_ms"]),
+                "throughput_rps": [before["throughput_rps"], now["throughput_rps"]],
+                "throughput_change_pct": _change(before["throughput_rps"], now["throughput_rps"]),
+            })
+    return rows
+
+
+def _change(before: float, now: float) -> Optional[float]:
+    return round((now - before) / before * 100, 1) if before else None
+
+
+async def main_async(args) -> dict:
+    environment = Environment(args)
+    try:
+        await environment.start()
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=environment.api_url, limits=limits, timeout=120) as client:
+            workload = Workload(client, random.Random(args.seed), WORKLOADS[args.workload], args.id_pool)
+            results = []
+            worker_results = []
+            if args.workers:
+                # Fresh pipelines for every level, so no run resumes a cached session
+                await workload.seed(pipelines=args.runs * len(args.workers))
+                for i, workers in enumerate(args.workers):
+                    print(f"[BENCH] {workers} workers, {args.runs} runs", file=sys.stderr)
+                    pipeline_ids = workload.pipeline_ids[i * args.runs:(i + 1) * args.runs]
+                    worker_results.append(await run_worker_level(
+                        environment, client, pipeline_ids, workers, args.run_timeout
+                    ))
+                base = worker_results[0]["runs_per_second"] / worker_results[0]["workers"] if worker_results else 0
+                for level in worker_results:
+                    # 1.0 is perfectly linear scaling from the first worker count
+                    level["scaling_efficiency"] = (
+                        round(level["runs_per_second"] / (base * level["workers"]), 2) if base else None
+                    )
+            else:
+                await workload.seed()
+                for concurrency in args.concurrency:
+                    print(f"[BENCH] {args.workload} workload, concurrency {concurrency}, {args.duration:.0f}s", file=sys.stderr)
+                    results.append(await run_level(workload, concurrency, args.duration, args.warmup))
+    finally:
+        environment.stop()
+
+    return {
+        "metadata": {
+            "git_commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                "workload": args.workload,
+                "duration_seconds": args.duration,
+                "warmup_seconds": args.warmup,
+                "seed": args.seed,
+                "id_pool": args.id_pool,
+                "gemini_latency_ms": args.gemini_latency_ms,
+                "upstream_latency_ms": args.upstream_latency_ms,
+                "uniprot_index": args.uniprot_index,
+                "admission": args.admission,
+                "workers": args.workers,
+                "runs": args.runs,
+                "worker_runs": args.worker_runs,
+            },
+        },
+        "results": results,
+        "worker_scaling": worker_results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for the CiencIA API")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        type=lambda value: [int(v) for v in value.split(",")],
+                        help="Comma-separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds before each level")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--id-pool", type=int, default=200, help="Distinct UniProt IDs requested")
+    parser.add_argument("--gemini-latency-ms", type=float, default=500)
+    parser.add_argument("--upstream-latency-ms", type=float, default=50)
+    parser.add_argument("--uniprot-index", action="store_true",
+                        help="Serve gene search from a local UniProt index built from the fake export")
+    parser.add_argument("--admission", action="store_true",
+                        help="Keep admission control on (429s then count as errors)")
+    parser.add_argument("--workers", default=None,
+                        type=lambda value: [int(v) for v in value.split(",")],
+                        help="Comma-separated numbers of run workers; measures run throughput instead of requests")
+    parser.add_argument("--runs", type=int, default=40, help="Runs queued for each worker count")
+    parser.add_argument("--worker-runs", type=int, default=2, help="Concurrent runs per worker (--max-runs)")
+    parser.add_argument("--run-timeout", type=float, default=300, help="Longest wait for a worker count's runs")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--keep-tmp", action="store_true", help="Keep the temporary database, caches and logs")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
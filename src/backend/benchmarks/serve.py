@@ -0,0 +1,37 @@
+"""
+Serve the API with the Gemini model replaced by `FakeGenerativeModel`.
+
+Usage:
+    python -m benchmarks.serve --port 8001 --gemini-latency-ms 500
+
+Every other dependency is configured through the usual environment
+variables (DATABASE_URL, ALPHAFOLD_DB_URL, UNIPROT_REST_URL, PATH for
+`nextflow`, ...), which `benchmarks.run` sets up.
+"""
+import argparse
+import os
+import uvicorn
+from .fake_services import FakeGenerativeModel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with a fake Gemini model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--gemini-latency-ms", type=float, default=500)
+    parser.add_argument("--gemini-chunk-delay-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark-fake-key")
+    from app.services import llm_service
+    llm_service.model = FakeGenerativeModel(
+        latency_seconds=args.gemini_latency_ms / 1000,
+        chunk_delay_seconds=args.gemini_chunk_delay_ms / 1000,
+    )
+
+    import main as api
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Cold-start benchmark for the API.
+
+For each router set, measures in fresh processes:
+- the time to `import main` and the resident memory right after it;
+- the time from launching `uvicorn main:app --workers N` until /health
+  first answers, and the resident memory of every uvicorn worker process.
+
+Usage (from src/backend):
+    python -m benchmarks.startup --repeat 5 --workers 1,2 --output startup.json
+    python -m benchmarks.startup --router-sets "pipelines,chat,alphafold,projects;projects,alphafold"
+
+Memory is read from /proc, so worker RSS is only reported on Linux.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+from .run import BACKEND_DIR, FAKE_BIN_DIR, free_port, git_commit
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+rss_kb = None
+try:
+    with open("/proc/self/status") as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+except OSError:
+    pass
+print(json.dumps({
+    "import_seconds": elapsed,
+    "rss_mb": rss_kb / 1024 if rss_kb else None,
+    "gemini_sdk_loaded": "google.generativeai" in sys.modules,
+}))
+"""
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        return ""
+
+
+def _children(pid: int) -> List[int]:
+    """Direct children of a process (Linux)."""
+    children = []
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return children
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # The command name can contain spaces; fields resume after ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(name))
+    return children
+
+
+def _summary(values: List[float]) -> Optional[dict]:
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+class StartupBenchmark:
+    def __init__(self, args):
+        self.args = args
+        self.tmpdir = tempfile.mkdtemp(prefix="ciencia-startup-")
+
+    def _env(self, routers: str) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+            "PATH": FAKE_BIN_DIR + os.pathsep + env.get("PATH", ""),
+            "API_ROUTERS": routers,
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.tmpdir, 'startup.db')}",
+            "ALPHAFOLD_CACHE_DIR": os.path.join(self.tmpdir, "alphafold_cache"),
+            "LLM_CACHE_PATH": os.path.join(self.tmpdir, "llm_cache.db"),
+        })
+        return env
+
+    def measure_import(self, routers: str) -> dict:
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=self._env(routers),
+            capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def measure_server(self, routers: str, workers: int) -> dict:
+        port = free_port()
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self._env(routers), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            ready = None
+            deadline = start + self.args.timeout
+            with httpx.Client() as client:
+                while time.perf_counter() < deadline and process.poll() is None:
+                    try:
+                        client.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                        ready = time.perf_counter() - start
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.01)
+            if ready is None:
+                raise RuntimeError(f"uvicorn did not answer /health within {self.args.timeout:.0f}s")
+            if workers > 1:
+                # /health answers as soon as the first worker is up; wait for
+                # the others (skipping multiprocessing's resource tracker)
+                while True:
+                    worker_pids = [pid for pid in _children(process.pid) if "spawn_main" in _cmdline(pid)]
+                    if len(worker_pids) >= workers or time.perf_counter() > deadline:
+                        break
+                    time.sleep(0.05)
+                time.sleep(self.args.settle)
+            else:
+                # With one worker uvicorn serves from the launched process itself
+                worker_pids = [process.pid]
+            return {
+                "ready_seconds": ready,
+                "worker_rss_mb": [_rss_mb(pid) for pid in worker_pids],
+                "supervisor_rss_mb": _rss_mb(process.pid) if workers > 1 else None,
+            }
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def run(self) -> List[dict]:
+        results = []
+        try:
+            for routers in self.args.router_sets:
+                imports = [self.measure_import(routers) for _ in range(self.args.repeat)]
+                print(f"[STARTUP] {routers}: import {statistics.median(i['import_seconds'] for i in imports):.3f}s", file=sys.stderr)
+                servers = []
+                for workers in self.args.workers:
+                    samples = [self.measure_server(routers, workers) for _ in range(self.args.repeat)]
+                    worker_rss = [rss for sample in samples for rss in sample["worker_rss_mb"]]
+                    servers.append({
+                        "workers": workers,
+                        "ready_seconds": _summary([sample["ready_seconds"] for sample in samples]),
+                        "worker_rss_mb": _summary(worker_rss),
+                        "supervisor_rss_mb": _summary([sample["supervisor_rss_mb"] for sample in samples]),
+                    })
+                    print(f"[STARTUP] {routers}: {workers} worker(s) ready in {servers[-1]['ready_seconds']['median']:.3f}s", file=sys.stderr)
+                results.append({
+                    "routers": routers,
+                    "import_seconds": _summary([i["import_seconds"] for i in imports]),
+                    "import_rss_mb": _summary([i["rss_mb"] for i in imports]),
+                    "gemini_sdk_loaded_at_import": any(i["gemini_sdk_loaded"] for i in imports),
+                    "servers": servers,
+                })
+        finally:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+        return results
+
+
+def compare(results: List[dict], baseline: dict) -> List[dict]:
+    """Median import time, ready time and worker RSS against a baseline report."""
+    previous = {entry["routers"]: entry for entry in baseline.get("results", [])}
+    rows = []
+    for entry in results:
+        before = previous.get(entry["routers"])
+        if not before:
+            continue
+        before_servers = {server["workers"]: server for server in before["servers"]}
+        rows.append({
+            "routers": entry["routers"],
+            "import_seconds": [before["import_seconds"]["median"], entry["import_seconds"]["median"]],
+        })
+        for server in entry["servers"]:
+            old = before_servers.get(server["workers"])
+            if old:
+                rows.append({
+                    "routers": entry["routers"],
+                    "workers": server["workers"],
+                    "ready_seconds": [old["ready_seconds"]["median"], server["ready_seconds"]["median"]],
+                    "worker_rss_mb": [
+                        (old["worker_rss_mb"] or {}).get("median"), (server["worker_rss_mb"] or {}).get("median")
+                    ],
+                })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time and memory of the CiencIA API")
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per measurement")
+    parser.add_argument("--workers", default="1",
+                        type=lambda value: [int(v) for v in value.split(",")],
+                        help="Comma-separated uvicorn worker counts")
+    parser.add_argument("--router-sets", default="pipelines,chat,alphafold,projects;projects,alphafold",
+                        type=lambda value: [v.strip() for v in value.split(";") if v.strip()],
+                        help="Semicolon-separated API_ROUTERS values")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for /health")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="Extra seconds for the other workers when --workers > 1")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "metadata": {
+            "git_commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {"repeat": args.repeat, "workers": args.workers},
+        },
+        "results": StartupBenchmark(args).run(),
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report["results"], json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
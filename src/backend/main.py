@@ -1,12 +1,61 @@
-from fastapi import FastAPI
+import importlib
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from app.services.admission import AdmissionControlMiddleware
+from app.services.compression import CompressionMiddleware
+from app.services.metrics import MetricsMiddleware, registry
+
+# orjson serializes the response models several times faster than the
+# standard library; fall back to it when orjson is not installed
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultJSONResponse
+
+from app.database import create_db_and_tables, dispose_engines
+from app.services.scheduler import scheduler, EXECUTION_BACKEND
+from app.services.workspace import workspace_janitor
+from app.services.http_client import close_http_client
+from app.services.health import check_health
+from app.services.runner import prepare_directories
+
+# Routers served by this process, e.g. "projects,alphafold" for workers
+# that never serve chat and so never import the Gemini SDK
+ROUTERS = ("pipelines", "chat", "alphafold", "projects", "datasets")
+API_ROUTERS = [name.strip() for name in os.getenv("API_ROUTERS", ",".join(ROUTERS)).split(",") if name.strip()]
+for name in API_ROUTERS:
+    if name not in ROUTERS:
+        raise ValueError(f"API_ROUTERS: unknown router '{name}' (available: {', '.join(ROUTERS)})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prepare_directories()
+    create_db_and_tables()
+    # With the "worker" backend, runs are executed by `python -m app.worker`
+    if EXECUTION_BACKEND == "local":
+        await scheduler.start()
+    workspace_janitor.start()
+    yield
+    await workspace_janitor.stop()
+    await scheduler.stop()
+    await close_http_client()
+    await dispose_engines()
 
 app = FastAPI(
     title="CiencIA API",
     description="Backend for the CiencIA Bio-SaaS Platform",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan
 )
 
+# Per-route rate limits and concurrency pools (see services/admission.py).
+# Added first so it runs inside CORS and 429 responses keep CORS headers
+app.add_middleware(AdmissionControlMiddleware)
+
 # CORS Configuration
 origins = [
     "http://localhost:3000",  # Next.js Frontend
@@ -19,25 +68,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
-# Initialize database
-from app.database import create_db_and_tables
+# gzip/brotli for bodies above RESPONSE_COMPRESSION_MIN_BYTES
+app.add_middleware(CompressionMiddleware)
 
-@app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+# Per-route latency, status counts and in-flight requests (see /metrics)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to CiencIA API - The Engine of Biological Discovery"}
 
 @app.get("/health")
-async def health_check():
-    return {"status": "ok", "components": {"database": "sqlite", "nextflow_engine": "ready"}}
-
-from app.routers import pipelines, chat, alphafold, projects
-app.include_router(pipelines.router)
-app.include_router(chat.router)
-app.include_router(alphafold.router)
-app.include_router(projects.router)
+def health_check(response: Response):
+    """Readiness of the database, the nextflow binary and the run queue."""
+    health = check_health()
+    if health["status"] == "error":
+        response.status_code = 503
+    return health
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of the API's metrics."""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+for name in API_ROUTERS:
+    app.include_router(importlib.import_module(f"app.routers.{name}").router)
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Point the app at throwaway storage before any app module is imported
+_TMPDIR = tempfile.mkdtemp(prefix="ciencia-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TMPDIR, 'test.db')}")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(_TMPDIR, "llm_cache.db"))
+os.environ.setdefault("ALPHAFOLD_CACHE_DIR", os.path.join(_TMPDIR, "alphafold_cache"))
+os.environ.setdefault("DATASETS_DIR", os.path.join(_TMPDIR, "datasets"))
+# All test requests come from one client address
+os.environ.setdefault("ADMISSION_CONTROL", "false")
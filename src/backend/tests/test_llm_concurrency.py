@@ -0,0 +1,71 @@
+import asyncio
+import time
+import httpx
+import pytest
+import main
+from app.database import create_db_and_tables
+from app.services import llm_service
+from benchmarks.fake_services import FakeGenerativeModel
+
+# More slow calls than LLM_MAX_CONCURRENCY, so some of them queue
+SLOW_CALLS = 2 * llm_service.LLM_MAX_CONCURRENCY
+LLM_LATENCY_SECONDS = 1.0
+HEALTH_MAX_SECONDS = 0.5
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeGenerativeModel(latency_seconds=LLM_LATENCY_SECONDS)
+    monkeypatch.setattr(llm_service, "model", model)
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    # The module-level semaphore binds to the first event loop that waits on it
+    monkeypatch.setattr(llm_service, "_llm_semaphore", asyncio.Semaphore(llm_service.LLM_MAX_CONCURRENCY))
+    create_db_and_tables()
+    return model
+
+
+def test_health_responsive_while_llm_calls_in_flight(fake_model):
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            calls = [
+                asyncio.create_task(client.post("/chat/message", json={"message": f"question {i}"}))
+                for i in range(SLOW_CALLS)
+            ]
+            # Let the calls reach the model (or queue for a slot)
+            while fake_model.calls < llm_service.LLM_MAX_CONCURRENCY:
+                await asyncio.sleep(0.01)
+
+            start = time.perf_counter()
+            health = await client.get("/health")
+            elapsed = time.perf_counter() - start
+            in_flight = sum(not call.done() for call in calls)
+
+            replies = await asyncio.gather(*calls)
+        return health, elapsed, in_flight, replies
+
+    health, elapsed, in_flight, replies = asyncio.run(scenario())
+
+    assert health.status_code in (200, 503)  # 503 only reports missing components
+    assert elapsed < HEALTH_MAX_SECONDS
+    assert in_flight == SLOW_CALLS
+    assert all(reply.status_code == 200 for reply in replies)
+    assert all(reply.json()["response"].startswith("Fake answer") for reply in replies)
+
+
+def test_llm_timeout_includes_wait_for_slot(fake_model, monkeypatch):
+    # The first batch takes 0.2s; the queued batch would finish at 0.4s,
+    # past the 0.3s budget that started when it was queued
+    fake_model.latency_seconds = 0.2
+    monkeypatch.setattr(llm_service, "LLM_TIMEOUT_SECONDS", 0.3)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(llm_service._send_chat_message(f"question {i}", []) for i in range(SLOW_CALLS)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+
+    timed_out = [result for result in results if isinstance(result, asyncio.TimeoutError)]
+    assert len(timed_out) == SLOW_CALLS - llm_service.LLM_MAX_CONCURRENCY
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+import pytest
+from app.services.supervisor import ProcessSupervisor
+
+FAKE_NEXTFLOW = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "bin", "nextflow")
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads process groups from /proc")
+
+
+def _group_members(pgid: int) -> list:
+    """Live (non-zombie) processes of a process group."""
+    members = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # The command name may contain spaces; fields resume after ")"
+                state, _, pgrp = f.read().rsplit(")", 1)[1].split()[:3]
+        except OSError:
+            continue
+        if int(pgrp) == pgid and state != "Z":
+            members.append(int(pid))
+    return members
+
+
+async def _spawn_task(supervisor: ProcessSupervisor, run_id: int, cwd, timeout_seconds=None):
+    """Start the fake Nextflow and wait until its first task (a `sleep`) runs."""
+    process = await supervisor.spawn(
+        run_id, [FAKE_NEXTFLOW, "run", "main.nf"], str(cwd), timeout_seconds=timeout_seconds
+    )
+    while len(_group_members(process.pid)) < 2:
+        await asyncio.sleep(0.01)
+    return process
+
+
+@pytest.fixture
+def long_tasks(monkeypatch):
+    monkeypatch.setenv("FAKE_NF_TASK_SECONDS", "30")
+
+
+def test_exit_code_is_recorded(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_NF_TASK_SECONDS", "0")
+    monkeypatch.setenv("FAKE_NF_EXIT", "3")
+
+    async def scenario():
+        supervisor = ProcessSupervisor()
+        await supervisor.spawn(1, [FAKE_NEXTFLOW, "run", "main.nf"], str(tmp_path))
+        return await supervisor.wait(1)
+
+    assert asyncio.run(scenario()) == (3, None)
+
+
+def test_cancel_kills_the_process_group(tmp_path, long_tasks):
+    async def scenario():
+        supervisor = ProcessSupervisor(kill_grace_seconds=5)
+        process = await _spawn_task(supervisor, 1, tmp_path)
+        assert await supervisor.cancel(1)
+        return process.pid, await supervisor.wait(1)
+
+    pgid, (exit_code, reason) = asyncio.run(scenario())
+    assert reason == "cancelled"
+    assert exit_code == -15
+    assert _group_members(pgid) == []
+
+
+def test_sigkill_after_grace_period(tmp_path, long_tasks, monkeypatch):
+    monkeypatch.setenv("FAKE_NF_IGNORE_TERM", "1")
+
+    async def scenario():
+        supervisor = ProcessSupervisor(kill_grace_seconds=0.5)
+        process = await _spawn_task(supervisor, 1, tmp_path)
+        supervisor.cancel_soon(1)
+        return process.pid, await supervisor.wait(1)
+
+    pgid, (exit_code, reason) = asyncio.run(scenario())
+    assert reason == "cancelled"
+    assert exit_code == -9
+    assert _group_members(pgid) == []
+
+
+def test_timeout_kills_the_process_group(tmp_path, long_tasks):
+    async def scenario():
+        supervisor = ProcessSupervisor(kill_grace_seconds=5)
+        process = await _spawn_task(supervisor, 1, tmp_path, timeout_seconds=0.5)
+        return process.pid, await supervisor.wait(1)
+
+    pgid, (exit_code, reason) = asyncio.run(scenario())
+    assert reason == "timeout"
+    assert exit_code == -15
+    assert _group_members(pgid) == []
+
+
+def test_shutdown_kills_every_run(tmp_path, long_tasks):
+    async def scenario():
+        supervisor = ProcessSupervisor(kill_grace_seconds=5)
+        processes = [await _spawn_task(supervisor, run_id, tmp_path) for run_id in (1, 2)]
+        waits = [asyncio.create_task(supervisor.wait(run_id)) for run_id in (1, 2)]
+        await supervisor.shutdown()
+        return [process.pid for process in processes], await asyncio.gather(*waits)
+
+    pgids, results = asyncio.run(scenario())
+    assert [reason for _, reason in results] == ["shutdown", "shutdown"]
+    assert all(exit_code is not None for exit_code, _ in results)
+    assert all(_group_members(pgid) == [] for pgid in pgids)